@@ -0,0 +1,63 @@
+import asyncio
+import threading
+from concurrent.futures import as_completed
+
+# 非同期クライアント（Cosmos DB / Graph）は全てこのループ上で動かす。
+# 接続プールがループに結び付くため、ループはプロセスで1つだけ作る。
+_loop = None
+_loop_lock = threading.Lock()
+
+
+def get_loop():
+    """バックグラウンドのスレッドで動く共有イベントループを返す（初回に起動）"""
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            loop = asyncio.new_event_loop()
+            threading.Thread(
+                target=loop.run_forever, name="azure-aio-loop", daemon=True
+            ).start()
+            _loop = loop
+        return _loop
+
+
+def submit(coro):
+    """コルーチンを共有ループに投入し、concurrent.futures.Future を返す"""
+    loop = get_loop()
+    try:
+        running = asyncio.get_running_loop()
+    except RuntimeError:
+        running = None
+    if running is loop:
+        coro.close()
+        raise RuntimeError("共有ループの中からは await で呼び出してください")
+    return asyncio.run_coroutine_threadsafe(coro, loop)
+
+
+def run(coro, timeout=None):
+    """同期コードからコルーチンを1つ実行し、結果を返す"""
+    return submit(coro).result(timeout)
+
+
+def run_all(*coros, return_exceptions=False, timeout=None):
+    """
+    複数のコルーチンを共有ループ上で同時に実行し、渡した順番で結果を返す。
+    例: data, uploads = run_all(load(), upload_many(files))
+    return_exceptions=True の場合、失敗したものは例外オブジェクトを結果に入れる。
+    """
+
+    async def gather():
+        return await asyncio.gather(*coros, return_exceptions=return_exceptions)
+
+    return run(gather(), timeout)
+
+
+def run_each(coros):
+    """
+    複数のコルーチンを同時に実行し、終わったものから (元の順番, 結果, 例外) を返すジェネレーター。
+    進捗表示など、呼び出し元のスレッドで1件ずつ処理したい場合に使う。
+    """
+    futures = {submit(coro): idx for idx, coro in enumerate(coros)}
+    for future in as_completed(futures):
+        error = future.exception()
+        yield futures[future], None if error else future.result(), error
@@ -1,51 +1,393 @@
 # pip install azure-cosmos
 # pip install python-dotenv
 from azure.cosmos import CosmosClient
+from azure.cosmos.exceptions import (
+    CosmosAccessConditionFailedError,
+    CosmosBatchOperationError,
+    CosmosResourceExistsError,
+    CosmosResourceNotFoundError,
+)
+from azure.core import MatchConditions
+from azure.core.pipeline.transport import RequestsTransport
 from dotenv import load_dotenv
+from requests.adapters import HTTPAdapter
 import os
+import threading
 import uuid
+import requests
+from azure_.aio_loop import run, submit
+from metrics import measure
+from storage.base import (
+    QUERY_MAX_WORKERS,
+    StorageBackend,
+    check_field,
+    notify_write as _notify_write,
+)
 
 # .envファイルの読み込み
 load_dotenv()
 
+# 共有クライアントの接続設定
+POOL_SIZE = int(os.getenv("COSMOSDB_POOL_SIZE", "20"))
+CONNECTION_TIMEOUT = int(os.getenv("COSMOSDB_CONNECTION_TIMEOUT", "10"))
+READ_TIMEOUT = int(os.getenv("COSMOSDB_READ_TIMEOUT", "30"))
+# 例: "Japan East,Japan West"
+PREFERRED_REGIONS = [
+    r.strip() for r in os.getenv("COSMOSDB_PREFERRED_REGIONS", "").split(",") if r.strip()
+]
+
+# トランザクションバッチ1回あたりの操作数の上限（Cosmos DB の制限は100）
+BATCH_MAX_OPERATIONS = 100
+
+# プロセス内で共有する CosmosClient（endpoint ごとに1つ）
+_shared_clients = {}
+_shared_clients_lock = threading.Lock()
+
+
+def get_shared_cosmos_client(endpoint, key):
+    """
+    接続プール・keep-alive・タイムアウトを設定した CosmosClient をプロセスで1つだけ作ります。
+    TLS ハンドシェイクやアカウント情報の取得は最初の1回だけになります。
+    """
+    with _shared_clients_lock:
+        if endpoint not in _shared_clients:
+            session = requests.Session()  # keep-alive はセッション既定で有効
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=POOL_SIZE)
+            session.mount("https://", adapter)
+            transport = RequestsTransport(
+                session=session,
+                session_owner=False,
+                connection_timeout=CONNECTION_TIMEOUT,
+                read_timeout=READ_TIMEOUT,
+            )
+            options = {"transport": transport, "connection_timeout": READ_TIMEOUT}
+            if PREFERRED_REGIONS:
+                options["preferred_locations"] = PREFERRED_REGIONS
+            _shared_clients[endpoint] = CosmosClient(endpoint, key, **options)
+        return _shared_clients[endpoint]
+
+
+def shared_session(endpoint):
+    """共有 CosmosClient のセッション（セッション整合性のトークン）。まだ無ければ None"""
+    with _shared_clients_lock:
+        client = _shared_clients.get(endpoint)
+    return getattr(client.client_connection, "Session", None) if client else None
+
+
+_warm_up_started = threading.Event()
+
+
+def warm_up_cosmos(database_name="sat-db", container_name="main_container"):
+    """
+    サーバー起動時に共有クライアント（同期版と非同期版）を作り、
+    コンテナのメタデータを取得しておきます。
+    バックグラウンドで実行し、2回目以降の呼び出しは何もしません。
+    """
+    if _warm_up_started.is_set():
+        return
+    _warm_up_started.set()
+
+    def _warm():
+        try:
+            client = CosmosDBClient(
+                database_name=database_name, container_name=container_name
+            )
+            client.container.read()
+            # データセットの読み込みに使う非同期版も開いておく
+            # （同期版のセッションを引き継ぐので、同期版の後に開く）
+            submit(client.aio.get_container()).result()
+        except Exception as e:
+            print(f"CosmosDB ウォームアップ失敗: {e}")
+
+    threading.Thread(target=_warm, name="cosmos-warm-up", daemon=True).start()
+
+
+def build_query(
+    fy: str = None,
+    filters: dict = None,
+    defined: tuple = (),
+    undefined: tuple = (),
+    since_ts: int = None,
+    fields: tuple = None,
+    order_by: str = None,
+    descending: bool = False,
+):
+    """query の条件から Cosmos DB の SQL とパラメータを組み立てます"""
+    if fields is None:
+        query = "SELECT * FROM c"
+    else:
+        columns = ", ".join(f"c.{check_field(f)}" for f in fields)
+        query = f"SELECT {columns} FROM c"
+    conditions = []
+    parameters = []
+    if fy is not None:
+        conditions.append("c.fy = @fy")
+        parameters.append({"name": "@fy", "value": fy})
+    for i, (field, value) in enumerate((filters or {}).items()):
+        name = f"@p{i}"
+        if isinstance(value, (list, tuple, set)):
+            conditions.append(f"ARRAY_CONTAINS({name}, c.{check_field(field)})")
+            value = list(value)
+        else:
+            conditions.append(f"c.{check_field(field)} = {name}")
+        parameters.append({"name": name, "value": value})
+    for field in defined:
+        conditions.append(f"IS_DEFINED(c.{check_field(field)})")
+    for field in undefined:
+        conditions.append(f"NOT IS_DEFINED(c.{check_field(field)})")
+    if since_ts:
+        conditions.append("c._ts >= @ts")
+        parameters.append({"name": "@ts", "value": since_ts})
+    if conditions:
+        query += " WHERE " + " AND ".join(conditions)
+    if order_by:
+        direction = "DESC" if descending else "ASC"
+        query += f" ORDER BY c.{check_field(order_by)} {direction}"
+    return query, parameters
+
+
+def _response_hook(m):
+    """
+    Cosmos DB の HTTP 応答ごとに RU・リトライ回数（429 の応答数）・応答サイズを計測値に足す。
+    raw_response_hook として呼び出しごとに渡す。response_hook は共有クライアントの
+    直前の応答ヘッダー（last_response_headers）で呼ばれ、同時に使われると
+    他の呼び出しの値が混ざるため使わない。
+    """
+
+    def hook(pipeline_response):
+        response = pipeline_response.http_response
+        headers = response.headers
+        m.request_charge += float(headers.get("x-ms-request-charge") or 0)
+        if response.status_code == 429:
+            m.retries += 1
+        m.payload_bytes += int(headers.get("Content-Length") or 0)
+
+    return hook
+
+
+class CosmosDBClient(StorageBackend):
+    """
+    共有 CosmosClient に対する軽量なハンドル。
+    セッションごとに作っても接続は共有されます。
+    """
 
-class CosmosDBClient:
     def __init__(
         self,
         endpoint=None,
         key=None,
         database_name="sat-db",
         container_name="main_container",
+        shared=True,
     ):
         self.endpoint = endpoint or os.getenv("COSMOSDB_ENDPOINT")
         self.key = key or os.getenv("COSMOSDB_KEY")
         self.database_name = database_name
         self.container_name = container_name
-        self.client = CosmosClient(self.endpoint, self.key)
+        if shared:
+            self.client = get_shared_cosmos_client(self.endpoint, self.key)
+        else:
+            # 応答ヘッダーを他のスレッドと共有したくない用途（変更フィードなど）向け
+            self.client = CosmosClient(self.endpoint, self.key)
         self.database = self.client.get_database_client(self.database_name)
         self.container = self.database.get_container_client(self.container_name)
+        # クエリと一括登録は非同期版（共有イベントループ上の aiohttp）で実行する
+        from azure_.cosmosdb_aio import AsyncCosmosDBClient
+
+        self.aio = AsyncCosmosDBClient(
+            self.endpoint, self.key, self.database_name, self.container_name
+        )
+
+    @property
+    def source(self):
+        return f"cosmos:{self.endpoint}/{self.database_name}/{self.container_name}"
 
     def upsert_to_container(self, data):
         # データがリストの場合は複数レコードを登録
         if isinstance(data, list):
-            for record in data:
-                self.container.upsert_item(body=record)
+            with measure("cosmos", "upsert_item", detail="list") as m:
+                hook = _response_hook(m)
+                for record in data:
+                    self.container.upsert_item(body=record, raw_response_hook=hook)
+                m.items = len(data)
+            _notify_write(data)
             return f"{len(data)} 件のデータを登録しました"
 
         # 単一レコードの場合
         if "id" not in data:
             data["id"] = str(uuid.uuid4())
-        return self.container.upsert_item(body=data)
+        with measure("cosmos", "upsert_item", detail=data.get("category")) as m:
+            result = self.container.upsert_item(body=data, raw_response_hook=_response_hook(m))
+            m.items = 1
+        _notify_write([data])
+        return result
 
-    def search_container_by_query(self, query: str, parameters: list):
-        results = self.container.query_items(
-            query=query, parameters=parameters, enable_cross_partition_query=True
-        )
-        return list(results)
+    def read_item(self, item_id: str, partition_key: str):
+        """id とパーティションキーで1件読み込みます（存在しない場合は None）"""
+        with measure("cosmos", "read_item", detail=partition_key) as m:
+            try:
+                item = self.container.read_item(
+                    item=item_id,
+                    partition_key=partition_key,
+                    raw_response_hook=_response_hook(m),
+                )
+            except CosmosResourceNotFoundError:
+                m.items = 0
+                return None
+            m.items = 1
+            return item
+
+    def create_item(self, body: dict):
+        """新規作成します（同じ id が既にある場合は None）"""
+        with measure("cosmos", "create_item", detail=body.get("category")) as m:
+            try:
+                result = self.container.create_item(
+                    body=body, raw_response_hook=_response_hook(m)
+                )
+            except CosmosResourceExistsError:
+                m.items = 0
+                return None
+            m.items = 1
+        _notify_write([body])
+        return result
+
+    def replace_item_if_match(self, body: dict, etag: str):
+        """
+        読み込み時の _etag が変わっていない場合だけ置き換えます（楽観的同時実行制御）。
+        他の書き込みと競合した場合は None を返します。
+        """
+        with measure("cosmos", "replace_item", detail=body.get("category")) as m:
+            try:
+                result = self.container.replace_item(
+                    item=body["id"],
+                    body=body,
+                    etag=etag,
+                    match_condition=MatchConditions.IfNotModified,
+                    raw_response_hook=_response_hook(m),
+                )
+            except CosmosAccessConditionFailedError:
+                m.items = 0
+                return None
+            m.items = 1
+        _notify_write([body])
+        return result
+
+    def write_batch_if_match(self, items: list, partition_key: str):
+        """
+        同じパーティションの複数ドキュメントを1つのトランザクションで書き込みます。
+        items: [(body, etag)]  etag が None の場合は新規作成、それ以外は _etag 一致時のみ置き換え
+        戻り値: 操作ごとの結果（eTag を含む）。他の書き込みと競合した場合（412 / 409）は
+        何も書き込まず None を返します。
+        """
+        operations = []
+        for body, etag in items:
+            if etag is None:
+                operations.append(("create", (body,)))
+            else:
+                operations.append(("replace", (body["id"], body), {"if_match_etag": etag}))
+        with measure("cosmos", "execute_item_batch", detail=partition_key) as m:
+            m.items = len(operations)
+            try:
+                responses = self.container.execute_item_batch(
+                    batch_operations=operations,
+                    partition_key=partition_key,
+                    raw_response_hook=_response_hook(m),
+                )
+            except CosmosBatchOperationError as e:
+                statuses = {r.get("statusCode") for r in e.operation_responses or []}
+                if statuses & {409, 412}:
+                    return None
+                raise
+        _notify_write([body for body, _ in items])
+        return list(responses)
+
+    def bulk_upsert(
+        self,
+        records: list,
+        partition_key_field: str = "category",
+        max_workers: int = QUERY_MAX_WORKERS,
+    ):
+        """
+        複数レコードをパーティションキーごとにまとめ、トランザクションバッチで登録します。
+        バッチは共有イベントループ上で max_workers 個ずつ同時に送ります。
+        戻り値: {"items": [{id, category, ok, status_code, request_charge, error}],
+                 "succeeded": 件数, "failed": 件数, "request_charge": 合計RU}
+        """
+        return run(self.aio.bulk_upsert(records, partition_key_field, max_workers))
+
+    def search_container_by_query(
+        self, query: str, parameters: list, partition_key: str = None
+    ):
+        return run(self.aio.search_container_by_query(query, parameters, partition_key))
+
+    def build_query(self, **conditions):
+        return build_query(**conditions)
+
+    def query(self, category: str, **conditions):
+        # category（パーティションキー）を指定した単一パーティションクエリ
+        query, parameters = self.build_query(**conditions)
+        return self.search_container_by_query(query, parameters, partition_key=category)
+
+    def query_partitions(self, plans: dict, max_workers: int = QUERY_MAX_WORKERS):
+        """
+        category（パーティションキー）ごとのクエリを共有イベントループ上で
+        max_workers 個ずつ同時に実行します。
+        戻り値: ({category: [items]}, {category: 所要秒数})
+        """
+        return run(self.aio.query_partitions(plans, max_workers))
+
+    def query_page(
+        self,
+        category: str,
+        page_size: int = 100,
+        continuation: str = None,
+        **conditions,
+    ):
+        """
+        単一パーティションのクエリを1ページ分だけ取得します。
+        戻り値: (items, 次ページの継続トークン or None)
+        """
+        query, parameters = self.build_query(**conditions)
+        with measure("cosmos", "query_page", detail=query) as m:
+            pager = self.container.query_items(
+                query=query,
+                parameters=parameters,
+                partition_key=category,
+                max_item_count=page_size,
+                raw_response_hook=_response_hook(m),
+            ).by_page(continuation)
+            page = next(pager, None)
+            items = list(page) if page is not None else []
+            m.items = len(items)
+        return items, pager.continuation_token
+
+    def read_change_feed(self, continuation: str = None, start_time=None):
+        """
+        変更フィードから前回以降に変更されたドキュメントを読み込みます。
+        continuation が無い場合は start_time（datetime / "Now" / "Beginning"）から読みます。
+        戻り値: (items, 次回の継続トークン)
+        """
+        if continuation:
+            options = {"continuation": continuation}
+        else:
+            options = {"start_time": start_time or "Now"}
+        with measure("cosmos", "change_feed") as m:
+            pager = self.container.query_items_change_feed(
+                raw_response_hook=_response_hook(m), **options
+            ).by_page()
+            items = []
+            for page in pager:
+                items.extend(page)
+            m.items = len(items)
+        return items, pager.continuation_token or continuation
 
     def delete_item_from_container(self, item_id: str, category: str):
         """
         指定したidとcategory（パーティションキー）のレコードを削除します。
         """
-        self.container.delete_item(item=item_id, partition_key=category)
+        with measure("cosmos", "delete_item", detail=category) as m:
+            self.container.delete_item(
+                item=item_id, partition_key=category, raw_response_hook=_response_hook(m)
+            )
+            m.items = 1
+        _notify_write([{"id": item_id, "category": category}], deleted=True)
         return f"id={item_id}, category={category} のレコードを削除しました"
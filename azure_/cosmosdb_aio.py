@@ -0,0 +1,249 @@
+# pip install azure-cosmos aiohttp
+# azure.cosmos.aio を使った非同期版のクライアント。
+# 共有イベントループ（azure_.aio_loop）の上だけで使う。
+# 同期コードからは CosmosDBClient（query / query_partitions / bulk_upsert は
+# このクライアントへの薄いラッパー）か aio_loop.run_all で呼び出す。
+import asyncio
+import os
+import uuid
+
+import aiohttp
+from azure.core.pipeline.transport import AioHttpTransport
+from azure.cosmos.aio import CosmosClient
+from azure.cosmos.exceptions import (
+    CosmosBatchOperationError,
+    CosmosHttpResponseError,
+    CosmosResourceNotFoundError,
+)
+
+from azure_.cosmosdb import (
+    BATCH_MAX_OPERATIONS,
+    CONNECTION_TIMEOUT,
+    POOL_SIZE,
+    PREFERRED_REGIONS,
+    READ_TIMEOUT,
+    _response_hook,
+    build_query,
+    shared_session,
+)
+from metrics import measure
+from storage.base import QUERY_MAX_WORKERS, notify_write
+
+# 共有ループ上の CosmosClient を開く Task（endpoint ごとに1つ）。
+# ループの中からだけ触るのでロックは要らない
+_shared_clients = {}
+
+
+async def _open_client(endpoint, key):
+    session = aiohttp.ClientSession(
+        connector=aiohttp.TCPConnector(limit=POOL_SIZE),
+        timeout=aiohttp.ClientTimeout(
+            sock_connect=CONNECTION_TIMEOUT, sock_read=READ_TIMEOUT
+        ),
+    )
+    transport = AioHttpTransport(session=session, session_owner=False)
+    options = {"transport": transport, "connection_timeout": READ_TIMEOUT}
+    if PREFERRED_REGIONS:
+        options["preferred_locations"] = PREFERRED_REGIONS
+    client = CosmosClient(endpoint, key, **options)
+    # __aenter__ でアカウント情報を取得し、セッション整合性のトークン管理を有効にする
+    # （ループが動いている間は開いたまま使う）
+    await client.__aenter__()
+    # 同期版のクライアントとセッションを共有し、同期版で書いた直後の読み込みでも
+    # 自分の書き込みが見えるようにする。
+    # client_connection.session は SDK の内部の属性（azure-cosmos 4.9.0 で確認。
+    # requirements.txt で固定）。無い場合は共有せず、それぞれのセッションで動かす
+    session_tokens = shared_session(endpoint)
+    connection = client.client_connection
+    if session_tokens is not None and getattr(connection, "session", None) is not None:
+        connection.session = session_tokens
+    elif session_tokens is not None:
+        print("CosmosDB: 非同期クライアントとセッションを共有できません（SDK の版を確認）")
+    return client
+
+
+async def get_shared_async_client(endpoint, key):
+    """接続プール（aiohttp）を設定した非同期 CosmosClient を共有ループで1つだけ開きます"""
+    task = _shared_clients.get(endpoint)
+    if task is None:
+        task = _shared_clients[endpoint] = asyncio.ensure_future(
+            _open_client(endpoint, key)
+        )
+    try:
+        return await asyncio.shield(task)
+    except Exception:
+        # 開けなかった場合は次の呼び出しで作り直す
+        if _shared_clients.get(endpoint) is task:
+            del _shared_clients[endpoint]
+        raise
+
+
+class AsyncCosmosDBClient:
+    """
+    共有の非同期 CosmosClient に対する軽量なハンドル。
+    作るだけなら通信しないので、どのスレッドで作ってもよい。
+    """
+
+    def __init__(
+        self,
+        endpoint=None,
+        key=None,
+        database_name="sat-db",
+        container_name="main_container",
+    ):
+        self.endpoint = endpoint or os.getenv("COSMOSDB_ENDPOINT")
+        self.key = key or os.getenv("COSMOSDB_KEY")
+        self.database_name = database_name
+        self.container_name = container_name
+
+    async def get_container(self):
+        client = await get_shared_async_client(self.endpoint, self.key)
+        database = client.get_database_client(self.database_name)
+        return database.get_container_client(self.container_name)
+
+    async def read_item(self, item_id: str, partition_key: str):
+        """id とパーティションキーで1件読み込みます（存在しない場合は None）"""
+        with measure("cosmos", "read_item", detail=partition_key) as m:
+            try:
+                container = await self.get_container()
+                item = await container.read_item(
+                    item=item_id,
+                    partition_key=partition_key,
+                    raw_response_hook=_response_hook(m),
+                )
+            except CosmosResourceNotFoundError:
+                m.items = 0
+                return None
+            m.items = 1
+            return item
+
+    async def search_container_by_query(
+        self, query: str, parameters: list, partition_key: str = None
+    ):
+        with measure("cosmos", "query", detail=query) as m:
+            # 非同期版はパーティションキーを省略するとクロスパーティションクエリになる
+            container = await self.get_container()
+            results = container.query_items(
+                query=query,
+                parameters=parameters,
+                partition_key=partition_key,
+                raw_response_hook=_response_hook(m),
+            )
+            items = [item async for item in results]
+            m.items = len(items)
+            return items
+
+    async def query(self, category: str, **conditions):
+        # category（パーティションキー）を指定した単一パーティションクエリ
+        query, parameters = build_query(**conditions)
+        return await self.search_container_by_query(
+            query, parameters, partition_key=category
+        )
+
+    async def query_partitions(
+        self, plans: dict, max_concurrency: int = QUERY_MAX_WORKERS
+    ):
+        """
+        category（パーティションキー）ごとのクエリを max_concurrency 個ずつ同時に実行します。
+        plans: {category: query の条件（dict）}
+        戻り値: ({category: [items]}, {category: 所要秒数})
+        カテゴリごとの所要時間は診断ページにも記録します。
+        """
+        semaphore = asyncio.Semaphore(max(1, max_concurrency))
+
+        async def run(category):
+            async with semaphore:
+                with measure("cosmos", "query_partition", detail=category) as m:
+                    items = await self.query(category, **plans[category])
+                    m.items = len(items)
+            return items, m.duration
+
+        categories = list(plans)
+        outcomes = await asyncio.gather(*(run(category) for category in categories))
+        results = {}
+        timings = {}
+        for category, (items, elapsed) in zip(categories, outcomes):
+            results[category] = items
+            timings[category] = elapsed
+        return results, timings
+
+    async def bulk_upsert(
+        self,
+        records: list,
+        partition_key_field: str = "category",
+        max_concurrency: int = QUERY_MAX_WORKERS,
+    ):
+        """
+        複数レコードをパーティションキーごとにまとめ、トランザクションバッチで登録します。
+        バッチは max_concurrency 個ずつ同時に送ります。
+        戻り値: {"items": [{id, category, ok, status_code, request_charge, error}],
+                 "succeeded": 件数, "failed": 件数, "request_charge": 合計RU}
+        """
+        groups = {}
+        for record in records:
+            if "id" not in record:
+                record["id"] = str(uuid.uuid4())
+            groups.setdefault(record[partition_key_field], []).append(record)
+
+        batches = []
+        for partition_key, group in groups.items():
+            for i in range(0, len(group), BATCH_MAX_OPERATIONS):
+                batches.append((partition_key, group[i : i + BATCH_MAX_OPERATIONS]))
+
+        semaphore = asyncio.Semaphore(max(1, max_concurrency))
+        container = await self.get_container()
+
+        async def run(partition_key, batch):
+            operations = [("upsert", (record,)) for record in batch]
+            async with semaphore:
+                with measure("cosmos", "bulk_upsert", detail=partition_key) as m:
+                    m.items = len(operations)
+                    try:
+                        responses = await container.execute_item_batch(
+                            batch_operations=operations,
+                            partition_key=partition_key,
+                            raw_response_hook=_response_hook(m),
+                        )
+                        error = None
+                    except CosmosBatchOperationError as e:
+                        # バッチ全体がロールバックされる。失敗した操作以外は 424 になる
+                        responses = e.operation_responses or [{}] * len(batch)
+                        error = e.http_error_message
+                    except CosmosHttpResponseError as e:
+                        responses = [{"statusCode": e.status_code}] * len(batch)
+                        error = e.message
+            report = []
+            for record, response in zip(batch, responses):
+                status_code = response.get("statusCode")
+                ok = error is None and status_code in (200, 201)
+                report.append(
+                    {
+                        "id": record["id"],
+                        partition_key_field: partition_key,
+                        "ok": ok,
+                        "status_code": status_code,
+                        "request_charge": float(response.get("requestCharge") or 0),
+                        "error": None if ok else error,
+                    }
+                )
+            return report
+
+        reports = await asyncio.gather(*(run(pk, batch) for pk, batch in batches))
+        items = [r for report in reports for r in report]
+
+        succeeded = [r for r in items if r["ok"]]
+        if succeeded:
+            ok_ids = {(r[partition_key_field], r["id"]) for r in succeeded}
+            notify_write(
+                [
+                    record
+                    for record in records
+                    if (record[partition_key_field], record["id"]) in ok_ids
+                ]
+            )
+        return {
+            "items": items,
+            "succeeded": len(succeeded),
+            "failed": len(items) - len(succeeded),
+            "request_charge": sum(r["request_charge"] for r in items),
+        }
@@ -1,5 +1,15 @@
+# pip install aiohttp
+# Graph API の呼び出しは共有イベントループ（azure_.aio_loop）上の aiohttp で行う。
+# *_async はループ上で await して使い、同名の同期関数はその薄いラッパー。
+import asyncio
+import hashlib
 import os
-import requests
+import time
+
+import aiohttp
+
+from azure_.aio_loop import run
+from metrics import measure
 
 
 # Microsoft Entra ID の情報
@@ -9,55 +19,345 @@ CLIENT_SECRET = os.getenv("CLIENT_SECRET")
 TARGET_USER = os.getenv("TARGET_USER")  # suzuki_shoichiro@atsumi-sat.com
 
 
+# 有効期限の何秒前にトークンを更新するか
+TOKEN_REFRESH_MARGIN = 300
+GRAPH_POOL_SIZE = int(os.getenv("GRAPH_POOL_SIZE", "10"))
+# これ以下のファイルは1回の PUT で送る（Graph の /content は 4MB まで）
+SIMPLE_UPLOAD_LIMIT = 4 * 1024 * 1024
+# アップロードセッションのチャンクサイズ（320KiB の倍数である必要がある）
+UPLOAD_CHUNK_SIZE = 10 * 320 * 1024
+# チャンク送信失敗時の再開回数の上限
+UPLOAD_MAX_RETRIES = 5
+# 1回の PUT（小さいファイル・チャンク）の待ち時間の上限（秒）
+UPLOAD_TIMEOUT = int(os.getenv("GRAPH_UPLOAD_TIMEOUT", "60"))
+# ファイルへ書き出すダウンロードで1回に読むサイズ
+DOWNLOAD_CHUNK_SIZE = 256 * 1024
+
+
+class _TokenCache:
+    """client credentials のアクセストークンを expires_in に従ってキャッシュする"""
+
+    def __init__(self):
+        self.token = None
+        self.expires_at = 0.0
+        self.lock = None  # asyncio.Lock は共有ループの中で作る
+
+    async def get(self):
+        if self.lock is None:
+            self.lock = asyncio.Lock()
+        async with self.lock:
+            if self.token and time.monotonic() < self.expires_at - TOKEN_REFRESH_MARGIN:
+                return self.token
+            token_url = (
+                f"https://login.microsoftonline.com/{TENANT_ID}/oauth2/v2.0/token"
+            )
+            data = {
+                "grant_type": "client_credentials",
+                "client_id": CLIENT_ID,
+                "client_secret": CLIENT_SECRET,
+                "scope": "https://graph.microsoft.com/.default",
+            }
+            with measure("graph", "token") as m:
+                async with get_graph_session().post(
+                    token_url, data=data, timeout=aiohttp.ClientTimeout(total=30)
+                ) as response:
+                    m.ok = response.status == 200
+                    body = await response.json(content_type=None)
+            token = body.get("access_token")
+            if token:
+                self.token = token
+                self.expires_at = time.monotonic() + int(body.get("expires_in", 0))
+            return token
+
+    def clear(self):
+        self.token = None
+        self.expires_at = 0.0
+
+
+_token_cache = _TokenCache()
+_graph_session = None
+
+
+def get_graph_session():
+    """
+    graph.microsoft.com / login.microsoftonline.com 用の共有セッション（keep-alive・接続プール）。
+    共有ループの中からだけ呼ぶ。
+    """
+    global _graph_session
+    if _graph_session is None or _graph_session.closed:
+        _graph_session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=GRAPH_POOL_SIZE)
+        )
+    return _graph_session
+
+
+async def get_access_token_async():
+    return await _token_cache.get()
+
+
 def get_access_token():
-    token_url = f"https://login.microsoftonline.com/{TENANT_ID}/oauth2/v2.0/token"
-    data = {
-        "grant_type": "client_credentials",
-        "client_id": CLIENT_ID,
-        "client_secret": CLIENT_SECRET,
-        "scope": "https://graph.microsoft.com/.default",
-    }
-    response = requests.post(token_url, data=data)
-    return response.json().get("access_token")
+    return run(get_access_token_async())
 
 
-def upload_onedrive(filename, uploaded_file):
-    access_token = get_access_token()
+def _file_size(uploaded_file):
+    size = getattr(uploaded_file, "size", None)
+    if size is None:
+        uploaded_file.seek(0, os.SEEK_END)
+        size = uploaded_file.tell()
+    uploaded_file.seek(0)
+    return size
+
+
+async def upload_onedrive_async(filename, uploaded_file):
+    """
+    OneDriveへファイルをアップロードする
+    小さいファイルは1回の PUT、大きいファイルは再開可能なアップロードセッションで送る。
+    どちらもファイルを1回読むだけで SHA-256 も計算する。
+    :param filename: OneDrive上のファイルパス（例: 'daily_report/sample.png'）
+    :return: ({"item": driveItem, "sha256": ハッシュ値, "size": バイト数}, None)
+             or (None, エラーメッセージ)
+    """
+    size = _file_size(uploaded_file)
+    if size > SIMPLE_UPLOAD_LIMIT:
+        return await upload_onedrive_session_async(filename, uploaded_file, size)
+
+    access_token = await get_access_token_async()
     if not access_token:
-        return "アクセストークン取得失敗"
+        return None, "アクセストークン取得失敗"
+    data = uploaded_file.read()
+    uploaded_file.seek(0)
     # filename = "daily_report/" + filename
     headers = {
         "Authorization": f"Bearer {access_token}",
         "Content-Type": "application/octet-stream",
     }
     upload_url = f"https://graph.microsoft.com/v1.0/users/{TARGET_USER}/drive/root:/{filename}:/content"
-    response = requests.put(upload_url, headers=headers, data=uploaded_file)
+    with measure("graph", "upload", detail=filename) as m:
+        m.items = 1
+        m.payload_bytes = len(data)
+        try:
+            async with get_graph_session().put(
+                upload_url,
+                headers=headers,
+                data=data,
+                timeout=aiohttp.ClientTimeout(total=UPLOAD_TIMEOUT),
+            ) as response:
+                status = response.status
+                m.ok = status in (200, 201)
+                if m.ok:
+                    body = await response.json(content_type=None)
+                else:
+                    text = await response.text()
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            m.ok = False
+            return None, f"❌ アップロード失敗: {str(e) or type(e).__name__}"
+    if status == 401:
+        _token_cache.clear()  # 失効したトークンは次回取り直す
+
+    if status in [200, 201]:
+        result = {
+            "item": body,
+            "sha256": hashlib.sha256(data).hexdigest(),
+            "size": len(data),
+        }
+        return result, None
+    else:
+        return None, f"❌ アップロード失敗: {text}"
+
+
+def upload_onedrive(filename, uploaded_file):
+    """upload_onedrive_async の同期版（戻り値は同じ）"""
+    return run(upload_onedrive_async(filename, uploaded_file))
 
-    return (
-        "✅ アップロード成功"
-        if response.status_code in [200, 201]
-        else f"❌ アップロード失敗: {response.text}"
+
+async def _next_expected_offset(session, upload_url):
+    """アップロードセッションの状態を問い合わせ、次に送るべきバイト位置を返す"""
+    async with session.get(
+        upload_url, timeout=aiohttp.ClientTimeout(total=30)
+    ) as response:
+        if response.status != 200:
+            return None
+        ranges = (await response.json(content_type=None)).get("nextExpectedRanges") or []
+    if not ranges:
+        return None
+    return int(ranges[0].split("-", 1)[0])
+
+
+async def upload_onedrive_session_async(
+    filename, uploaded_file, size, chunk_size=UPLOAD_CHUNK_SIZE
+):
+    """
+    Graph の createUploadSession を使い、ファイルをチャンクごとにストリーミング送信する。
+    通信が切れた場合はサーバーが受け取り済みの位置から再開する。
+    """
+    with measure("graph", "upload_session", detail=filename) as m:
+        m.payload_bytes = size
+        result, error = await _upload_session(
+            filename, uploaded_file, size, chunk_size, m
+        )
+        m.ok = error is None
+        m.items = 1
+    return result, error
+
+
+def upload_onedrive_session(
+    filename, uploaded_file, size, chunk_size=UPLOAD_CHUNK_SIZE
+):
+    """upload_onedrive_session_async の同期版（戻り値は同じ）"""
+    return run(
+        upload_onedrive_session_async(filename, uploaded_file, size, chunk_size)
     )
 
 
-def download_onedrive_image(file_path):
+async def _upload_session(filename, uploaded_file, size, chunk_size, m):
+    access_token = await get_access_token_async()
+    if not access_token:
+        return None, "アクセストークン取得失敗"
+    session = get_graph_session()
+    create_url = f"https://graph.microsoft.com/v1.0/users/{TARGET_USER}/drive/root:/{filename}:/createUploadSession"
+    async with session.post(
+        create_url,
+        headers={"Authorization": f"Bearer {access_token}"},
+        json={"item": {"@microsoft.graph.conflictBehavior": "replace"}},
+        timeout=aiohttp.ClientTimeout(total=30),
+    ) as response:
+        if response.status == 401:
+            _token_cache.clear()
+        if response.status != 200:
+            return None, f"❌ アップロードセッション作成失敗: {await response.text()}"
+        upload_url = (await response.json(content_type=None))["uploadUrl"]
+
+    hasher = hashlib.sha256()
+    hashed_upto = 0  # ハッシュ計算済みのバイト位置
+    offset = 0
+    retries = 0
+    while True:
+        uploaded_file.seek(offset)
+        chunk = uploaded_file.read(chunk_size)
+        end = offset + len(chunk)
+        # 再送時に同じバイトを二重にハッシュしないようにする
+        if end > hashed_upto:
+            hasher.update(chunk[hashed_upto - offset :])
+            hashed_upto = end
+        headers = {
+            "Content-Length": str(len(chunk)),
+            "Content-Range": f"bytes {offset}-{end - 1}/{size}",
+        }
+        body = None
+        try:
+            # uploadUrl は認証済みのため Authorization ヘッダーは付けない
+            async with session.put(
+                upload_url,
+                headers=headers,
+                data=chunk,
+                timeout=aiohttp.ClientTimeout(total=UPLOAD_TIMEOUT),
+            ) as response:
+                status_code = response.status
+                if status_code in (200, 201, 202):
+                    body = await response.json(content_type=None)
+                else:
+                    error = await response.text()
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            status_code = None
+            error = str(e) or type(e).__name__
+
+        if status_code in (200, 201):
+            uploaded_file.seek(0)
+            result = {"item": body, "sha256": hasher.hexdigest(), "size": size}
+            return result, None
+        if status_code == 202:
+            ranges = body.get("nextExpectedRanges") or [f"{end}-"]
+            offset = int(ranges[0].split("-", 1)[0])
+            retries = 0
+            continue
+
+        # 失敗: 受け取り済みの位置を確認して再開する
+        retries += 1
+        m.retries += 1
+        if retries > UPLOAD_MAX_RETRIES:
+            uploaded_file.seek(0)
+            return None, f"❌ アップロード失敗: {error}"
+        await asyncio.sleep(min(2**retries, 30))
+        try:
+            resume_at = await _next_expected_offset(session, upload_url)
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            resume_at = None
+        if resume_at is not None:
+            offset = resume_at
+
+
+async def download_onedrive_image_async(file_path):
     """
     OneDriveから画像ファイルをダウンロードする
     :param file_path: OneDrive上のファイルパス（例: 'daily_report/sample.png'）
     :return: バイナリデータ or エラーメッセージ
     """
-    access_token = get_access_token()
+    access_token = await get_access_token_async()
+    if not access_token:
+        return None, "アクセストークン取得失敗"
+    headers = {
+        "Authorization": f"Bearer {access_token}",
+    }
+    download_url = f"https://graph.microsoft.com/v1.0/users/{TARGET_USER}/drive/root:/{file_path}:/content"
+    with measure("graph", "download", detail=file_path) as m:
+        async with get_graph_session().get(download_url, headers=headers) as response:
+            status = response.status
+            m.ok = status == 200
+            if m.ok:
+                content = await response.read()
+            else:
+                text = await response.text()
+            m.items = 1
+            m.payload_bytes = len(content) if m.ok else 0
+    if status == 401:
+        _token_cache.clear()  # 失効したトークンは次回取り直す
+    if status == 200:
+        return content, None
+    else:
+        return None, f"❌ ダウンロード失敗: {text}"
+
+
+def download_onedrive_image(file_path):
+    """download_onedrive_image_async の同期版（戻り値は同じ）"""
+    return run(download_onedrive_image_async(file_path))
+
+
+async def download_onedrive_to_file_async(
+    file_path, dest, chunk_size=DOWNLOAD_CHUNK_SIZE
+):
+    """
+    OneDriveのファイルをメモリに溜めずに dest（ファイルパス）へ書き出す
+    :return: ({"sha256": ハッシュ値, "size": バイト数}, None) or (None, エラーメッセージ)
+    """
+    access_token = await get_access_token_async()
     if not access_token:
         return None, "アクセストークン取得失敗"
     headers = {
         "Authorization": f"Bearer {access_token}",
     }
     download_url = f"https://graph.microsoft.com/v1.0/users/{TARGET_USER}/drive/root:/{file_path}:/content"
-    response = requests.get(download_url, headers=headers, stream=True)
-    if response.status_code == 200:
-        return response.content, None
+    hasher = hashlib.sha256()
+    size = 0
+    with measure("graph", "download_stream", detail=file_path) as m:
+        async with get_graph_session().get(download_url, headers=headers) as response:
+            status = response.status
+            m.ok = status == 200
+            m.items = 1
+            if m.ok:
+                with open(dest, "wb") as f:
+                    async for chunk in response.content.iter_chunked(chunk_size):
+                        f.write(chunk)
+                        hasher.update(chunk)
+                        size += len(chunk)
+                m.payload_bytes = size
+            else:
+                text = await response.text()
+    if status == 401:
+        _token_cache.clear()  # 失効したトークンは次回取り直す
+    if status == 200:
+        return {"sha256": hasher.hexdigest(), "size": size}, None
     else:
-        return None, f"❌ ダウンロード失敗: {response.text}"
+        return None, f"❌ ダウンロード失敗: {text}"
 
 
 def dl_and_save_test():
@@ -0,0 +1,134 @@
+import random
+import uuid
+from datetime import date, timedelta
+
+# 渥美半島（田原市）周辺
+CENTER_LAT = 34.62
+CENTER_LON = 137.10
+# わなを置く範囲（度）。おおよそ東西 20km・南北 8km
+AREA_LAT = 0.04
+AREA_LON = 0.11
+# 捕獲地点のわなからのばらつき（度）。おおよそ 30m
+CATCH_SPREAD = 0.0003
+
+TRAP_TYPES = ("箱わな", "くくりわな")
+TRAP_STATUSES = ("稼働中", "稼働中", "稼働中", "停止中", "撤去済み")
+SEXES = ("オス", "メス")
+ADULTS = ("成獣", "幼獣")
+
+
+def fy_start(fy):
+    """年度（"2025年度"）の開始日（4月1日）"""
+    return date(int(fy[:4]), 4, 1)
+
+
+def generate_season(size=1000, fiscal_years=("2024年度", "2025年度"), seed=0):
+    """
+    ベンチマーク用に、ユーザー・わな・日報・捕獲結果のドキュメントを作る。
+    size はおおよその総件数。同じ seed なら同じデータになる。
+    戻り値: ドキュメントのリスト
+    """
+    rng = random.Random(seed)
+
+    def uid():
+        return str(uuid.UUID(int=rng.getrandbits(128)))
+
+    n_users = max(3, size // 200)
+    n_traps = max(5, size // 50)
+    n_results = max(1, size * 2 // 5)
+    n_daily = max(1, size - n_users - n_traps * len(fiscal_years) - n_results)
+
+    users = [
+        {
+            "id": uid(),
+            "category": "user",
+            "user_name": f"user{i:03d}",
+            "role": "admin" if i == 0 else "member",
+        }
+        for i in range(n_users)
+    ]
+
+    # わなの位置はいくつかの集落の周りに固まっている
+    hubs = [
+        (
+            CENTER_LAT + rng.uniform(-AREA_LAT, AREA_LAT) / 2,
+            CENTER_LON + rng.uniform(-AREA_LON, AREA_LON) / 2,
+        )
+        for _ in range(max(2, n_traps // 20))
+    ]
+    sites = []
+    for i in range(n_traps):
+        lat, lon = rng.choice(hubs)
+        sites.append(
+            {
+                "trap_name": f"わな{i:04d}",
+                "trap_type": rng.choice(TRAP_TYPES),
+                "latitude": round(rng.gauss(lat, AREA_LAT / 10), 6),
+                "longitude": round(rng.gauss(lon, AREA_LON / 10), 6),
+            }
+        )
+
+    docs = list(users)
+    for fy in fiscal_years:
+        start = fy_start(fy)
+        traps = []
+        for site in sites:
+            trap = dict(site, id=uid(), category="trap", fy=fy)
+            trap["status"] = rng.choice(TRAP_STATUSES)
+            trap["start_date"] = (start + timedelta(days=rng.randint(0, 60))).isoformat()
+            trap["end_date"] = (
+                (start + timedelta(days=rng.randint(200, 364))).isoformat()
+                if trap["status"] == "撤去済み"
+                else None
+            )
+            traps.append(trap)
+        docs.extend(traps)
+
+        for _ in range(n_daily // len(fiscal_years)):
+            trap = rng.choice(traps)
+            docs.append(
+                {
+                    "id": uid(),
+                    "category": "daily",
+                    "fy": fy,
+                    "status": rng.choice(("submitted", "checked")),
+                    "work_date": (start + timedelta(days=rng.randint(0, 364))).isoformat(),
+                    "user_name": rng.choice(users)["user_name"],
+                    "trap_name": trap["trap_name"],
+                }
+            )
+
+        for seq in range(1, n_results // len(fiscal_years) + 1):
+            trap = rng.choice(traps)
+            result = {
+                "id": uid(),
+                "category": "result",
+                "fy": fy,
+                "result_id": f"ﾀ-{seq}",
+                "result_seq": seq,
+                "reserved_by": rng.choice(users)["user_name"],
+                "reserved_at": f"{start.isoformat()} 09:00:00",
+            }
+            # 8割は登録済み、残りは番号だけ発行した状態
+            if rng.random() < 0.8:
+                result.update(
+                    status="registered",
+                    catch_date=(start + timedelta(days=rng.randint(0, 364))).isoformat(),
+                    sex=rng.choice(SEXES),
+                    adult=rng.choice(ADULTS),
+                    latitude=round(rng.gauss(trap["latitude"], CATCH_SPREAD), 6),
+                    longitude=round(rng.gauss(trap["longitude"], CATCH_SPREAD), 6),
+                    user_name=result["reserved_by"],
+                    trap_name=trap["trap_name"],
+                )
+            else:
+                result["status"] = "reserved"
+            docs.append(result)
+    return docs
+
+
+if __name__ == "__main__":
+    from collections import Counter
+
+    docs = generate_season(1000)
+    print(len(docs), Counter(d["category"] for d in docs))
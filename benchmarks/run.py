@@ -0,0 +1,256 @@
+# データ読み込み・集計まわりのベンチマーク。
+# 生成したデータを一時的な SQLite に入れ、主要な処理の所要時間を測る。
+#
+# 使い方:
+#   python -m benchmarks.run                      # 100 / 1,000 / 10,000 件で計測
+#   python -m benchmarks.run --sizes 100000       # 件数を指定
+#   python -m benchmarks.run --save-baseline      # 結果をベースラインとして保存
+# 結果は benchmarks/results/ に JSON で保存し、benchmarks/baseline.json があれば比較する。
+# ベースラインより tolerance 以上遅くなった項目があれば終了コード 1 を返す。
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import pandas as pd
+
+# 生成データをアプリのスナップショットとして残さず、読み込みは毎回クエリで計測する
+os.environ["SNAPSHOT_ENABLED"] = "0"
+
+from benchmarks.generate import generate_season
+from page_parts import catch_stats, spatial_cluster
+from page_parts.get_result_ids import issue_result_ids
+from page_parts.load_data import SharedDataset, read_only_view
+from page_parts.trap_map import build_trap_frame
+from storage.sqlite_store import SQLiteStorage
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+RESULTS_DIR = os.path.join(BENCH_DIR, "results")
+BASELINE_PATH = os.path.join(BENCH_DIR, "baseline.json")
+
+FISCAL_YEARS = ("2024年度", "2025年度")
+# 計測対象の年度（もう一方は他年度のデータとして混ぜておく）
+TARGET_FY = "2025年度"
+
+
+class Fixture:
+    """1つの件数について、生成データを入れた SQLite と計測用の入力を用意する"""
+
+    def __init__(self, size, seed):
+        self.size = size
+        self.docs = generate_season(size, FISCAL_YEARS, seed)
+        self.dir = tempfile.mkdtemp(prefix="sat-bench-")
+        self.client = SQLiteStorage(os.path.join(self.dir, "bench.db"))
+        self.client.bulk_upsert([dict(d) for d in self.docs])
+
+        self.dataset = SharedDataset(TARGET_FY)
+        view = self.dataset.get(self.client)
+        self.traps = list(view["traps"])
+        self.results = [
+            dict(d)
+            for d in self.docs
+            if d["category"] == "result" and d["fy"] == TARGET_FY
+        ]
+        self.registered = pd.DataFrame(
+            [d for d in self.results if d["status"] == "registered"]
+        )
+
+    def close(self):
+        self.client.conn.close()
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+
+def bench_load_dataset(fx):
+    # get_all_data の初回読み込み（共通データと年度のデータのクエリ + マージ + ビュー作成）
+    def run():
+        data = SharedDataset(None).get(fx.client)
+        data.update(SharedDataset(TARGET_FY).get(fx.client))
+        return data
+
+    return run
+
+
+def bench_partition_view(fx):
+    # 読み込み済みのデータをカテゴリ別に分け、読み取り専用ビューを作る
+    return lambda: read_only_view(fx.dataset.sync_state.partitioned())
+
+
+def bench_cluster_points(fx):
+    return lambda: spatial_cluster.cluster_points(fx.registered, threshold=30)
+
+
+def bench_cluster_summary(fx):
+    return lambda: spatial_cluster.cluster_summary(fx.registered, threshold=30)
+
+
+def bench_catch_stats_rebuild(fx):
+    # show_graph の集計をゼロから作る場合
+    def run():
+        stats = catch_stats.empty_stats(TARGET_FY)
+        members = {
+            shard: catch_stats.empty_members(TARGET_FY, shard)
+            for shard in range(catch_stats.MEMBER_SHARDS)
+        }
+        catch_stats.apply_changes(stats, members, fx.results)
+        return stats
+
+    return run
+
+
+def bench_catch_stats_refresh(fx):
+    # show_graph の通常時（変更なし）の集計ドキュメント読み込み
+    catch_stats.rebuild_catch_stats(fx.client, TARGET_FY)
+    return lambda: catch_stats.refresh_catch_stats(fx.client, TARGET_FY)
+
+
+def bench_trap_frame(fx):
+    return lambda: build_trap_frame(fx.traps, "すべて")
+
+
+def bench_issue_result_ids(fx):
+    # 捕獲番号10件の採番と仮登録
+    return lambda: issue_result_ids(fx.client, TARGET_FY, 10, "bench")
+
+
+BENCHMARKS = {
+    "load_dataset": bench_load_dataset,
+    "partition_view": bench_partition_view,
+    "cluster_points": bench_cluster_points,
+    "cluster_summary": bench_cluster_summary,
+    "catch_stats_rebuild": bench_catch_stats_rebuild,
+    "catch_stats_refresh": bench_catch_stats_refresh,
+    "trap_frame": bench_trap_frame,
+    "issue_result_ids": bench_issue_result_ids,
+}
+
+
+def measure(func, repeat):
+    func()  # 1回目はキャッシュの準備などを含むので捨てる
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return {
+        "median": statistics.median(times),
+        "min": min(times),
+        "max": max(times),
+        "repeat": repeat,
+    }
+
+
+def run_benchmarks(sizes, repeat=5, seed=0, only=None):
+    """戻り値: {"名前@件数": 計測結果}"""
+    results = {}
+    for size in sizes:
+        fx = Fixture(size, seed)
+        try:
+            for name, bench in BENCHMARKS.items():
+                if only and name not in only:
+                    continue
+                key = f"{name}@{size}"
+                results[key] = measure(bench(fx), repeat)
+                print(f"{key:32s} {results[key]['median'] * 1000:10.2f} ms")
+        finally:
+            fx.close()
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """
+    ベースラインと中央値を比べる。
+    戻り値: [(名前, ベースライン秒, 今回の秒, 比率, 遅くなったか)]
+    """
+    rows = []
+    for key, base in baseline.get("results", {}).items():
+        if key not in results:
+            continue
+        current = results[key]["median"]
+        ratio = current / base["median"] if base["median"] else float("inf")
+        rows.append((key, base["median"], current, ratio, ratio > 1 + tolerance))
+    return rows
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=BENCH_DIR,
+            stderr=subprocess.DEVNULL,
+            text=True,
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="SAT App ベンチマーク")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1000, 10000])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--only", nargs="+", choices=list(BENCHMARKS))
+    parser.add_argument("--output", help="結果の保存先（既定は results/日時.json）")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument(
+        "--tolerance", type=float, default=0.25, help="許容する遅延の割合"
+    )
+    parser.add_argument("--save-baseline", action="store_true")
+    args = parser.parse_args(argv)
+
+    results = run_benchmarks(args.sizes, args.repeat, args.seed, args.only)
+    report = {
+        "meta": {
+            "created_at": datetime.now().isoformat(timespec="seconds"),
+            "git": git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "seed": args.seed,
+            "sizes": args.sizes,
+        },
+        "results": results,
+    }
+
+    output = args.output or os.path.join(
+        RESULTS_DIR, datetime.now().strftime("%Y%m%d-%H%M%S") + ".json"
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"結果を保存しました: {output}")
+
+    if args.save_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"ベースラインを保存しました: {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print("ベースラインがありません（--save-baseline で保存できます）")
+        return 0
+    with open(args.baseline, encoding="utf-8") as f:
+        baseline = json.load(f)
+    rows = compare(results, baseline, args.tolerance)
+    regressions = 0
+    for key, base, current, ratio, slower in rows:
+        mark = "遅延" if slower else ""
+        print(
+            f"{key:32s} {base * 1000:10.2f} -> {current * 1000:10.2f} ms"
+            f" ({ratio:5.2f}x) {mark}"
+        )
+        regressions += slower
+    if regressions:
+        print(f"{regressions} 件の項目がベースラインより遅くなっています")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
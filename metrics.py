@@ -0,0 +1,134 @@
+import json
+import math
+import os
+import time
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime
+
+# 保持する計測記録の件数（古いものから捨てる）
+METRICS_BUFFER_SIZE = int(os.getenv("METRICS_BUFFER_SIZE", "5000"))
+# 0 で計測を止める
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1") != "0"
+
+# プロセス内のリングバッファ（deque の append はスレッドセーフ）
+_records = deque(maxlen=METRICS_BUFFER_SIZE)
+
+
+class Measurement:
+    """1回の呼び出しの計測値。measure() の中で呼び出し側が値を足していく"""
+
+    __slots__ = (
+        "kind",
+        "operation",
+        "detail",
+        "started_at",
+        "duration",
+        "request_charge",
+        "items",
+        "payload_bytes",
+        "retries",
+        "ok",
+    )
+
+    def __init__(self, kind, operation, detail=None):
+        self.kind = kind
+        self.operation = operation
+        self.detail = detail
+        self.started_at = time.time()
+        self.duration = 0.0
+        self.request_charge = 0.0
+        self.items = None
+        self.payload_bytes = 0
+        self.retries = 0
+        self.ok = True
+
+    def to_record(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+@contextmanager
+def measure(kind, operation, detail=None):
+    """
+    with measure("cosmos", "query", detail=SQL) as m: の形で使う。
+    ブロックを抜けたときに所要時間と m に設定した値をバッファに記録する。
+    例外で抜けた場合は ok=False として記録し、例外はそのまま送出する
+    （st.rerun などの BaseException は失敗として扱わない）。
+    """
+    m = Measurement(kind, operation, detail)
+    start = time.perf_counter()
+    try:
+        yield m
+    except Exception:
+        m.ok = False
+        raise
+    finally:
+        m.duration = time.perf_counter() - start
+        if METRICS_ENABLED:
+            _records.append(m.to_record())
+
+
+def records(kind=None):
+    """バッファの記録のコピー（古い順）"""
+    result = list(_records)
+    if kind is not None:
+        result = [r for r in result if r["kind"] == kind]
+    return result
+
+
+def clear():
+    _records.clear()
+
+
+def percentile(values, p):
+    """最近傍順位法のパーセンタイル（values はソート済み）"""
+    if not values:
+        return None
+    return values[max(0, math.ceil(p / 100 * len(values)) - 1)]
+
+
+def summarize(records):
+    """
+    (kind, operation) ごとの集計。
+    戻り値: [{kind, operation, count, errors, p50_ms, p95_ms, max_ms, request_charge, items, payload_bytes, retries}]
+    """
+    groups = {}
+    for r in records:
+        groups.setdefault((r["kind"], r["operation"]), []).append(r)
+    rows = []
+    for (kind, operation), group in groups.items():
+        durations = sorted(r["duration"] * 1000 for r in group)
+        rows.append(
+            {
+                "kind": kind,
+                "operation": operation,
+                "count": len(group),
+                "errors": sum(not r["ok"] for r in group),
+                "p50_ms": percentile(durations, 50),
+                "p95_ms": percentile(durations, 95),
+                "max_ms": durations[-1],
+                "request_charge": sum(r["request_charge"] for r in group),
+                "items": sum(r["items"] or 0 for r in group),
+                "payload_bytes": sum(r["payload_bytes"] for r in group),
+                "retries": sum(r["retries"] for r in group),
+            }
+        )
+    rows.sort(key=lambda row: (row["kind"], row["operation"]))
+    return rows
+
+
+def most_expensive(records, n=20, key="request_charge"):
+    """RU（または所要時間）の大きい呼び出しから順に n 件"""
+    return sorted(records, key=lambda r: (r[key], r["duration"]), reverse=True)[:n]
+
+
+def export_json(records):
+    return json.dumps(
+        {
+            "exported_at": datetime.now().isoformat(timespec="seconds"),
+            "records": records,
+            "summary": summarize(records),
+        },
+        ensure_ascii=False,
+        indent=2,
+    )
@@ -4,7 +4,7 @@ from page_parts.upload_daily_report import upsert_daily_report
 from st_init import with_init
 
 
-@with_init
+@with_init(needs=[])
 def main():
     upsert_daily_report()
 
@@ -5,7 +5,7 @@ from page_parts.upload_result_report import upsert_catch_result
 from st_init import with_init
 
 
-@with_init
+@with_init(needs=[])
 def main():
     upsert_catch_result()
 
@@ -5,7 +5,7 @@ from page_parts.get_result_ids import result_id_display
 from st_init import with_init
 
 
-@with_init
+@with_init(needs=["users"])
 def main():
     result_id_display()
 
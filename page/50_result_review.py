@@ -5,7 +5,7 @@ from page_parts.result_graph import show_graph, show_map
 from st_init import with_init
 
 
-@with_init
+@with_init(live=True, needs=["catch_results"])
 def main():
     show_graph()
     st.markdown("---")
@@ -6,7 +6,7 @@ from st_init import with_init
 
 
 
-@with_init
+@with_init(live=True, needs=["traps"])
 def main():
     st.subheader("わな稼働状況")
 
@@ -0,0 +1,14 @@
+import streamlit as st
+from page_parts.photo_review import show_photo_review
+
+
+from st_init import with_init
+
+
+@with_init(needs=[])
+def main():
+    show_photo_review()
+
+
+if __name__ == "__main__":
+    main()
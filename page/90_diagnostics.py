@@ -0,0 +1,14 @@
+import streamlit as st
+from page_parts.diagnostics import show_diagnostics
+
+
+from st_init import with_init
+
+
+@with_init(needs=[])
+def main():
+    show_diagnostics()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,326 @@
+# 捕獲数の集計を、結果ドキュメントの差分だけで更新する。
+# 年度ごとに集計ドキュメント（catch_stats-<fy>）と、結果ドキュメントごとの寄与を記録する
+# members ドキュメント（catch_stats_members-<fy>-<shard>）を aggregate パーティションに置く。
+# members は結果の id のハッシュで MEMBER_SHARDS 個に分け、変更のあった分だけを書き直す。
+# （Cosmos DB の 1 ドキュメント 2MB の上限に季節を通して収まるようにするため）
+#
+# 制限:
+# - 差分は _ts で取得するため、削除された結果ドキュメントは集計から引かれない。
+#   結果を削除した場合や MEMBER_SHARDS を変えた場合は rebuild で作り直す
+#   （python -m page_parts.catch_stats rebuild <年度>）。
+import copy
+import hashlib
+import json
+import os
+import sys
+import threading
+from datetime import datetime
+from zoneinfo import ZoneInfo
+
+from page_parts.fiscal_year import is_closed
+
+# 集計ドキュメントのパーティションキー
+STATS_CATEGORY = "aggregate"
+# 競合時の再試行回数
+MAX_RETRIES = 5
+# members ドキュメントの分割数（変えたら rebuild が必要）
+MEMBER_SHARDS = int(os.getenv("CATCH_STATS_MEMBER_SHARDS", "16"))
+# 1回のトランザクションバッチで書くドキュメントの合計サイズの上限（Cosmos DB の上限は 2MB）
+BATCH_MAX_BYTES = int(os.getenv("CATCH_STATS_BATCH_MAX_BYTES", str(1536 * 1024)))
+
+# 集計に使う結果ドキュメントのフィールド
+RESULT_FIELDS = (
+    "id",
+    "_ts",
+    "status",
+    "catch_date",
+    "sex",
+    "adult",
+    "user_name",
+    "reserved_by",
+    "trap_name",
+)
+
+
+# (年度, shard) ごとに、集計ドキュメントの _etag と対応する members ドキュメントを保持する
+# （両者は同じトランザクションで更新するので、_etag が同じなら members も変わっていない）
+_members_cache = {}
+_members_lock = threading.Lock()
+
+
+def stats_id(fy):
+    return f"catch_stats-{fy}"
+
+
+def members_id(fy, shard):
+    return f"catch_stats_members-{fy}-{shard}"
+
+
+def member_shard(result_id):
+    """結果ドキュメントの寄与を記録する members ドキュメントの番号"""
+    return int(hashlib.sha1(result_id.encode()).hexdigest()[:8], 16) % MEMBER_SHARDS
+
+
+def empty_stats(fy):
+    return {
+        "id": stats_id(fy),
+        "category": STATS_CATEGORY,
+        "fy": fy,
+        "total": 0,
+        "daily": {},  # 捕獲日 -> 捕獲数
+        "sex_adult": {},  # "性別|成獣/幼獣" -> 捕獲数
+        "by_user": {},
+        "by_trap": {},
+        "watermark": 0,  # 反映済みの結果ドキュメントの最大 _ts
+    }
+
+
+def empty_members(fy, shard):
+    # 結果ドキュメントごとに、どの集計に数えたかを記録する（再計算を冪等にするため）
+    return {
+        "id": members_id(fy, shard),
+        "category": STATS_CATEGORY,
+        "fy": fy,
+        "shard": shard,
+        "members": {},
+    }
+
+
+def contribution(doc):
+    """結果ドキュメントが集計に寄与する値（登録済みでなければ None）"""
+    if doc.get("status") != "registered":
+        return None
+    return [
+        doc.get("catch_date"),
+        doc.get("sex"),
+        doc.get("adult"),
+        doc.get("user_name") or doc.get("reserved_by"),
+        doc.get("trap_name"),
+    ]
+
+
+def _add(counts, key, delta):
+    if key is None:
+        return
+    value = counts.get(key, 0) + delta
+    if value:
+        counts[key] = value
+    else:
+        counts.pop(key, None)
+
+
+def _apply(stats, values, delta):
+    catch_date, sex, adult, user, trap = values
+    stats["total"] += delta
+    _add(stats["daily"], catch_date, delta)
+    if sex is not None and adult is not None:
+        _add(stats["sex_adult"], f"{sex}|{adult}", delta)
+    _add(stats["by_user"], user, delta)
+    _add(stats["by_trap"], trap, delta)
+
+
+def apply_changes(stats, members, docs):
+    """
+    変更された結果ドキュメントを集計に反映する。
+    members: {shard: members ドキュメント}（docs の id が属する shard を含むこと）
+    戻り値: 書き換えた shard の集合
+    """
+    changed = set()
+    for doc in docs:
+        shard = member_shard(doc["id"])
+        recorded = members[shard]["members"]
+        old = recorded.get(doc["id"])
+        new = contribution(doc)
+        stats["watermark"] = max(stats["watermark"], doc.get("_ts", 0))
+        if old == new:
+            continue
+        if old is not None:
+            _apply(stats, old, -1)
+            del recorded[doc["id"]]
+        if new is not None:
+            _apply(stats, new, 1)
+            recorded[doc["id"]] = new
+        changed.add(shard)
+    return changed
+
+
+def _strip(doc):
+    return {k: v for k, v in doc.items() if not k.startswith("_")}
+
+
+def _size(doc):
+    return len(json.dumps(doc, ensure_ascii=False).encode())
+
+
+def _fit_batch(stats, members, docs):
+    """
+    docs（_ts 順）のうち、集計と書き換える members が BATCH_MAX_BYTES に収まる分を返す。
+    全部は収まらない場合は、集計が変わるものを先頭から（最低1件）返す。
+    残りは watermark 以降に残るので次の書き込みで反映する。
+    """
+    total = _size(stats)
+    shards = set()
+    batch = []
+    for doc in docs:
+        shard = member_shard(doc["id"])
+        if members[shard]["members"].get(doc["id"]) == contribution(doc):
+            continue
+        grow = _size([doc["id"], contribution(doc)])
+        if shard not in shards:
+            grow += _size(members[shard])
+        if batch and total + grow > BATCH_MAX_BYTES:
+            return batch
+        shards.add(shard)
+        batch.append(doc)
+        total += grow
+    return docs
+
+
+def _size_batches(docs):
+    """docs を合計サイズが BATCH_MAX_BYTES 以下になるように分ける"""
+    batch, total = [], 0
+    for doc in docs:
+        size = _size(doc)
+        if batch and total + size > BATCH_MAX_BYTES:
+            yield batch
+            batch, total = [], 0
+        batch.append(doc)
+        total += size
+    if batch:
+        yield batch
+
+
+def _query_results(client, fy, watermark=0):
+    return client.query(
+        "result", fy=fy, since_ts=watermark or None, fields=RESULT_FIELDS
+    )
+
+
+def _read_members(client, fy, shards, stats_etag):
+    """shards の members ドキュメントを {shard: ドキュメント} で返す（無いものがあれば None）"""
+    result = {}
+    for shard in shards:
+        with _members_lock:
+            cached = _members_cache.get((fy, shard))
+        if cached and cached[0] == stats_etag:
+            result[shard] = cached[1]
+            continue
+        members_doc = client.read_item(members_id(fy, shard), STATS_CATEGORY)
+        if members_doc is None:
+            return None
+        with _members_lock:
+            _members_cache[(fy, shard)] = (stats_etag, members_doc)
+        result[shard] = members_doc
+    return result
+
+
+def _update_members_cache(fy, old_etag, new_etag, written):
+    # 書き込まなかった shard は変わっていないので、新しい _etag に付け替える
+    with _members_lock:
+        for (cached_fy, shard), (etag, doc) in list(_members_cache.items()):
+            if cached_fy == fy and etag == old_etag:
+                _members_cache[(fy, shard)] = (new_etag, doc)
+        for shard, doc in written.items():
+            _members_cache[(fy, shard)] = (new_etag, doc)
+
+
+def refresh_catch_stats(client, fy):
+    """
+    集計ドキュメントの watermark 以降に変更された結果だけを読み、差分を反映して返す。
+    変更がなければ書き込みは行わない。
+    1回のバッチに収まらない場合は、収まる分ずつ書き込んで繰り返す。
+    """
+    conflicts = 0
+    while conflicts < MAX_RETRIES:
+        stats_doc = client.read_item(stats_id(fy), STATS_CATEGORY)
+        if stats_doc is None:
+            return rebuild_catch_stats(client, fy)
+        docs = sorted(
+            _query_results(client, fy, stats_doc.get("watermark", 0)),
+            key=lambda doc: doc.get("_ts", 0),
+        )
+        shards = {member_shard(doc["id"]) for doc in docs}
+        members_docs = _read_members(client, fy, shards, stats_doc["_etag"])
+        if members_docs is None:
+            return rebuild_catch_stats(client, fy)
+        # 書き込みに失敗してもキャッシュや読んだ値が変わらないよう、複製に反映する
+        stats = copy.deepcopy(_strip(stats_doc))
+        members = {
+            shard: copy.deepcopy(_strip(doc)) for shard, doc in members_docs.items()
+        }
+        batch = _fit_batch(stats, members, docs)
+        changed = sorted(apply_changes(stats, members, batch))
+        if not changed:
+            return stats
+        stats["updated_at"] = _now()
+        items = [(stats, stats_doc["_etag"])] + [
+            (members[shard], members_docs[shard]["_etag"]) for shard in changed
+        ]
+        responses = client.write_batch_if_match(items, STATS_CATEGORY)
+        if responses is None:
+            conflicts += 1
+            continue
+        _update_members_cache(
+            fy,
+            stats_doc["_etag"],
+            responses[0].get("eTag"),
+            {
+                shard: dict(members[shard], _etag=response.get("eTag"))
+                for shard, response in zip(changed, responses[1:])
+            },
+        )
+        if batch is docs:
+            return stats
+    # 競合が続く場合は最後に読んだ値を返す（次回の表示で反映される）
+    return _strip(stats_doc)
+
+
+# 締め済みの年度の集計（もう変わらないので一度読んだら保持する）
+_closed_stats = {}
+
+
+def get_catch_stats(client, fy):
+    """表示用の集計を返す。締め済みの年度は1回だけ読み込む"""
+    if not is_closed(fy):
+        return refresh_catch_stats(client, fy)
+    stats = _closed_stats.get(fy)
+    if stats is None:
+        stats = _closed_stats[fy] = refresh_catch_stats(client, fy)
+    return stats
+
+
+def rebuild_catch_stats(client, fy):
+    """
+    全ての結果ドキュメントから集計を作り直す（修復用）。
+    members を BATCH_MAX_BYTES ごとに書いてから、最後に集計ドキュメントを書く
+    （集計ドキュメントがあれば members も揃っている）。失敗したら RuntimeError。
+    """
+    stats = empty_stats(fy)
+    members = {shard: empty_members(fy, shard) for shard in range(MEMBER_SHARDS)}
+    apply_changes(stats, members, _query_results(client, fy))
+    stats["updated_at"] = _now()
+    for batch in [*_size_batches(members.values()), [stats]]:
+        report = client.bulk_upsert(batch)
+        if report["failed"]:
+            errors = {item["error"] for item in report["items"] if not item["ok"]}
+            raise RuntimeError(f"{fy} の捕獲数の集計を保存できませんでした: {errors}")
+    with _members_lock:
+        for key in [key for key in _members_cache if key[0] == fy]:
+            del _members_cache[key]
+    _closed_stats.pop(fy, None)
+    return stats
+
+
+def _now():
+    return datetime.now(ZoneInfo("Asia/Tokyo")).strftime("%Y-%m-%d %H:%M:%S")
+
+
+if __name__ == "__main__":
+    # 使い方: python -m page_parts.catch_stats rebuild 2025年度
+    from storage import get_storage
+
+    if len(sys.argv) == 3 and sys.argv[1] == "rebuild":
+        result = rebuild_catch_stats(get_storage(), sys.argv[2])
+        print(f"{sys.argv[2]}: 総捕獲数 {result['total']}")
+    else:
+        print("usage: python -m page_parts.catch_stats rebuild <年度>")
@@ -0,0 +1,162 @@
+import json
+import os
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+from storage import get_storage
+from page_parts.load_data import apply_changes_to_datasets
+
+# 変更フィードを確認する間隔（秒）。0 で無効
+CHANGE_FEED_INTERVAL = float(os.getenv("CHANGE_FEED_INTERVAL", "10"))
+# 継続トークンの保存先
+CHANGE_FEED_CHECKPOINT = os.getenv("CHANGE_FEED_CHECKPOINT", ".cache/change_feed.json")
+# 継続トークンが無いときに遡って読む秒数（取りこぼし防止、反映は冪等）
+START_MARGIN = 60
+
+
+class StorageChangeFeedSource:
+    """保存先（Cosmos DB / SQLite）の変更フィード"""
+
+    def __init__(self, client=None):
+        # 継続トークンを応答ヘッダーから取るため、専用のクライアントを使う
+        self.client = client or get_storage(shared=False)
+
+    def read(self, continuation, start_time):
+        return self.client.read_change_feed(continuation, start_time)
+
+
+class ListChangeFeedSource:
+    """
+    テスト用のローカルな変更フィード。
+    push したドキュメントを順に返し、継続トークンはリスト上の位置。
+    """
+
+    def __init__(self):
+        self.changes = []
+        self.lock = threading.Lock()
+
+    def push(self, *items):
+        with self.lock:
+            self.changes.extend(items)
+
+    def read(self, continuation, start_time):
+        with self.lock:
+            start = int(continuation or 0)
+            items = self.changes[start:]
+            return list(items), str(start + len(items))
+
+
+class FileCheckpoint:
+    """継続トークンをローカルファイルに保存する"""
+
+    def __init__(self, path=CHANGE_FEED_CHECKPOINT):
+        self.path = path
+
+    def load(self):
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                return json.load(f).get("continuation")
+        except (OSError, ValueError):
+            return None
+
+    def save(self, continuation):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"continuation": continuation, "saved_at": time.time()}, f)
+        os.replace(tmp, self.path)
+
+
+class MemoryCheckpoint:
+    def __init__(self, continuation=None):
+        self.continuation = continuation
+
+    def load(self):
+        return self.continuation
+
+    def save(self, continuation):
+        self.continuation = continuation
+
+
+class ChangeFeedConsumer:
+    """
+    変更フィードを定期的に読み、apply(items) でプロセス内のデータに反映する。
+    反映できたら継続トークンを checkpoint に保存する。
+    """
+
+    def __init__(
+        self,
+        source,
+        apply=apply_changes_to_datasets,
+        checkpoint=None,
+        interval=CHANGE_FEED_INTERVAL,
+    ):
+        self.source = source
+        self.apply = apply
+        self.checkpoint = checkpoint or MemoryCheckpoint()
+        self.interval = interval
+        self.continuation = self.checkpoint.load()
+        self.last_poll = None
+        self.last_error = None
+        self.applied = 0
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def poll_once(self):
+        started = datetime.now(timezone.utc)
+        start_time = (self.last_poll or started) - timedelta(seconds=START_MARGIN)
+        items, continuation = self.source.read(self.continuation, start_time)
+        if items:
+            self.applied += self.apply(items) or 0
+        if continuation:
+            self.continuation = continuation
+            self.checkpoint.save(continuation)
+        self.last_poll = started
+        return len(items)
+
+    def run(self):
+        while not self.stop_event.is_set():
+            try:
+                self.poll_once()
+                self.last_error = None
+            except Exception as e:
+                self.last_error = str(e)
+                print(f"変更フィードの読み込みに失敗しました: {e}")
+            self.stop_event.wait(self.interval)
+
+    def start(self):
+        if self.thread is None or not self.thread.is_alive():
+            self.stop_event.clear()
+            self.thread = threading.Thread(
+                target=self.run, name="change-feed", daemon=True
+            )
+            self.thread.start()
+        return self
+
+    def stop(self):
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join(timeout=self.interval + 5)
+
+
+_consumer = None
+_consumer_lock = threading.Lock()
+
+
+def start_change_feed():
+    """サーバープロセスごとに1つだけ変更フィードの読み込みを開始する"""
+    global _consumer
+    if CHANGE_FEED_INTERVAL <= 0:
+        return None
+    with _consumer_lock:
+        if _consumer is None:
+            try:
+                _consumer = ChangeFeedConsumer(
+                    StorageChangeFeedSource(), checkpoint=FileCheckpoint()
+                ).start()
+            except Exception as e:
+                print(f"変更フィードを開始できませんでした: {e}")
+                return None
+        return _consumer
+
@@ -0,0 +1,102 @@
+import os
+import streamlit as st
+import pandas as pd
+from datetime import datetime
+
+import metrics
+
+# 診断ページを表示するか（クエリ文や RU が見えるので運用担当の環境でだけ有効にする）
+DIAGNOSTICS_ENABLED = os.getenv("DIAGNOSTICS_ENABLED", "0") == "1"
+
+SUMMARY_COLUMNS = {
+    "kind": "種類",
+    "operation": "操作",
+    "count": "回数",
+    "errors": "失敗",
+    "p50_ms": "p50 (ms)",
+    "p95_ms": "p95 (ms)",
+    "max_ms": "最大 (ms)",
+    "request_charge": "RU 合計",
+    "items": "件数合計",
+    "payload_bytes": "サイズ合計 (byte)",
+    "retries": "リトライ",
+}
+
+
+def records_frame(records):
+    df = pd.DataFrame(records)
+    df["started_at"] = pd.to_datetime(df["started_at"], unit="s", utc=True).dt.tz_convert(
+        "Asia/Tokyo"
+    )
+    df["duration_ms"] = df["duration"] * 1000
+    return df[
+        [
+            "started_at",
+            "kind",
+            "operation",
+            "duration_ms",
+            "request_charge",
+            "items",
+            "payload_bytes",
+            "retries",
+            "ok",
+            "detail",
+        ]
+    ]
+
+
+def show_diagnostics():
+    st.subheader("診断")
+    if not DIAGNOSTICS_ENABLED:
+        st.error("診断ページは無効です（DIAGNOSTICS_ENABLED=1 で有効になります）。")
+        return
+    st.caption(
+        f"このプロセスで記録した直近 {metrics.METRICS_BUFFER_SIZE} 件までの"
+        "Cosmos DB・Graph の呼び出しとページ表示の計測値です。"
+        "RU・リトライ・サイズは呼び出しごとの応答ヘッダーから集計しています。"
+    )
+    records = metrics.records()
+    if not records:
+        st.info("計測値がまだありません。")
+        return
+
+    kinds = sorted({r["kind"] for r in records})
+    selected = st.multiselect("種類", kinds, default=kinds)
+    records = [r for r in records if r["kind"] in selected]
+    if not records:
+        return
+
+    st.markdown("#### 操作ごとの所要時間")
+    summary = pd.DataFrame(metrics.summarize(records)).rename(columns=SUMMARY_COLUMNS)
+    st.dataframe(summary, hide_index=True, use_container_width=True)
+
+    st.markdown("#### RU の大きいクエリ")
+    queries = [r for r in records if r["kind"] == "cosmos" and r["request_charge"]]
+    if queries:
+        st.dataframe(
+            records_frame(metrics.most_expensive(queries)),
+            hide_index=True,
+            use_container_width=True,
+        )
+    else:
+        st.caption("RU の記録がありません。")
+
+    st.markdown("#### 時間のかかった呼び出し")
+    st.dataframe(
+        records_frame(metrics.most_expensive(records, key="duration")),
+        hide_index=True,
+        use_container_width=True,
+    )
+
+    col1, col2 = st.columns(2)
+    with col1:
+        st.download_button(
+            "JSON で書き出す",
+            data=metrics.export_json(records),
+            file_name=f"metrics-{datetime.now():%Y%m%d-%H%M%S}.json",
+            mime="application/json",
+        )
+    with col2:
+        if st.button("記録を消去"):
+            metrics.clear()
+            st.rerun()
@@ -0,0 +1,50 @@
+import os
+from datetime import date, datetime, timedelta
+from zoneinfo import ZoneInfo
+
+# 選択肢に出す最初の年度（開始年）
+FIRST_FISCAL_YEAR = int(os.getenv("FIRST_FISCAL_YEAR", "2024"))
+# 年度末からこの日数が過ぎた年度は締め済み（遅れて届く報告の登録を待つ期間）
+FISCAL_YEAR_GRACE_DAYS = int(os.getenv("FISCAL_YEAR_GRACE_DAYS", "60"))
+
+
+def today():
+    return datetime.now(ZoneInfo("Asia/Tokyo")).date()
+
+
+def fiscal_year_of(day: date):
+    """日付が属する年度（4月始まり）。例: 2026-03-31 -> "2025年度" """
+    year = day.year if day.month >= 4 else day.year - 1
+    return f"{year}年度"
+
+
+def current_fiscal_year():
+    return fiscal_year_of(today())
+
+
+def start_year(fy: str):
+    """年度の開始年（"2025年度" -> 2025）"""
+    return int(fy.removesuffix("年度"))
+
+
+def fiscal_year_end(fy: str):
+    return date(start_year(fy) + 1, 3, 31)
+
+
+def closing_date(fy: str):
+    """年度が締まる日（この日を過ぎたら締め済み）"""
+    return fiscal_year_end(fy) + timedelta(days=FISCAL_YEAR_GRACE_DAYS)
+
+
+def is_closed(fy: str):
+    """
+    締め済みの年度か。締め済みの年度のデータは変わらないものとして扱い、
+    一度読み込んだら再取得しない。
+    """
+    return today() > closing_date(fy)
+
+
+def available_fiscal_years():
+    """選択できる年度（新しい順）"""
+    last = start_year(current_fiscal_year())
+    return [f"{year}年度" for year in range(last, FIRST_FISCAL_YEAR - 1, -1)]
@@ -1,108 +1,163 @@
 import streamlit as st
 from datetime import datetime
-from azure_.one_drive import upload_onedrive
-from page_parts.upload_daily_report import submit_data
 import uuid
 from zoneinfo import ZoneInfo
 
 # --- 新しいID発行・仮登録関数 ---
-from page_parts.load_data import get_all_data
+from page_parts.fiscal_year import is_closed
+from page_parts.result_id_allocator import (
+    ensure_result_seq,
+    format_result_id,
+    release_result_numbers,
+    reserve_result_numbers,
+)
 
 
-def get_result_ids(num=1, user_name=None):
-    # 最新データ取得
-    data = get_all_data()
-    st.session_state.catch_results = data["catch_results"]
-
-    # 既存IDの数値部分だけを抽出
-    used_ids = set()
-    for d in st.session_state.catch_results:
-        rid = d.get("result_id", "")
-        if isinstance(rid, str) and rid.startswith("ﾀ-"):
-            try:
-                used_ids.add(int(rid.split("-", 1)[1]))
-            except ValueError:
-                pass
-        else:
-            # 旧フォーマットにも対応
-            try:
-                used_ids.add(int(rid))
-            except Exception:
-                pass
-
-    # 連番で未使用IDをnum個探す
-    next_ids = []
-    i = 1
-    while len(next_ids) < num:
-        if i not in used_ids:
-            next_ids.append(i)
-        i += 1
+def issue_result_ids(client, fy, num=1, user_name=None):
+    """
+    捕獲番号を確保して仮登録する。
+    戻り値: (登録できた捕獲番号のリスト, bulk_upsert の結果)
+    """
+    # 年度ごとのカウンタから番号を確保（全件走査はしない）
+    next_ids = reserve_result_numbers(client, fy, num)
+
     # 仮登録レコードをDBに保存
-    client = st.session_state["cosmos_client"]
-    fy = st.session_state.get("fy", "2025年度")
     reserved = []
     for rid_num in next_ids:
-        rid_str = f"ﾀ-{rid_num}"
         rec = {
             "id": str(uuid.uuid4()),
             "category": "result",
             "fy": fy,
-            "result_id": rid_str,
+            "result_id": format_result_id(rid_num),
+            "result_seq": rid_num,
             "status": "reserved",
             "reserved_by": user_name,
             "reserved_at": datetime.now(ZoneInfo("Asia/Tokyo")).strftime(
                 "%Y-%m-%d %H:%M:%S"
             ),
         }
-        client.upsert_to_container(rec)
         reserved.append(rec)
+    # まとめて1回のバッチで登録する
+    try:
+        report = client.bulk_upsert(reserved)
+    except Exception:
+        # 通信エラーなどで結果が分からない場合は、登録を確認できなかった番号を全て戻す
+        _release_unwritten(client, fy, reserved)
+        raise
+    ok_ids = {r["id"] for r in report["items"] if r["ok"]}
+    # 登録できなかった番号は空き番号に戻す
+    release_result_numbers(
+        client, fy, [rec["result_seq"] for rec in reserved if rec["id"] not in ok_ids]
+    )
+    # A-付きで返却（登録に成功したものだけ）
+    return [rec["result_id"] for rec in reserved if rec["id"] in ok_ids], report
 
-    # session_stateも更新
-    st.session_state.catch_results += reserved
 
-    # A-付きで返却
-    return [f"ﾀ-{rid_num}" for rid_num in next_ids]
+def _release_unwritten(client, fy, reserved):
+    try:
+        written = client.query(
+            "result",
+            fy=fy,
+            filters={"id": [rec["id"] for rec in reserved]},
+            fields=("id",),
+        )
+        written_ids = {item["id"] for item in written}
+    except Exception as e:
+        print(f"仮登録の確認に失敗しました: {e}")
+        written_ids = set()
+    try:
+        release_result_numbers(
+            client,
+            fy,
+            [rec["result_seq"] for rec in reserved if rec["id"] not in written_ids],
+        )
+    except Exception as e:
+        print(f"捕獲番号を空き番号に戻せませんでした: {e}")
 
 
-def result_id_display():
-    data_all = get_all_data()
-    st.session_state.catch_results = data_all["catch_results"]
+def get_result_ids(num=1, user_name=None):
+    client = st.session_state["cosmos_client"]
+    fy = st.session_state.fy
+    if is_closed(fy):
+        st.error(f"{fy} は締め済みのため捕獲番号を発行できません")
+        return []
+    result_ids, report = issue_result_ids(client, fy, num, user_name)
+    if report["failed"]:
+        st.error(f"捕獲番号の仮登録に失敗しました（{report['failed']} 件）")
+    return result_ids
+
+
+# 発行済み捕獲番号の一覧で1回に読み込む件数
+RESULT_ID_PAGE_SIZE = 100
+
+# 一覧に表示するフィールド
+RESULT_ID_LIST_FIELDS = ("result_id", "reserved_by", "reserved_at", "result_seq")
 
-    all_records = [
+
+def reset_result_id_list():
+    st.session_state.result_id_fy = st.session_state.fy
+    st.session_state.result_id_rows = []
+    st.session_state.result_id_continuation = None
+    st.session_state.result_id_loaded = False
+
+
+def load_result_id_page():
+    """発行済み捕獲番号を番号の降順で1ページ分読み込む（必要な項目だけ取得）"""
+    client = st.session_state["cosmos_client"]
+    fy = st.session_state.fy
+    ensure_result_seq(client, fy)
+    items, continuation = client.query_page(
+        "result",
+        page_size=RESULT_ID_PAGE_SIZE,
+        continuation=st.session_state.result_id_continuation,
+        fy=fy,
+        defined=("result_seq",),
+        fields=RESULT_ID_LIST_FIELDS,
+        order_by="result_seq",
+        descending=True,
+    )
+    st.session_state.result_id_rows += [
         {
             "捕獲番号": d["result_id"],
             "発行者": d.get("reserved_by", ""),
             "発行日時": d.get("reserved_at", ""),
         }
-        for d in st.session_state.catch_results
-        if "result_id" in d and d["result_id"]
+        for d in items
+        if d.get("result_id")
     ]
+    st.session_state.result_id_continuation = continuation
+    st.session_state.result_id_loaded = True
 
-    # 数字部分でソート
-    all_records = sorted(
-        all_records,
-        key=lambda x: (
-            int(x["捕獲番号"].split("-", 1)[1])
-            if isinstance(x["捕獲番号"], str) and "-" in x["捕獲番号"]
-            else 0
-        ),
-        reverse=True,  # 降順
-    )
 
-    # Markdownテーブル文字列作成
-    if all_records:
-        table_md = "| 捕獲番号 | 発行者 | 発行日時 |\n"
-        table_md += "|---|---|---|\n"
-        for rec in all_records:
-            table_md += f"| {rec['捕獲番号']} | {rec['発行者']} | {rec['発行日時']} |\n"
+def result_id_display():
+    # 年度を切り替えたら一覧を読み直す
+    if st.session_state.get("result_id_fy") != st.session_state.fy:
+        reset_result_id_list()
+    if not st.session_state.result_id_loaded:
+        load_result_id_page()
 
+    if st.session_state.result_id_rows:
         st.subheader("発行済 捕獲番号")
-        st.markdown(table_md)
+        st.dataframe(
+            st.session_state.result_id_rows, hide_index=True, use_container_width=True
+        )
+        col1, col2 = st.columns(2)
+        with col1:
+            if st.session_state.result_id_continuation and st.button("さらに読み込む"):
+                load_result_id_page()
+                st.rerun()
+        with col2:
+            if st.button("最新の状態に更新"):
+                reset_result_id_list()
+                st.rerun()
     else:
         st.info("発行済みIDはありません")
     st.markdown("---")
 
     st.subheader("捕獲番号の発行")
+    if is_closed(st.session_state.fy):
+        st.info(f"{st.session_state.fy} は締め済みのため捕獲番号を発行できません。")
+        return
     users_df = st.session_state.users
     user_options = [f"{u['user_name']}" for u in users_df] if users_df else []
     selected_user_name = st.segmented_control(
@@ -127,17 +182,6 @@ def result_id_display():
             )
             st.session_state.user = user_record
             get_result_ids(num=num_ids, user_name=st.session_state.user["user_name"])
-            data_all = get_all_data()
-            st.session_state.catch_results = data_all["catch_results"]
-            all_records = [
-                d["result_id"]
-                for d in st.session_state.catch_results
-                if "result_id" in d and d["result_id"]  # Noneや空文字を除外
-            ]
-            all_records = sorted(
-                all_records,
-                key=lambda x: (
-                    int(x.split("-", 1)[1]) if isinstance(x, str) and "-" in x else 0
-                ),
-            )
+            # 一覧は先頭から読み直す
+            reset_result_id_list()
             st.rerun()
@@ -0,0 +1,119 @@
+import io
+import os
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from PIL import Image, ImageOps
+
+# 長辺の最大ピクセル数（これより大きい写真は縮小する）
+IMAGE_MAX_EDGE = int(os.getenv("IMAGE_MAX_EDGE", "2048"))
+# 再圧縮時の JPEG 品質
+IMAGE_QUALITY = int(os.getenv("IMAGE_QUALITY", "85"))
+# サムネイルの長辺ピクセル数と品質
+THUMBNAIL_EDGE = int(os.getenv("THUMBNAIL_EDGE", "320"))
+THUMBNAIL_QUALITY = int(os.getenv("THUMBNAIL_QUALITY", "70"))
+# 画像処理に使うプロセス数
+IMAGE_MAX_WORKERS = int(os.getenv("IMAGE_MAX_WORKERS", str(os.cpu_count() or 2)))
+
+
+def _to_rgb(img):
+    # 透過PNGなどは白背景に合成して JPEG にできる形にする
+    if img.mode in ("RGB", "L"):
+        return img
+    if img.mode in ("RGBA", "LA", "P"):
+        img = img.convert("RGBA")
+        background = Image.new("RGB", img.size, (255, 255, 255))
+        background.paste(img, mask=img.getchannel("A"))
+        return background
+    return img.convert("RGB")
+
+
+def _save_jpeg(img, quality, exif=None):
+    out = io.BytesIO()
+    options = {"quality": quality, "optimize": True}
+    if exif:
+        options["exif"] = exif
+    img.save(out, "JPEG", **options)
+    return out.getvalue()
+
+
+def normalize_image(
+    data,
+    max_edge=IMAGE_MAX_EDGE,
+    quality=IMAGE_QUALITY,
+    thumbnail_edge=THUMBNAIL_EDGE,
+    thumbnail_quality=THUMBNAIL_QUALITY,
+):
+    """
+    EXIF の向きを反映し、長辺を max_edge 以下に縮小して JPEG で再圧縮する。
+    撮影日時や位置情報などの EXIF は残す。サムネイルも合わせて作る。
+    """
+    with Image.open(io.BytesIO(data)) as src:
+        img = ImageOps.exif_transpose(src)
+        exif = img.getexif().tobytes() if img.getexif() else None
+        img = _to_rgb(img)
+        img.thumbnail((max_edge, max_edge), Image.LANCZOS)  # 縮小のみ（拡大はしない）
+        image_bytes = _save_jpeg(img, quality, exif)
+        thumb = img.copy()
+        thumb.thumbnail((thumbnail_edge, thumbnail_edge), Image.LANCZOS)
+        thumbnail_bytes = _save_jpeg(thumb, thumbnail_quality)
+    return {
+        "data": image_bytes,
+        "thumbnail": thumbnail_bytes,
+        "original_size": len(data),
+        "width": img.width,
+        "height": img.height,
+    }
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_image_pool():
+    """画像処理用のプロセスプール（プロセス全体で1つ）"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # Streamlit はマルチスレッドなので fork ではなく spawn で起動する
+            _pool = ProcessPoolExecutor(
+                max_workers=IMAGE_MAX_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return _pool
+
+
+def _normalize_or_error(data):
+    try:
+        return normalize_image(data)
+    except Exception as e:
+        return e
+
+
+def normalize_images(datas):
+    """
+    複数の写真をプロセスプールで並列に正規化する（結果は入力と同じ順番）。
+    写真ごとに処理し、失敗した写真は結果の位置に例外オブジェクトを入れる。
+    """
+    global _pool
+    if len(datas) <= 1:
+        return [_normalize_or_error(data) for data in datas]
+    pool = get_image_pool()
+    results = []
+    try:
+        futures = [pool.submit(normalize_image, data) for data in datas]
+        for future in futures:
+            try:
+                results.append(future.result())
+            except BrokenProcessPool:
+                raise
+            except Exception as e:
+                results.append(e)
+    except BrokenProcessPool:
+        # プールが壊れた場合は作り直させ、残りはこのプロセスで処理する
+        with _pool_lock:
+            if _pool is pool:
+                _pool = None
+        results += [_normalize_or_error(data) for data in datas[len(results) :]]
+    return results
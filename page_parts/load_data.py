@@ -1,59 +1,554 @@
 import streamlit as st
+import os
 import time
+import threading
+from datetime import datetime
+from types import MappingProxyType
+from zoneinfo import ZoneInfo
+from cachetools import LRUCache
 
+from metrics import measure
+from page_parts.fiscal_year import closing_date, current_fiscal_year, is_closed
+from page_parts.snapshot import (
+    SNAPSHOT_ENABLED,
+    SNAPSHOT_INTERVAL,
+    load_snapshot,
+    save_snapshot,
+)
+from storage.base import add_write_listener
 
-def get_all_data():
-    start_time = time.perf_counter()
-    client = st.session_state["cosmos_client"]
-    fy_value = "2025年度"
-    query = """
-    SELECT * FROM c
-    WHERE (
-        c.category IN ('user', 'order')
-        OR (
-            c.category IN ('trap', 'daily', 'result')
-            AND IS_DEFINED(c.fy)
-            AND c.fy = @fy
+# 除外するフィールド（_ts は差分取得の基準に使うので残す）
+EXCLUDE_FIELDS = {"_rid", "_self", "_etag", "_attachments"}
+
+# 共有データセットの有効期限（秒）
+DATASET_TTL = int(os.getenv("DATASET_TTL", "300"))
+# 保持する年度別データセットの数（最近表示されていない年度から捨てる）
+DATASET_CACHE_SEASONS = int(os.getenv("DATASET_CACHE_SEASONS", "3"))
+
+# category と戻り値のキーの対応
+CATEGORY_KEYS = {
+    "user": "users",
+    "trap": "traps",
+    "daily": "daily_reports",
+    "result": "catch_results",
+    "order": "orders",
+}
+
+# 全カテゴリ共通で取得するフィールド
+BASE_FIELDS = ("id", "category", "fy", "_ts")
+
+# カテゴリごとに一覧で使うフィールド（None は全フィールド）
+# ここに無いフィールドが必要な場合は get_detail で1件ずつ取得する
+CATEGORY_FIELDS = {
+    "user": None,
+    "order": None,
+    "trap": (
+        "trap_name",
+        "trap_type",
+        "status",
+        "latitude",
+        "longitude",
+        "start_date",
+        "end_date",
+    ),
+    "daily": ("status",),
+    "result": (
+        "result_id",
+        "result_seq",
+        "status",
+        "catch_date",
+        "sex",
+        "adult",
+        "latitude",
+        "longitude",
+        "reserved_by",
+        "reserved_at",
+        "user_name",
+        "trap_name",
+    ),
+}
+
+# 年度に関係なく全件読むカテゴリ
+GLOBAL_CATEGORIES = ("user", "order")
+# 年度（fy）で絞り込むカテゴリ
+FY_CATEGORIES = ("trap", "daily", "result")
+
+
+def build_fields(category):
+    """CATEGORY_FIELDS から取得するフィールドを組み立てる（None は全フィールド）"""
+    fields = CATEGORY_FIELDS.get(category)
+    if fields is None:
+        return None
+    return BASE_FIELDS + tuple(f for f in fields if f not in BASE_FIELDS)
+
+
+def project_item(item):
+    """変更フィードなどで受け取った完全なドキュメントを CATEGORY_FIELDS の形にそろえる"""
+    fields = CATEGORY_FIELDS.get(item.get("category"))
+    if fields is None:
+        return {k: v for k, v in item.items() if k not in EXCLUDE_FIELDS}
+    columns = BASE_FIELDS + fields
+    return {k: item[k] for k in columns if k in item}
+
+
+# 戻り値のキーから category を引く（ページの needs で使う）
+KEY_CATEGORIES = {key: category for category, key in CATEGORY_KEYS.items()}
+
+
+def resolve_needs(needs=None):
+    """
+    ページが宣言した依存データを category のタプルにする（None は全カテゴリ）。
+    needs: ["traps", ...] または {"traps": ["trap_name", ...], ...}
+    フィールドを指定した場合は、一覧で取得するフィールド（CATEGORY_FIELDS）に
+    含まれているかを確認する（無いものは get_detail で取得するか CATEGORY_FIELDS に足す）。
+    """
+    if needs is None:
+        return GLOBAL_CATEGORIES + FY_CATEGORIES
+    if not isinstance(needs, dict):
+        needs = {key: None for key in needs}
+    categories = []
+    for key, fields in needs.items():
+        if key not in KEY_CATEGORIES:
+            raise ValueError(f"不明なデータです: {key}")
+        category = KEY_CATEGORIES[key]
+        available = build_fields(category)
+        missing = [f for f in fields or () if available is not None and f not in available]
+        if missing:
+            raise ValueError(
+                f"{key} の一覧に含まれないフィールドです: {', '.join(missing)}"
+            )
+        categories.append(category)
+    return tuple(categories)
+
+
+def build_query_plans(fy, watermarks=None, categories=GLOBAL_CATEGORIES + FY_CATEGORIES):
+    """category（パーティションキー）ごとの単一パーティションクエリの条件を組み立てる"""
+    plans = {}
+    for category in categories:
+        plans[category] = {
+            "fy": fy if category in FY_CATEGORIES else None,
+            # 同一秒内の書き込みを取りこぼさないよう >= で取得（マージは冪等）
+            "since_ts": (watermarks or {}).get(category) or None,
+            "fields": build_fields(category),
+        }
+    return plans
+
+
+class DatasetSync:
+    """
+    _ts（最終更新時刻）を基準に差分だけ取得し、ローカルコピーへマージする。
+    カテゴリごとに watermark を持ち、必要になったカテゴリだけ読み込む。
+    削除は差分に現れないため、削除を反映したい場合は full=True で取り直す。
+    """
+
+    def __init__(self, fy, categories):
+        self.fy = fy
+        self.categories = categories
+        self.watermarks = {}  # category -> _ts の最大値（読み込み済みのカテゴリだけ）
+        self.items = {}  # category -> {id: document}
+        self.lock = threading.Lock()
+
+    def is_loaded(self, category):
+        return category in self.watermarks
+
+    def sync(self, client, categories=None, full=False):
+        categories = self.categories if categories is None else categories
+        with self.lock:
+            for category in categories:
+                if full or category not in self.watermarks:
+                    self.watermarks[category] = 0
+                    self.items[category] = {}
+            plans = build_query_plans(self.fy, self.watermarks, categories)
+            # カテゴリごとの所要時間は query_partitions が計測値として記録する
+            results, _ = client.query_partitions(plans)
+            count = 0
+            for category, items in results.items():
+                # 射影したカテゴリはシステムフィールドを含まないので除外処理を省く
+                projected = CATEGORY_FIELDS.get(category) is not None
+                for item in items:
+                    self.merge(item, filtered=projected)
+                count += len(items)
+            return count
+
+    def load(self, category, items, watermark):
+        """スナップショットなどから1カテゴリ分をまとめて読み込む"""
+        with self.lock:
+            self.watermarks[category] = 0
+            self.items[category] = {}
+            for item in items:
+                self.merge(item, filtered=True)
+            self.watermarks[category] = watermark
+
+    def merge(self, item, filtered=False):
+        if filtered:
+            filtered_item = item
+        else:
+            filtered_item = {k: v for k, v in item.items() if k not in EXCLUDE_FIELDS}
+        category = filtered_item.get("category")
+        # まだ読み込んでいないカテゴリは、最初の同期で全件取得させる
+        if category not in self.watermarks:
+            return
+        self.items[category][filtered_item["id"]] = filtered_item
+        self.watermarks[category] = max(
+            self.watermarks[category], filtered_item.get("_ts", 0)
         )
-    )
-    """
-    parameters = [{"name": "@fy", "value": fy_value}]
-    data = client.search_container_by_query(query, parameters)
-    end_time = time.perf_counter()
-    duration = end_time - start_time
-    # st.write(f"データ取得時間: {duration:.3f}秒")
-    # 除外するフィールド
-    exclude_fields = {"_rid", "_self", "_etag", "_attachments", "_ts"}
-
-    users = []
-    traps = []
-    daily_reports = []
-    catch_results = []
-    orders = []
-
-    for item in data:
-        # 除外フィールドを削除
-        filtered_item = {k: v for k, v in item.items() if k not in exclude_fields}
-        if filtered_item["category"] == "user":
-            users.append(filtered_item)
-        elif filtered_item["category"] == "trap":
-            traps.append(filtered_item)
-        elif filtered_item["category"] == "daily":
-            daily_reports.append(filtered_item)
-        elif filtered_item["category"] == "result":
-            catch_results.append(filtered_item)
-        elif filtered_item["category"] == "order":
-            orders.append(filtered_item)
 
+    def forget(self, records):
+        with self.lock:
+            for r in records:
+                self.items.get(r.get("category"), {}).pop(r.get("id"), None)
+
+    def by_category(self, categories=None):
+        """読み込み済みのカテゴリのドキュメント一覧"""
+        categories = self.categories if categories is None else categories
+        with self.lock:
+            return {
+                category: list(self.items[category].values())
+                for category in categories
+                if category in self.watermarks
+            }
+
+    def copy_state(self):
+        """保存用に、読み込み済みのカテゴリのドキュメント一覧と watermark を同時に取り出す"""
+        with self.lock:
+            by_category = {
+                category: list(self.items[category].values())
+                for category in self.categories
+                if category in self.watermarks
+            }
+            return by_category, dict(self.watermarks)
+
+    def partitioned(self, categories=None):
+        return {
+            CATEGORY_KEYS[category]: items
+            for category, items in self.by_category(categories).items()
+        }
+
+
+class SharedDataset:
+    """
+    プロセス全体で共有するデータセットのキャッシュ。
+    カテゴリごとに、初めて必要になったときに読み込み、以降は TTL 切れか
+    version が進んだ（書き込みがあった）ときだけ差分同期する。
+    各セッションにはカテゴリごとの読み取り専用のビューを渡す。
+    fy が None のものは年度に関係ないカテゴリ（ユーザーなど）を持つ。
+    締め済みの年度は一度読み込んだら再取得しない（変更フィードの反映だけ行う）。
+
+    同期した内容は Parquet のスナップショットに保存しておき、プロセスの起動直後は
+    スナップショットからすぐにビューを作って、差分の取得はバックグラウンドで行う。
+    締め済みの年度でも、締まる前に取ったスナップショットからは一度だけ差分を取得する。
+    （スナップショット以降の削除は反映されないので、必要なら force で取り直す）
+    """
+
+    def __init__(self, fy, categories=None, ttl=DATASET_TTL):
+        self.fy = fy
+        if categories is None:
+            categories = GLOBAL_CATEGORIES if fy is None else FY_CATEGORIES
+        self.categories = categories
+        self.sync_state = DatasetSync(fy, categories)
+        self.ttl = ttl
+        self.version = 0
+        self.loaded_versions = {}  # category -> 同期したときの version
+        self.loaded_at = {}  # category -> 同期した時刻
+        self.views = {}  # category -> 読み取り専用のドキュメント一覧
+        self.view_version = 0  # ビューを作り直すたびに増える（セッション側の更新検知用）
+        self.reconciling = set()  # スナップショットから復元した後、差分を取得中のカテゴリ
+        self.saved_at = None  # 最後にスナップショットを保存した時刻
+        self.source = None  # 読み込み元の保存先（StorageBackend.source）
+        self.taken_at = {}  # category -> 復元したスナップショットを取った時刻（UNIX 秒）
+        self.lock = threading.Lock()
+        self.version_lock = threading.Lock()
+        self.save_lock = threading.Lock()
+        self.saving = False  # スナップショットを保存するスレッドが動いているか
+        self.save_pending = False  # 保存中に次の保存が要求されたか
+
+    def invalidate(self):
+        with self.version_lock:
+            self.version += 1
+
+    @property
+    def closed(self):
+        return self.fy is not None and is_closed(self.fy)
+
+    def stale_categories(self, categories):
+        now = time.monotonic()
+        stale = []
+        for category in categories:
+            if category not in self.views:
+                stale.append(category)
+            elif self.closed:
+                continue
+            elif (
+                self.loaded_versions[category] != self.version
+                or now - self.loaded_at[category] > self.ttl
+            ):
+                stale.append(category)
+        return stale
+
+    def get(self, client, categories=None, force=False):
+        """categories（None は全カテゴリ）のビューを {戻り値のキー: ドキュメント一覧} で返す"""
+        categories = self.categories if categories is None else categories
+        # バックグラウンドで差分を取得している間は、復元したビューをそのまま返す
+        if (
+            not force
+            and self.reconciling.intersection(categories)
+            and all(category in self.views for category in categories)
+        ):
+            return self.view(categories)
+        # 同時アクセスしても取得は1回だけになるようロックする
+        with self.lock:
+            self.source = client.source
+            if not force:
+                missing = [c for c in categories if c not in self.views]
+                restored = self.restore(missing)
+                # 締め後に取ったスナップショットはそれだけで済ませ、
+                # それ以外は締め前の遅れた書き込みを取り込むため差分を取得する
+                reconcile = [c for c in restored if not self.sealed(c)]
+                if reconcile:
+                    self._reconcile_in_background(client, reconcile)
+            stale = list(categories) if force else self.stale_categories(categories)
+            if stale:
+                self._sync(client, stale, full=force)
+                self.save_snapshot()
+            return self.view(categories)
+
+    def view(self, categories=None):
+        categories = self.categories if categories is None else categories
+        return {
+            CATEGORY_KEYS[category]: self.views[category]
+            for category in categories
+            if category in self.views
+        }
+
+    def _sync(self, client, categories, full=False):
+        version = self.version
+        self.sync_state.sync(client, categories, full=full)
+        self._rebuild_view(categories)
+        now = time.monotonic()
+        for category in categories:
+            self.loaded_versions[category] = version
+            self.loaded_at[category] = now
+
+    def sealed(self, category):
+        """締め済みの年度で、締まった後に取ったスナップショットから復元したカテゴリか"""
+        if not self.closed or category not in self.taken_at:
+            return False
+        taken_on = datetime.fromtimestamp(
+            self.taken_at[category], ZoneInfo("Asia/Tokyo")
+        ).date()
+        return taken_on > closing_date(self.fy)
+
+    def restore(self, categories):
+        """スナップショットがあるカテゴリをそれで読み込み、読み込めたカテゴリを返す"""
+        if not SNAPSHOT_ENABLED:
+            return []
+        restored = []
+        for category in categories:
+            snapshot = load_snapshot(self.source, self.fy, category)
+            if snapshot is None:
+                continue
+            items, watermark, taken_at = snapshot
+            self.sync_state.load(category, items, watermark)
+            self.taken_at[category] = taken_at
+            restored.append(category)
+        if restored:
+            self._rebuild_view(restored)
+            now = time.monotonic()
+            for category in restored:
+                self.loaded_versions[category] = self.version
+                self.loaded_at[category] = now
+            self.saved_at = now
+        return restored
+
+    def _reconcile_in_background(self, client, categories):
+        self.reconciling.update(categories)
+
+        def run():
+            try:
+                with self.lock:
+                    self._sync(client, categories)
+                    self.save_snapshot(force=True)
+            except Exception as e:
+                print(f"スナップショット以降の差分を取得できませんでした: {e}")
+            finally:
+                self.reconciling.difference_update(categories)
+
+        threading.Thread(target=run, name="dataset-reconcile", daemon=True).start()
+
+    def save_snapshot(self, force=False):
+        """ローカルコピーをスナップショットに保存する（間隔を空けて、別スレッドで）"""
+        if not SNAPSHOT_ENABLED or self.source is None:
+            return
+        now = time.monotonic()
+        if not force and self.saved_at is not None and now - self.saved_at < SNAPSHOT_INTERVAL:
+            return
+        self.saved_at = now
+        with self.save_lock:
+            self.save_pending = True
+            # 保存中の場合は、そのスレッドが終わった後にもう一度保存する
+            if self.saving:
+                return
+            self.saving = True
+        threading.Thread(
+            target=self._write_snapshots, name="dataset-snapshot", daemon=True
+        ).start()
+
+    def _write_snapshots(self):
+        """保存の要求が無くなるまで、その時点のローカルコピーを保存する"""
+        while True:
+            with self.save_lock:
+                if not self.save_pending:
+                    self.saving = False
+                    return
+                self.save_pending = False
+            source = self.source
+            taken_at = time.time()
+            by_category, watermarks = self.sync_state.copy_state()
+            try:
+                for category, items in by_category.items():
+                    save_snapshot(
+                        source,
+                        self.fy,
+                        category,
+                        items,
+                        watermarks[category],
+                        taken_at,
+                    )
+            except Exception as e:
+                print(f"スナップショットを保存できませんでした: {e}")
+
+    def _rebuild_view(self, categories):
+        # 変わったカテゴリのビューだけ作り直す（他のカテゴリは同じオブジェクトのまま）
+        self.views.update(read_only_view(self.sync_state.by_category(categories)))
+        self.view_version += 1
+
+    def apply_changes(self, items):
+        """
+        変更フィードで受け取ったドキュメントをローカルコピーに反映する。
+        読み込み済みのカテゴリに関係するものが1件でもあればビューを作り直し、件数を返す。
+        """
+        relevant = [
+            project_item(item)
+            for item in items
+            if item.get("category") in self.categories
+            and (self.fy is None or item.get("fy") == self.fy)
+        ]
+        if not relevant:
+            return 0
+        with self.lock:
+            # まだ読み込んでいないカテゴリは、最初の同期で全件取得させる
+            relevant = [item for item in relevant if item["category"] in self.views]
+            if not relevant:
+                return 0
+            with self.sync_state.lock:
+                for item in relevant:
+                    self.sync_state.merge(item, filtered=True)
+            self._rebuild_view({item["category"] for item in relevant})
+        return len(relevant)
+
+
+def read_only_view(partitioned):
     return {
-        "users": users,
-        "traps": traps,
-        "daily_reports": daily_reports,
-        "catch_results": catch_results,
-        "orders": orders,
+        name: tuple(MappingProxyType(item) for item in items)
+        for name, items in partitioned.items()
     }
 
 
+_global_dataset = SharedDataset(None)
+# 年度別のデータセット（表示された年度だけ読み込み、古いものから捨てる）
+_season_datasets = LRUCache(maxsize=DATASET_CACHE_SEASONS)
+_shared_lock = threading.Lock()
+
+
+def get_global_dataset():
+    return _global_dataset
+
+
+def get_shared_dataset(fy):
+    with _shared_lock:
+        dataset = _season_datasets.get(fy)
+        if dataset is None:
+            dataset = _season_datasets[fy] = SharedDataset(fy)
+        return dataset
+
+
+def _all_datasets():
+    with _shared_lock:
+        return [_global_dataset] + list(_season_datasets.values())
+
+
+def invalidate_dataset(records=None, deleted=False):
+    """書き込みがあったことを共有データセットに知らせる"""
+    if records and not any(r.get("category") in CATEGORY_KEYS for r in records):
+        return  # データセットに含まれないカテゴリ（写真索引など）は無視する
+    for dataset in _all_datasets():
+        if deleted and records:
+            # 削除は差分同期に現れないのでローカルコピーから直接取り除く
+            dataset.sync_state.forget(records)
+        dataset.invalidate()
+
+
+add_write_listener(invalidate_dataset)
+
+
+def apply_changes_to_datasets(items):
+    """変更フィードのドキュメントを、読み込み済みの全てのデータセットに反映する"""
+    return sum(dataset.apply_changes(items) for dataset in _all_datasets())
+
+
+def _split_categories(categories):
+    global_categories = tuple(c for c in categories if c in GLOBAL_CATEGORIES)
+    season_categories = tuple(c for c in categories if c in FY_CATEGORIES)
+    return global_categories, season_categories
+
+
+def get_all_data(client=None, full=False, fy=None, needs=None):
+    """
+    共通データ（ユーザー・注文）と、選択中の年度のデータをまとめた読み取り専用ビュー。
+    needs（resolve_needs と同じ形式、None は全て）に含まれるデータだけを返し、
+    まだ読み込んでいないものはこのときに読み込む。
+    """
+    client = client or st.session_state["cosmos_client"]
+    fy = fy or st.session_state.get("fy") or current_fiscal_year()
+    global_categories, season_categories = _split_categories(resolve_needs(needs))
+    with measure("dataset", "get_all_data", detail=fy) as m:
+        data = {}
+        if global_categories:
+            data.update(_global_dataset.get(client, global_categories, force=full))
+        if season_categories:
+            season = get_shared_dataset(fy)
+            data.update(season.get(client, season_categories, force=full))
+        m.items = sum(len(items) for items in data.values())
+    return data
+
+
+def peek_all_data(fy, needs=None):
+    """読み込み済みのビューを同期せずに返す（まだ無いものがあれば None）"""
+    categories = resolve_needs(needs)
+    global_categories, season_categories = _split_categories(categories)
+    data = _global_dataset.view(global_categories)
+    data.update(get_shared_dataset(fy).view(season_categories))
+    if len(data) < len(categories):
+        return None
+    return data
+
+
+def same_view(a, b):
+    """2つのビューが同じ内容（カテゴリごとに同じオブジェクト）か"""
+    if a is None or b is None or a.keys() != b.keys():
+        return False
+    return all(a[key] is b[key] for key in a)
+
+
+def get_detail(category, item_id, client=None):
+    """一覧では省いているフィールドも含めて、1件分の完全なドキュメントを取得する"""
+    client = client or st.session_state["cosmos_client"]
+    item = client.read_item(item_id, category)
+    if item is None:
+        return None
+    return {k: v for k, v in item.items() if k not in EXCLUDE_FIELDS}
+
+
 if __name__ == "__main__":
     data = get_all_data()
     print(data)
@@ -0,0 +1,170 @@
+import asyncio
+import hashlib
+import os
+import threading
+import uuid
+from collections import OrderedDict
+
+from azure_.aio_loop import run_all, submit
+from azure_.one_drive import download_onedrive_to_file_async
+
+# 写真（サムネイル・元画像）のキャッシュの保存先
+PHOTO_CACHE_DIR = os.getenv("PHOTO_CACHE_DIR", ".cache/photos")
+# キャッシュの上限（MB）。超えたら最も長く使われていないものから消す
+PHOTO_CACHE_MAX_MB = int(os.getenv("PHOTO_CACHE_MAX_MB", "500"))
+# 同時にダウンロードするファイル数の上限
+PHOTO_FETCH_CONCURRENCY = int(os.getenv("PHOTO_FETCH_CONCURRENCY", "8"))
+
+
+def cache_key(content_hash, remote_path, variant=None):
+    """
+    キャッシュのキー。写真の SHA-256 を使い、同じ写真は別の報告に付いていても1回だけ取得する。
+    ハッシュが記録されていない古い写真は OneDrive 上のパスから作る。
+    """
+    key = content_hash or hashlib.sha256(remote_path.encode()).hexdigest()
+    return f"{key}_{variant}" if variant else key
+
+
+class PhotoCache:
+    """
+    OneDrive の写真をディスクに保存する、容量上限付きの LRU キャッシュ。
+    ダウンロードは共有イベントループ上で行い、同じキーの取得は1回にまとめる。
+    """
+
+    def __init__(
+        self, directory=PHOTO_CACHE_DIR, max_bytes=PHOTO_CACHE_MAX_MB * 1024 * 1024
+    ):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()  # key -> バイト数（古く使われた順）
+        self.total = 0
+        self.lock = threading.Lock()
+        self.pending = {}  # key -> 取得中の Task（ループの中からだけ触る）
+        self.semaphore = asyncio.Semaphore(PHOTO_FETCH_CONCURRENCY)
+        self._scan()
+
+    def _scan(self):
+        # 起動時に既存のファイルを最終使用時刻（mtime）の順に読み込む
+        os.makedirs(self.directory, exist_ok=True)
+        files = []
+        for entry in os.scandir(self.directory):
+            if not entry.is_file():
+                continue
+            if entry.name.endswith(".tmp"):
+                # 書きかけのまま終了したもの
+                os.remove(entry.path)
+                continue
+            stat = entry.stat()
+            files.append((stat.st_mtime, entry.name, stat.st_size))
+        with self.lock:
+            for _, key, size in sorted(files):
+                self.entries[key] = size
+                self.total += size
+            self._evict()
+
+    def path(self, key):
+        return os.path.join(self.directory, key)
+
+    def get(self, key):
+        """キャッシュにあればファイルパスを返す（最近使ったものとして記録する）"""
+        with self.lock:
+            if key not in self.entries:
+                return None
+            self.entries.move_to_end(key)
+        path = self.path(key)
+        try:
+            os.utime(path)  # 再起動後も使用順を引き継ぐ
+        except FileNotFoundError:
+            with self.lock:
+                self.total -= self.entries.pop(key, 0)
+            return None
+        return path
+
+    def _add(self, key, size):
+        with self.lock:
+            self.total += size - self.entries.pop(key, 0)
+            self.entries[key] = size
+            self._evict()
+
+    def _evict(self):
+        # 最後に追加した1件は上限を超えていても残す
+        while self.total > self.max_bytes and len(self.entries) > 1:
+            key, size = self.entries.popitem(last=False)
+            self.total -= size
+            try:
+                os.remove(self.path(key))
+            except FileNotFoundError:
+                pass
+
+    async def fetch(self, key, remote_path):
+        """
+        キャッシュから、無ければ OneDrive からストリーミングで取得する。
+        戻り値: (ファイルパス, None) or (None, エラーメッセージ)
+        """
+        path = self.get(key)
+        if path:
+            return path, None
+        task = self.pending.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._download(key, remote_path))
+            self.pending[key] = task
+            task.add_done_callback(lambda _: self.pending.pop(key, None))
+        # 取得を待っている1人がキャンセルしても、他の人の取得は続ける
+        return await asyncio.shield(task)
+
+    async def _download(self, key, remote_path):
+        path = self.path(key)
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        async with self.semaphore:
+            try:
+                result, error = await download_onedrive_to_file_async(
+                    remote_path, tmp_path
+                )
+            except Exception as e:
+                result, error = None, f"❌ ダウンロード失敗: {e}"
+        if error:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return None, error
+        os.replace(tmp_path, path)
+        self._add(key, result["size"])
+        return path, None
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_photo_cache():
+    """プロセスで共有する写真キャッシュ"""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = PhotoCache()
+        return _cache
+
+
+def fetch_photos(requests):
+    """
+    requests: [(キー, OneDrive上のパス)] を同時に取得する。
+    戻り値: requests と同じ順番の [(ファイルパス or None, エラーメッセージ or None)]
+    """
+    cache = get_photo_cache()
+    if not requests:
+        return []
+    return run_all(*(cache.fetch(key, remote_path) for key, remote_path in requests))
+
+
+def prefetch_photos(requests):
+    """キャッシュに無いものをバックグラウンドで取得しておく（完了を待たない）"""
+    cache = get_photo_cache()
+    missing = [(key, path) for key, path in requests if cache.get(key) is None]
+    if not missing:
+        return
+
+    async def gather():
+        await asyncio.gather(
+            *(cache.fetch(key, remote_path) for key, remote_path in missing)
+        )
+
+    submit(gather())
@@ -0,0 +1,106 @@
+import threading
+from datetime import datetime
+from zoneinfo import ZoneInfo
+from cachetools import LRUCache
+
+# ハッシュ索引のパーティションキー（ドキュメントの id がハッシュ値）
+INDEX_CATEGORY = "photo_hash"
+
+# 報告の category と写真の保存先フォルダの対応
+PHOTO_DIRECTORIES = {
+    "daily_file": "Apps_Images/daily_report",
+    "result_file": "Apps_Images/catch_result",
+}
+
+# 確認済みのハッシュをプロセス内に保持する（登録済みのものだけ）
+_known = LRUCache(maxsize=50000)
+_known_lock = threading.Lock()
+
+
+def lookup_photos(client, hashes):
+    """
+    ハッシュ値の一覧から登録済みの写真を探す。
+    戻り値: {hash: 索引ドキュメント}
+    """
+    found = {}
+    missing = []
+    with _known_lock:
+        for h in set(hashes):
+            if h in _known:
+                found[h] = _known[h]
+            else:
+                missing.append(h)
+    if missing:
+        # 単一パーティションへのクエリ1回でまとめて確認する
+        items = client.query(INDEX_CATEGORY, filters={"id": missing})
+        with _known_lock:
+            for item in items:
+                entry = _index_entry(item)
+                _known[item["id"]] = entry
+                found[item["id"]] = entry
+    return found
+
+
+def _index_entry(item):
+    return {
+        "id": item["id"],
+        "category": INDEX_CATEGORY,
+        "path": item["path"],
+        "thumbnail": item.get("thumbnail"),
+        "size": item.get("size"),
+        "registered_at": item.get("registered_at"),
+    }
+
+
+def make_index_entry(file_hash, path, thumbnail=None, size=None):
+    return {
+        "id": file_hash,
+        "category": INDEX_CATEGORY,
+        "path": path,
+        "thumbnail": thumbnail,
+        "size": size,
+        "registered_at": datetime.now(ZoneInfo("Asia/Tokyo")).strftime(
+            "%Y-%m-%d %H:%M:%S"
+        ),
+    }
+
+
+def register_photos(client, entries):
+    """アップロード済みの写真を索引に登録する"""
+    if not entries:
+        return None
+    report = client.bulk_upsert(entries)
+    ok_ids = {r["id"] for r in report["items"] if r["ok"]}
+    with _known_lock:
+        for entry in entries:
+            if entry["id"] in ok_ids:
+                _known[entry["id"]] = entry
+    return report
+
+
+def rebuild_photo_index(client):
+    """daily_file / result_file の images から索引を作り直す"""
+    entries = {}
+    for category, directory in PHOTO_DIRECTORIES.items():
+        for record in client.query(category, defined=("images",), fields=("images",)):
+            for image in record.get("images") or []:
+                file_hash = image.get("hash")
+                if not file_hash or image.get("uploaded") is False:
+                    continue
+                if file_hash in entries:
+                    continue
+                path = image.get("path") or f"{directory}/{image['name']}"
+                thumbnail = image.get("thumbnail")
+                if thumbnail and "/" not in thumbnail:
+                    thumbnail = f"{directory}/{thumbnail}"
+                entries[file_hash] = make_index_entry(
+                    file_hash, path, thumbnail, image.get("size")
+                )
+    return register_photos(client, list(entries.values()))
+
+
+if __name__ == "__main__":
+    from storage import get_storage
+
+    report = rebuild_photo_index(get_storage())
+    print(report and f"{report['succeeded']} 件登録 / {report['failed']} 件失敗")
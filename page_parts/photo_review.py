@@ -0,0 +1,163 @@
+import streamlit as st
+import os
+
+from page_parts.photo_cache import cache_key, fetch_photos, prefetch_photos
+from page_parts.photo_index import PHOTO_DIRECTORIES
+
+# 1ページに表示する報告の件数
+PHOTO_REVIEW_PAGE_SIZE = int(os.getenv("PHOTO_REVIEW_PAGE_SIZE", "10"))
+# 1行に並べるサムネイルの数
+PHOTO_REVIEW_COLUMNS = 4
+
+# 表示名と報告の category の対応
+REVIEW_CATEGORIES = {"作業日報": "daily_file", "捕獲実績": "result_file"}
+
+# 一覧で取得するフィールド
+REVIEW_FIELDS = ("id", "updata_date", "status", "images")
+
+
+def reset_photo_review(category):
+    st.session_state.photo_review_category = category
+    st.session_state.photo_review_pages = []  # [(records, 次ページの継続トークン)]
+    st.session_state.photo_review_index = 0
+    st.session_state.photo_review_full = None
+
+
+def load_review_page(category, continuation=None):
+    """写真付きの報告を新しい順に1ページ分読み込む"""
+    client = st.session_state["cosmos_client"]
+    return client.query_page(
+        category,
+        page_size=PHOTO_REVIEW_PAGE_SIZE,
+        continuation=continuation,
+        defined=("images",),
+        fields=REVIEW_FIELDS,
+        order_by="updata_date",
+        descending=True,
+    )
+
+
+def get_review_page(index):
+    """index 番目のページ（読み込んだページはセッションに残す）"""
+    pages = st.session_state.photo_review_pages
+    category = st.session_state.photo_review_category
+    while len(pages) <= index:
+        continuation = pages[-1][1] if pages else None
+        if pages and continuation is None:
+            return None
+        pages.append(load_review_page(category, continuation))
+    return pages[index]
+
+
+def review_images(records, category):
+    """報告の images を (報告, 写真, サムネイルのキー, サムネイルのパス) の一覧にする"""
+    directory = PHOTO_DIRECTORIES[category]
+    result = []
+    for record in records:
+        for image in record.get("images") or []:
+            if image.get("uploaded") is False:
+                continue
+            path = image.get("path") or f"{directory}/{image['name']}"
+            thumbnail = image.get("thumbnail")
+            if thumbnail:
+                if "/" not in thumbnail:
+                    thumbnail = f"{directory}/{thumbnail}"
+                key = cache_key(image.get("hash"), thumbnail, "thumb")
+            else:
+                # サムネイルの無い古い写真は元画像を表示する
+                thumbnail = path
+                key = cache_key(image.get("hash"), path)
+            result.append((record, image, key, thumbnail))
+    return result
+
+
+def original_request(image, category):
+    directory = PHOTO_DIRECTORIES[category]
+    path = image.get("path") or f"{directory}/{image['name']}"
+    return cache_key(image.get("hash"), path), path
+
+
+def show_full_image(category):
+    image = st.session_state.photo_review_full
+    path, error = fetch_photos([original_request(image, category)])[0]
+    with st.container(border=True):
+        st.markdown(f"**{image['name']}**")
+        if error:
+            st.error(error)
+        else:
+            st.image(path, use_container_width=True)
+        if st.button("閉じる", key="photo_review_close"):
+            st.session_state.photo_review_full = None
+            st.rerun()
+
+
+def show_photo_review():
+    st.subheader("写真の確認")
+    label = st.segmented_control(
+        "報告の種類",
+        list(REVIEW_CATEGORIES),
+        default="作業日報",
+        selection_mode="single",
+    )
+    category = REVIEW_CATEGORIES[label or "作業日報"]
+    if st.session_state.get("photo_review_category") != category:
+        reset_photo_review(category)
+    if st.button("最新の状態に更新"):
+        reset_photo_review(category)
+
+    index = st.session_state.photo_review_index
+    page = get_review_page(index)
+    if not page or not page[0]:
+        st.info("写真付きの報告はありません")
+        return
+    records, continuation = page
+
+    if st.session_state.photo_review_full is not None:
+        show_full_image(category)
+
+    # 表示するページのサムネイルだけを取得する（キャッシュに無いものは同時に取得）
+    images = review_images(records, category)
+    with st.spinner("写真を読み込み中..."):
+        fetched = fetch_photos([(key, path) for _, _, key, path in images])
+
+    current = None
+    for n, ((record, image, _, _), (path, error)) in enumerate(zip(images, fetched)):
+        # 報告ごとに見出しを付け、写真を横に並べる
+        if record is not current:
+            current = record
+            st.markdown(
+                f"**{record.get('updata_date', '')}**　{record.get('status', '')}"
+            )
+            columns = st.columns(PHOTO_REVIEW_COLUMNS)
+            position = 0
+        with columns[position % PHOTO_REVIEW_COLUMNS]:
+            if error:
+                st.caption(f"{image['name']}: {error}")
+            else:
+                st.image(path, caption=image["name"], use_container_width=True)
+            if st.button("元画像", key=f"photo_review_full_{index}_{n}"):
+                st.session_state.photo_review_full = image
+                st.rerun()
+        position += 1
+
+    col1, col2, col3 = st.columns([1, 2, 1])
+    with col1:
+        if index > 0 and st.button("前へ"):
+            st.session_state.photo_review_index -= 1
+            st.session_state.photo_review_full = None
+            st.rerun()
+    with col2:
+        st.caption(f"{index + 1} ページ目")
+    with col3:
+        if continuation and st.button("次へ"):
+            st.session_state.photo_review_index += 1
+            st.session_state.photo_review_full = None
+            st.rerun()
+
+    # 表示し終えてから次のページを読み込み、サムネイルをバックグラウンドで取得しておく
+    if continuation:
+        next_page = get_review_page(index + 1)
+        if next_page:
+            prefetch_photos(
+                [(key, path) for _, _, key, path in review_images(next_page[0], category)]
+            )
@@ -0,0 +1,183 @@
+import asyncio
+import hashlib
+import io
+import os
+from azure_.aio_loop import run_each
+from azure_.one_drive import upload_onedrive_async
+from page_parts.image_pipeline import normalize_images
+from page_parts.photo_index import lookup_photos, make_index_entry, register_photos
+
+# 同時にアップロードするファイル数の上限
+UPLOAD_MAX_WORKERS = int(os.getenv("UPLOAD_MAX_WORKERS", "4"))
+
+
+async def _limited(semaphore, coro):
+    async with semaphore:
+        return await coro
+
+
+def upload_files(jobs, max_workers=UPLOAD_MAX_WORKERS):
+    """
+    複数ファイルを共有イベントループ上で同時に OneDrive へアップロードする。
+    jobs: [(OneDrive上のパス, ファイル)]
+    戻り値: jobs と同じ順番の [(driveItem or None, エラーメッセージ or None)]
+    """
+    results = [None] * len(jobs)
+    if not jobs:
+        return results
+    semaphore = asyncio.Semaphore(max(1, min(max_workers, len(jobs))))
+    coros = [
+        _limited(semaphore, upload_onedrive_async(path, file)) for path, file in jobs
+    ]
+    for idx, result, error in run_each(coros):
+        results[idx] = (None, f"❌ アップロード失敗: {error}") if error else result
+    return results
+
+
+def apply_upload_results(images, results):
+    """
+    アップロード結果（成否・サイズ）を images の各要素に記録し、失敗したものを返す。
+    ハッシュが未設定の場合はアップロード時の読み込みで計算されたものを使う。
+    """
+    failed = []
+    for image, (result, error) in zip(images, results):
+        image["uploaded"] = error is None
+        if error:
+            image["error"] = error
+            failed.append(image)
+        else:
+            image["hash"] = image.get("hash") or result["sha256"]
+            image["size"] = result["size"]
+    return failed
+
+
+def prepare_photos(datas):
+    """
+    アップロード前に写真を正規化（向き補正・縮小・再圧縮・サムネイル作成）する。
+    画像として読めないファイルはそのファイルだけ元のまま送る。
+    """
+    try:
+        results = normalize_images(datas)
+    except Exception as e:
+        # プールを使えないなど、写真ごとの処理まで進めなかった場合
+        results = [e] * len(datas)
+    photos = []
+    for data, result in zip(datas, results):
+        if isinstance(result, Exception):
+            print(f"画像の正規化に失敗したため元のファイルを送ります: {result}")
+            result = {"data": data, "thumbnail": None, "original_size": len(data)}
+        photos.append(result)
+    return photos
+
+
+def process_photo_batch(
+    client,
+    datas,
+    filenames,
+    now_form1,
+    directory,
+    prefix,
+    upload=upload_files,
+    done=None,
+):
+    """
+    写真をまとめて正規化・アップロードし、(images, 失敗した写真) を返す。
+    元ファイルの SHA-256 で索引を確認し、登録済みの写真はアップロードせず既存のパスを使う。
+    各要素には名前・パス・ハッシュ・サイズ・サムネイル名・アップロード成否を記録する。
+    datas: 写真のバイト列  filenames: 元のファイル名（拡張子に使う）
+    done: {番号: image} 同じ送信の前回までの試行でアップロードできた写真（そのまま使う）
+    """
+    done = done or {}
+    hashes = [hashlib.sha256(data).hexdigest() for data in datas]
+    try:
+        known = lookup_photos(
+            client, [h for idx, h in enumerate(hashes) if idx not in done]
+        )
+    except Exception as e:
+        print(f"写真索引の確認に失敗しました: {e}")
+        known = {}
+
+    images = [None] * len(datas)
+    first_index = {}  # hash -> 今回初めて出てきた写真の番号
+    new_indexes = []
+    for idx, image in done.items():
+        images[idx] = image
+        first_index.setdefault(hashes[idx], idx)
+    for idx, file_hash in enumerate(hashes):
+        if idx in done:
+            continue
+        entry = known.get(file_hash)
+        if entry:
+            # 登録済みの写真は既存のファイルを参照する
+            images[idx] = {
+                "name": entry["path"].split("/")[-1],
+                "path": entry["path"],
+                "hash": file_hash,
+                "size": entry.get("size"),
+                "thumbnail": (entry.get("thumbnail") or "").split("/")[-1] or None,
+                "duplicate": True,
+                "uploaded": True,
+            }
+        elif file_hash not in first_index:
+            first_index[file_hash] = idx
+            new_indexes.append(idx)
+
+    prepared = prepare_photos([datas[idx] for idx in new_indexes])
+    jobs = []
+    thumb_jobs = []
+    for idx, photo in zip(new_indexes, prepared):
+        if photo["thumbnail"] is None:
+            ext = filenames[idx].split(".")[-1]
+        else:
+            ext = "jpg"
+        name = f"{prefix}-{now_form1}-{idx}.{ext}"
+        image = {
+            "name": name,
+            "path": f"{directory}/{name}",
+            "hash": hashes[idx],
+            "size": len(photo["data"]),
+            "original_size": photo["original_size"],
+            "thumbnail": None,
+        }
+        jobs.append((image["path"], io.BytesIO(photo["data"])))
+        if photo["thumbnail"] is not None:
+            thumb_name = f"{prefix}-{now_form1}-{idx}_thumb.jpg"
+            image["thumbnail"] = thumb_name
+            image["thumbnail_size"] = len(photo["thumbnail"])
+            thumb_jobs.append(
+                (image, (f"{directory}/{thumb_name}", io.BytesIO(photo["thumbnail"])))
+            )
+        images[idx] = image
+
+    # 本体とサムネイルをまとめて同時にアップロードする
+    new_images = [images[idx] for idx in new_indexes]
+    results = upload(jobs + [job for _, job in thumb_jobs])
+    failed = apply_upload_results(new_images, results[: len(jobs)])
+    for (image, _), (_, error) in zip(thumb_jobs, results[len(jobs) :]):
+        if error:
+            # サムネイルが失敗しても本体は有効なので名前だけ外す
+            image["thumbnail"] = None
+
+    # 同じ送信内で重複した写真は最初の写真の結果を参照する
+    for idx, file_hash in enumerate(hashes):
+        if images[idx] is None:
+            first = images[first_index[file_hash]]
+            images[idx] = dict(first, duplicate=True)
+
+    # アップロードできた写真を索引に登録する
+    entries = [
+        make_index_entry(
+            image["hash"],
+            image["path"],
+            f"{directory}/{image['thumbnail']}" if image["thumbnail"] else None,
+            image["size"],
+        )
+        for image in new_images
+        if image["uploaded"]
+    ]
+    try:
+        register_photos(client, entries)
+    except Exception as e:
+        print(f"写真索引の登録に失敗しました: {e}")
+
+    return images, failed
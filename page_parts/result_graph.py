@@ -3,26 +3,22 @@ import pandas as pd
 import pydeck as pdk
 import numpy as np
 import altair as alt
+from page_parts import spatial_cluster
+from page_parts.catch_stats import get_catch_stats
 
 
 def show_graph():
     st.subheader("捕獲統計")
 
-    if "catch_results" not in st.session_state:
-        st.warning("捕獲データがありません。")
-        return
-
-    df = pd.DataFrame(st.session_state["catch_results"])
-    if df.empty:
-        st.warning("捕獲データがありません。")
-        return
-
-    df = df[df["status"] == "registered"]
-    if df.empty:
+    # 年度ごとの集計ドキュメント（差分だけ反映済み）から表示する
+    client = st.session_state["cosmos_client"]
+    fy = st.session_state.fy
+    stats = get_catch_stats(client, fy)
+    if not stats["total"]:
         st.warning("登録済みの捕獲データがありません。")
         return
 
-    total_catch = len(df)
+    total_catch = stats["total"]
     st.markdown(f"### 総捕獲数: {total_catch}")
     st.markdown("---")
 
@@ -36,8 +32,10 @@ def show_graph():
     )
 
     if graph_type == "日付別捕獲数":
-        # 日付ごとに捕獲数を集計
-        count_by_date = df.groupby("catch_date").size().reset_index(name="捕獲数")
+        # 日付ごとの捕獲数
+        count_by_date = pd.DataFrame(
+            list(stats["daily"].items()), columns=["catch_date", "捕獲数"]
+        )
         # 日付でソート
         count_by_date["catch_date"] = pd.to_datetime(
             count_by_date["catch_date"]
@@ -68,10 +66,11 @@ def show_graph():
         st.altair_chart(chart, use_container_width=True)
 
     elif graph_type == "性別・成獣/幼獣別捕獲数":
-        # 'sex'と'adult'の組み合わせで捕獲数を集計
-        count_by_sex_adult = (
-            df.groupby(["sex", "adult"]).size().reset_index(name="捕獲数")
-        )
+        # 'sex'と'adult'の組み合わせごとの捕獲数
+        count_by_sex_adult = pd.DataFrame(
+            [key.split("|", 1) + [count] for key, count in stats["sex_adult"].items()],
+            columns=["sex", "adult", "捕獲数"],
+        ).sort_values(["sex", "adult"])
 
         # グラフ表示のためにカテゴリカルな組み合わせを作成
         count_by_sex_adult["性別・成獣/幼獣"] = (
@@ -119,23 +118,8 @@ def haversine(lat1, lon1, lat2, lon2):
 
 
 def cluster_points(df, threshold=50):
-    # 30m以内の地点をクラスタリング
-    clusters = []
-    used = set()
-    for idx, row in df.iterrows():
-        if idx in used:
-            continue
-        cluster = [idx]
-        lat1, lon1 = row["latitude"], row["longitude"]
-        for jdx, row2 in df.iterrows():
-            if jdx == idx or jdx in used:
-                continue
-            lat2, lon2 = row2["latitude"], row2["longitude"]
-            if haversine(lat1, lon1, lat2, lon2) <= threshold:
-                cluster.append(jdx)
-        used.update(cluster)
-        clusters.append(cluster)
-    return clusters
+    # 閾値[m]以内の地点をクラスタリング（グリッド索引による近傍探索）
+    return spatial_cluster.cluster_points(df, threshold=threshold)
 
 
 def show_map(width=400, height=400):
@@ -160,26 +144,20 @@ def show_map(width=400, height=400):
             return
 
         # クラスタリング
-        clusters = cluster_points(df, threshold=30)
-        cluster_data = []
-        for cluster in clusters:
-            members = df.loc[cluster]
-            count = len(members)
-            # 緯度経度の平均値を代表点とする
-            lat = members["latitude"].mean()
-            lon = members["longitude"].mean()
-            # 半径: 1個体=50, 2個体=80, 3個体=110, ...（例）
-            radius = 50 + (count - 1) * 30
-            cluster_data.append(
-                {
-                    "latitude": lat,
-                    "longitude": lon,
-                    "count": count,
-                    "radius": radius,
-                    "tooltip": f"個体数: {count}\n捕獲日: {', '.join(members['catch_date'].unique())}",
-                }
-            )
-        cluster_df = pd.DataFrame(cluster_data)
+        summary = spatial_cluster.cluster_summary(df, threshold=30)
+        cluster_df = pd.DataFrame(
+            {
+                "latitude": summary["latitude"],
+                "longitude": summary["longitude"],
+                "count": summary["count"],
+                # 半径: 1個体=50, 2個体=80, 3個体=110, ...（例）
+                "radius": 50 + (summary["count"] - 1) * 30,
+                "tooltip": [
+                    f"個体数: {count}\n捕獲日: {', '.join(map(str, dates))}"
+                    for count, dates in zip(summary["count"], summary["catch_dates"])
+                ],
+            }
+        )
 
         # 色は単色（青）
         cluster_df["color"] = [[255, 0, 0, 180]] * len(cluster_df)
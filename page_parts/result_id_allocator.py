@@ -0,0 +1,162 @@
+import os
+import random
+import threading
+import time
+
+# 採番カウンタのパーティションキー
+COUNTER_CATEGORY = "counter"
+# 競合時の再試行回数
+MAX_RETRIES = 10
+RESULT_ID_PREFIX = "ﾀ-"
+
+
+def counter_id(fy):
+    return f"result_id-{fy}"
+
+
+def parse_result_number(rid):
+    """捕獲番号（"ﾀ-12" や旧フォーマットの "12"）から数値部分を取り出す"""
+    if isinstance(rid, str) and rid.startswith(RESULT_ID_PREFIX):
+        try:
+            return int(rid.split("-", 1)[1])
+        except ValueError:
+            return None
+    try:
+        return int(rid)
+    except Exception:
+        return None
+
+
+def format_result_id(number):
+    return f"{RESULT_ID_PREFIX}{number}"
+
+
+def _seed_counter(client, fy):
+    """
+    カウンタがまだ無い年度は、既存の捕獲番号を1回だけ走査して作る。
+    既存の番号の隙間は空き番号リストに入れる（従来の採番と同じく小さい番号から再利用）。
+    """
+    used = set()
+    for item in client.query(
+        "result", fy=fy, defined=("result_id",), fields=("result_id",)
+    ):
+        number = parse_result_number(item.get("result_id"))
+        if number is not None:
+            used.add(number)
+    next_number = max(used) + 1 if used else 1
+    body = {
+        "id": counter_id(fy),
+        "category": COUNTER_CATEGORY,
+        "fy": fy,
+        "next": next_number,
+        "free": [n for n in range(1, next_number) if n not in used],
+    }
+    # 同時に作られた場合は先に作られた方を使う
+    return client.create_item(body) or client.read_item(body["id"], COUNTER_CATEGORY)
+
+
+def _update_counter(client, fy, change):
+    """
+    カウンタを読み込み、change(counter) で書き換えて _etag 条件付きで置き換える。
+    競合した場合は読み直して再試行する。change の戻り値を返す。
+    """
+    for attempt in range(MAX_RETRIES):
+        counter = client.read_item(counter_id(fy), COUNTER_CATEGORY)
+        if counter is None:
+            counter = _seed_counter(client, fy)
+        body = {k: v for k, v in counter.items() if not k.startswith("_")}
+        result = change(body)
+        if client.replace_item_if_match(body, counter["_etag"]) is not None:
+            return result
+        time.sleep(random.uniform(0.05, 0.2) * (attempt + 1))
+    raise RuntimeError("捕獲番号の採番が混み合っています。もう一度お試しください。")
+
+
+def reserve_result_numbers(client, fy, num=1):
+    """
+    捕獲番号を num 個確保する。空き番号（小さい順）を優先し、足りない分は連番で払い出す。
+    カウンタの読み込みと置き換えの2回のポイント操作で済む。
+    """
+
+    def take(counter):
+        free = sorted(counter.get("free", []))
+        numbers = free[:num]
+        counter["free"] = free[num:]
+        next_number = counter["next"]
+        while len(numbers) < num:
+            numbers.append(next_number)
+            next_number += 1
+        counter["next"] = next_number
+        return numbers
+
+    return _update_counter(client, fy, take)
+
+
+def release_result_numbers(client, fy, numbers):
+    """使われなかった捕獲番号を空き番号リストに戻す"""
+    if not numbers:
+        return []
+
+    def give_back(counter):
+        free = set(counter.get("free", []))
+        free.update(n for n in numbers if n < counter["next"])
+        counter["free"] = sorted(free)
+        return counter["free"]
+
+    return _update_counter(client, fy, give_back)
+
+
+# result_seq の無いレコードを確認する間隔（秒）
+RESULT_SEQ_CHECK_INTERVAL = int(os.getenv("RESULT_SEQ_CHECK_INTERVAL", "300"))
+
+_seq_checked_at = {}  # fy -> 最後に確認した時刻
+_backfill_lock = threading.Lock()
+
+
+def _set_result_seq(client, item_id):
+    """1件に result_seq を _etag 条件付きで書き足す（他の更新と競合したら読み直す）"""
+    for _ in range(MAX_RETRIES):
+        item = client.read_item(item_id, "result")
+        if item is None or "result_seq" in item:
+            return False
+        number = parse_result_number(item.get("result_id"))
+        if number is None:
+            return False
+        body = {k: v for k, v in item.items() if not k.startswith("_")}
+        body["result_seq"] = number
+        if client.replace_item_if_match(body, item["_etag"]) is not None:
+            return True
+    return False
+
+
+def ensure_result_seq(client, fy):
+    """
+    result_seq（捕獲番号の数値部分）が無いレコードに値を補う。
+    一覧をサーバー側で番号順に並べるために使う。
+    アプリの外で書かれたレコードにも補えるよう、年度ごとに一定間隔で確認する。
+    戻り値: 補った件数
+    """
+    with _backfill_lock:
+        now = time.monotonic()
+        checked_at = _seq_checked_at.get(fy)
+        if checked_at is not None and now - checked_at < RESULT_SEQ_CHECK_INTERVAL:
+            return 0
+        # 対象の id だけを取得し、書き足すときに1件ずつ読み直す
+        items = client.query(
+            "result",
+            fy=fy,
+            defined=("result_id",),
+            undefined=("result_seq",),
+            fields=("id",),
+        )
+        filled = 0
+        failed = False
+        for item in items:
+            try:
+                filled += _set_result_seq(client, item["id"])
+            except Exception as e:
+                print(f"result_seq を補えませんでした: {item['id']}: {e}")
+                failed = True
+        if not failed:
+            _seq_checked_at[fy] = now  # 失敗があれば次回もう一度試す
+        return filled
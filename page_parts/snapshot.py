@@ -0,0 +1,92 @@
+import hashlib
+import json
+import os
+import threading
+import time
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from page_parts.fiscal_year import start_year
+
+# スナップショットの保存先
+SNAPSHOT_DIR = os.getenv("SNAPSHOT_DIR", ".cache/snapshots")
+# 0 でスナップショットを使わない
+SNAPSHOT_ENABLED = os.getenv("SNAPSHOT_ENABLED", "1") != "0"
+# 同期のたびに保存しないよう、保存の間隔（秒）を空ける
+SNAPSHOT_INTERVAL = int(os.getenv("SNAPSHOT_INTERVAL", "300"))
+
+# ファイル形式を変えたら上げる（古いスナップショットは読まずに取り直す）
+SNAPSHOT_FORMAT = b"3"
+# ドキュメントは1行1つの JSON 文字列としてこの列に保存する
+# （列に展開すると、無いキーが null になったり int が float になったりして元に戻らない）
+JSON_COLUMN = "_json"
+
+
+def snapshot_path(source, fy, category):
+    """
+    保存先（StorageBackend.source）ごとに分けたスナップショットのパス。
+    SQLite やベンチマークのデータを、Cosmos DB のアプリが読み込まないようにする。
+    """
+    store = hashlib.sha256(source.encode()).hexdigest()[:16]
+    season = "global" if fy is None else f"fy{start_year(fy)}"
+    return os.path.join(SNAPSHOT_DIR, store, season, f"{category}.parquet")
+
+
+def _to_table(items):
+    return pa.table(
+        {
+            JSON_COLUMN: pa.array(
+                [json.dumps(item, ensure_ascii=False) for item in items], pa.string()
+            )
+        }
+    )
+
+
+def save_snapshot(source, fy, category, items, watermark, taken_at=None):
+    """
+    1カテゴリ分のドキュメントを、_ts の最大値（watermark）と一緒に Parquet へ保存する。
+    taken_at: ドキュメントを取り出した時刻（UNIX 秒）。締め後に取ったものかの判定に使う
+    """
+    path = snapshot_path(source, fy, category)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    table = _to_table(items)
+    table = table.replace_schema_metadata(
+        {
+            **(table.schema.metadata or {}),
+            b"sat.format": SNAPSHOT_FORMAT,
+            b"sat.source": source.encode(),
+            b"sat.watermark": str(watermark).encode(),
+            b"sat.taken_at": str(taken_at or time.time()).encode(),
+        }
+    )
+    # 書きかけのファイルを読まないよう、一時ファイルに書いてから置き換える
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    pq.write_table(table, tmp_path)
+    os.replace(tmp_path, path)
+
+
+def load_snapshot(source, fy, category):
+    """
+    メモリマップでスナップショットを読み込む。
+    戻り値: (items, watermark, 取った時刻)。
+    無い・読めない・形式が古い・別の保存先のものの場合は None
+    """
+    path = snapshot_path(source, fy, category)
+    if not os.path.exists(path):
+        return None
+    try:
+        table = pq.read_table(path, memory_map=True)
+    except (OSError, pa.ArrowException) as e:
+        print(f"スナップショットを読み込めませんでした: {path}: {e}")
+        return None
+    metadata = table.schema.metadata or {}
+    if metadata.get(b"sat.format") != SNAPSHOT_FORMAT:
+        return None
+    if metadata.get(b"sat.source") != source.encode():
+        print(f"別の保存先のスナップショットのため使いません: {path}")
+        return None
+    watermark = int(metadata.get(b"sat.watermark", b"0"))
+    taken_at = float(metadata.get(b"sat.taken_at", b"0"))
+    items = [json.loads(s) for s in table.column(JSON_COLUMN).to_pylist()]
+    return items, watermark, taken_at
@@ -0,0 +1,105 @@
+import numpy as np
+import pandas as pd
+
+EARTH_RADIUS = 6371000  # 地球半径[m]
+# グリッドの1セルを閾値よりわずかに大きくして、近傍セルの取りこぼしを防ぐ
+CELL_MARGIN = 1.01
+
+
+def haversine_vec(lat1, lon1, lat2, lon2):
+    # 緯度経度から距離（メートル）を計算（配列対応）
+    phi1 = np.radians(lat1)
+    phi2 = np.radians(lat2)
+    dphi = np.radians(lat2 - lat1)
+    dlambda = np.radians(lon2 - lon1)
+    a = np.sin(dphi / 2) ** 2 + np.cos(phi1) * np.cos(phi2) * np.sin(dlambda / 2) ** 2
+    return 2 * EARTH_RADIUS * np.arcsin(np.sqrt(a))
+
+
+def _build_grid(lat, lon, valid, threshold):
+    """各地点を閾値以上の大きさのセルに割り当てる"""
+    cell_lat = np.degrees(threshold / EARTH_RADIUS) * CELL_MARGIN
+    max_abs_lat = np.abs(lat[valid]).max() if valid.any() else 0.0
+    # 高緯度ほど経度1度の距離が短いので、最も高緯度の地点に合わせてセルを広げる
+    cos_lat = max(np.cos(np.radians(min(max_abs_lat, 89.0))), 1e-6)
+    cell_lon = cell_lat / cos_lat
+    grid = {}
+    cx = np.zeros(len(lat), dtype=np.int64)
+    cy = np.zeros(len(lat), dtype=np.int64)
+    cx[valid] = np.floor(lat[valid] / cell_lat).astype(np.int64)
+    cy[valid] = np.floor(lon[valid] / cell_lon).astype(np.int64)
+    for i in np.flatnonzero(valid):
+        grid.setdefault((cx[i], cy[i]), []).append(i)
+    return grid, cx, cy
+
+
+def cluster_labels(lat, lon, threshold=50):
+    """
+    閾値[m]以内の地点をまとめ、地点ごとのクラスタ番号を返す。
+    先頭から順に未所属の地点を代表点とし、代表点から閾値以内の未所属地点を同じクラスタにする
+    （従来の cluster_points と同じ規則）。近傍セルの地点だけ距離を計算するのでほぼ線形時間。
+    """
+    lat = np.asarray(lat, dtype=float)
+    lon = np.asarray(lon, dtype=float)
+    n = len(lat)
+    labels = np.full(n, -1, dtype=np.int64)
+    valid = ~(np.isnan(lat) | np.isnan(lon))
+    grid, cx, cy = _build_grid(lat, lon, valid, threshold)
+
+    next_label = 0
+    for i in range(n):
+        if labels[i] >= 0:
+            continue
+        labels[i] = next_label
+        if valid[i]:
+            neighbors = [
+                grid.get((cx[i] + dx, cy[i] + dy), ())
+                for dx in (-1, 0, 1)
+                for dy in (-1, 0, 1)
+            ]
+            candidates = np.fromiter(
+                (j for cell in neighbors for j in cell), dtype=np.int64
+            )
+            candidates = candidates[labels[candidates] < 0]
+            if len(candidates):
+                distances = haversine_vec(
+                    lat[i], lon[i], lat[candidates], lon[candidates]
+                )
+                labels[candidates[distances <= threshold]] = next_label
+        next_label += 1
+    return labels
+
+
+def cluster_points(df, threshold=50):
+    """
+    DataFrame の latitude / longitude をクラスタリングし、
+    クラスタごとのインデックスのリストを返す（代表点が先頭、残りは行の順）。
+    """
+    labels = cluster_labels(df["latitude"], df["longitude"], threshold)
+    clusters = [[] for _ in range(labels.max() + 1 if len(labels) else 0)]
+    for index, label in zip(df.index, labels):
+        clusters[label].append(index)
+    return clusters
+
+
+def cluster_summary(df, threshold=50):
+    """
+    クラスタごとの代表点（緯度経度の平均）・個体数・捕獲日の一覧を DataFrame で返す。
+    """
+    if df.empty:
+        return pd.DataFrame(columns=["latitude", "longitude", "count", "catch_dates"])
+    work = df.assign(_cluster=cluster_labels(df["latitude"], df["longitude"], threshold))
+    grouped = work.groupby("_cluster", sort=True)
+    summary = grouped.agg(
+        latitude=("latitude", "mean"),
+        longitude=("longitude", "mean"),
+        count=("latitude", "size"),
+    )
+    if "catch_date" in work.columns:
+        summary["catch_dates"] = grouped["catch_date"].agg(
+            lambda s: list(pd.unique(s))
+        )
+    else:
+        summary["catch_dates"] = [[] for _ in range(len(summary))]
+    return summary.reset_index(drop=True)
+
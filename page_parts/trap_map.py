@@ -53,19 +53,8 @@ map_style_options = {
 }
 
 
-def trap_map(width=400, height=400, mode="稼働中", multi_select="multi-object"):
-    trap_data = st.session_state.traps
-    # trap_data = sample_trap_data() # デバッグ用のサンプルデータ
-
-    if not trap_data:
-        st.warning("トラップデータがありません。")
-        return
-    map_style_label = st.selectbox(
-        "地図のスタイルを選択してください",
-        options=list(map_style_options.keys()),
-        index=0,
-    )
-    map_style_url = map_style_options[map_style_label]
+def build_trap_frame(trap_data, mode="稼働中"):
+    """わなの一覧を地図表示用のデータフレームにする（状態で絞り込み、色を付ける）"""
     # データをデータフレームに変換
     trap_data = pd.DataFrame(trap_data)
 
@@ -80,6 +69,23 @@ def trap_map(width=400, height=400, mode="稼働中", multi_select="multi-object
             trap_data.at[idx, "color"] = [0, 0, 255, 160]  # 青色
         elif row["status"] == "撤去済み":
             trap_data.at[idx, "color"] = [225, 0, 0, 160]  # 赤色
+    return trap_data
+
+
+def trap_map(width=400, height=400, mode="稼働中", multi_select="multi-object"):
+    trap_data = st.session_state.traps
+    # trap_data = sample_trap_data() # デバッグ用のサンプルデータ
+
+    if not trap_data:
+        st.warning("トラップデータがありません。")
+        return
+    map_style_label = st.selectbox(
+        "地図のスタイルを選択してください",
+        options=list(map_style_options.keys()),
+        index=0,
+    )
+    map_style_url = map_style_options[map_style_label]
+    trap_data = build_trap_frame(trap_data, mode)
 
     layer = pdk.Layer(
         "ScatterplotLayer",
@@ -161,5 +167,5 @@ def trap_map(width=400, height=400, mode="稼働中", multi_select="multi-object
     if st.session_state.selected_objects:
         for p in st.session_state.selected_objects["map"]:
             print(
-                f"trap_name: {p["trap_name"]} / 北緯(lat): {round(p["latitude"],5)} / 東経(lon): {round(p["longitude"],5)}"
+                f"trap_name: {p['trap_name']} / 北緯(lat): {round(p['latitude'],5)} / 東経(lon): {round(p['longitude'],5)}"
             )
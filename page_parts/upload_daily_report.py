@@ -1,43 +1,10 @@
 import streamlit as st
 from datetime import datetime
-from azure_.one_drive import upload_onedrive
+from page_parts.upload_queue import show_submission_status, submit_report
 import uuid
-import hashlib
 from zoneinfo import ZoneInfo
 
 
-def get_file_hash(file, algo="sha256"):
-    """アップロードファイルのハッシュ値を返す"""
-    hash_func = hashlib.new(algo)
-    file.seek(0)
-    for chunk in iter(lambda: file.read(8192), b""):
-        hash_func.update(chunk)
-    file.seek(0)
-    return hash_func.hexdigest()
-
-
-def file_upload_daily(uploaded_files, now_form1, directory):
-    images = []
-    for idx, file in enumerate(uploaded_files):
-        ext = file.name.split(".")[-1]
-        name = f"Dialy-{now_form1}-{idx}.{ext}"
-        file_hash = get_file_hash(file)
-
-        upload_onedrive(f"{directory}/{name}", file)
-        images.append({"name": name, "hash": file_hash})
-    return {"images": images}
-
-
-def submit_data(data):
-    client = st.session_state["cosmos_client"]
-    try:
-        client.upsert_to_container(data)
-    except Exception as e:
-        st.error(f"CosmosDB登録エラー: {e}")
-        return
-    st.success("送信完了")
-
-
 def upsert_daily_report():
     st.subheader("作業日報")
     with st.form(key="daily_report"):
@@ -59,21 +26,19 @@ def upsert_daily_report():
                     st.error(msg)
                 return
 
-        with st.spinner("写真を送信中...", show_time=True):
-            print("Dialy: 送信処理開始")
-            if uploaded_files:
-                now = datetime.now(ZoneInfo("Asia/Tokyo"))
-                now_form1 = now.strftime("%Y%m%d-%H%M%S")
-                now_form2 = now.strftime("%Y-%m-%d %H:%M:%S")
-                image_list = file_upload_daily(
-                    uploaded_files, now_form1, "Apps_Images/daily_report"
-                )
-                data = {
-                    "id": str(uuid.uuid4()),
-                    "updata_date": now_form2,
-                    "status": "Unprocessed",
-                    "category": "daily_file",
-                }
-                data.update(image_list)
-                submit_data(data)
-                st.session_state.report_submitted = False
+        # 写真の送信と登録はバックグラウンドで行い、すぐに受付を返す
+        print("Dialy: 送信受付")
+        now = datetime.now(ZoneInfo("Asia/Tokyo"))
+        data = {
+            "id": str(uuid.uuid4()),
+            "updata_date": now.strftime("%Y-%m-%d %H:%M:%S"),
+            "status": "Unprocessed",
+            "category": "daily_file",
+        }
+        submit_report(
+            data, uploaded_files, "Apps_Images/daily_report", "Dialy", "作業日報"
+        )
+        st.success("受け付けました。写真はバックグラウンドで送信します")
+        st.session_state.report_submitted = False
+
+    show_submission_status()
@@ -0,0 +1,377 @@
+import streamlit as st
+import json
+import os
+import queue
+import shutil
+import threading
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+
+from tenacity import (
+    Retrying,
+    retry_if_exception_type,
+    retry_if_result,
+    stop_after_attempt,
+    wait_exponential,
+)
+
+from metrics import measure
+from page_parts.photo_upload import process_photo_batch
+from storage import get_storage
+
+# 送信内容（写真と登録内容）を保存するディレクトリ
+SPOOL_DIR = os.getenv("SPOOL_DIR", ".cache/spool")
+# 送信を処理するワーカーの数
+SPOOL_WORKERS = int(os.getenv("SPOOL_WORKERS", "2"))
+# 写真のアップロード・Cosmos DB への登録それぞれの試行回数
+SPOOL_MAX_ATTEMPTS = int(os.getenv("SPOOL_MAX_ATTEMPTS", "5"))
+# 完了した送信を状況一覧に残す時間
+SPOOL_KEEP_HOURS = int(os.getenv("SPOOL_KEEP_HOURS", "24"))
+# 状況一覧を更新する間隔（秒）
+SPOOL_STATUS_INTERVAL = 3
+
+JOURNAL_FILE = "journal.jsonl"
+SUBMISSION_FILE = "submission.json"
+# アップロードできた写真の結果（再試行で同じ写真を送り直さないため）
+UPLOADED_FILE = "uploaded.json"
+
+# 状態と表示名
+STATE_LABELS = {
+    "queued": "待機中",
+    "uploading": "写真を送信中",
+    "writing": "登録中",
+    "done": "完了",
+    "failed": "失敗",
+}
+# 処理が終わっていない状態（再起動時に送り直す）
+PENDING_STATES = ("queued", "uploading", "writing")
+
+
+def _now():
+    return datetime.now(ZoneInfo("Asia/Tokyo"))
+
+
+class Spool:
+    """
+    報告の送信内容をローカルに保存し、バックグラウンドのワーカーで OneDrive と保存先に送る。
+    送信ごとのディレクトリに写真と submission.json を置き、状態の変化は journal.jsonl に追記する。
+    プロセスが再起動しても、終わっていない送信は journal から読み直して送り直す。
+    """
+
+    def __init__(
+        self,
+        directory=SPOOL_DIR,
+        client=None,
+        workers=SPOOL_WORKERS,
+        max_attempts=SPOOL_MAX_ATTEMPTS,
+        wait=wait_exponential(multiplier=2, max=60),
+    ):
+        self.directory = directory
+        self.client = client
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.wait = wait
+        self.states = {}  # id -> 最新の journal の記録
+        self.queue = queue.Queue()
+        self.lock = threading.Lock()
+        self.threads = []
+        os.makedirs(directory, exist_ok=True)
+        self._load_journal()
+
+    @property
+    def journal_path(self):
+        return os.path.join(self.directory, JOURNAL_FILE)
+
+    def submission_dir(self, submission_id):
+        return os.path.join(self.directory, submission_id)
+
+    def submit(self, doc, files, photo_directory, prefix, label, image_fields=None):
+        """
+        送信内容を保存してワーカーに渡す（アップロードの完了は待たない）。
+        doc: 登録するドキュメント（images 以外。id は送信の id にもなる）
+        files: [(元のファイル名, バイト列)]
+        image_fields: images の各要素に追加する項目
+        戻り値: 送信の id
+        """
+        submission_id = doc["id"]
+        # 書きかけの送信を読まないよう、一時ディレクトリに書いてから置き換える
+        tmp_dir = self.submission_dir(submission_id) + ".tmp"
+        os.makedirs(tmp_dir, exist_ok=True)
+        for n, (_, data) in enumerate(files):
+            with open(os.path.join(tmp_dir, str(n)), "wb") as f:
+                f.write(data)
+        submission = {
+            "doc": doc,
+            "filenames": [name for name, _ in files],
+            "photo_directory": photo_directory,
+            "prefix": prefix,
+            "now_form1": _now().strftime("%Y%m%d-%H%M%S"),
+            "image_fields": image_fields or {},
+        }
+        with open(os.path.join(tmp_dir, SUBMISSION_FILE), "w", encoding="utf-8") as f:
+            json.dump(submission, f, ensure_ascii=False)
+        os.replace(tmp_dir, self.submission_dir(submission_id))
+        self._record(
+            submission_id,
+            "queued",
+            label=label,
+            photos=len(files),
+            submitted_at=_now().strftime("%Y-%m-%d %H:%M:%S"),
+            attempts=0,
+            error=None,
+        )
+        self.queue.put(submission_id)
+        return submission_id
+
+    def _record(self, submission_id, state, **fields):
+        with self.lock:
+            entry = {
+                **self.states.get(submission_id, {}),
+                **fields,
+                "id": submission_id,
+                "state": state,
+                "updated_at": _now().strftime("%Y-%m-%d %H:%M:%S"),
+            }
+            self.states[submission_id] = entry
+            with open(self.journal_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+        return entry
+
+    def _load_journal(self):
+        """journal を読み直し、終わっていない送信を待ち行列に戻す（古い記録は消す）"""
+        try:
+            with open(self.journal_path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue  # 書き込み途中で終了した行
+                    self.states[entry["id"]] = entry
+        except FileNotFoundError:
+            pass
+
+        expire = (_now() - timedelta(hours=SPOOL_KEEP_HOURS)).strftime(
+            "%Y-%m-%d %H:%M:%S"
+        )
+        for submission_id, entry in list(self.states.items()):
+            if entry["state"] == "done" and entry["updated_at"] < expire:
+                del self.states[submission_id]
+            elif entry["state"] in PENDING_STATES:
+                if os.path.isdir(self.submission_dir(submission_id)):
+                    entry["state"] = "queued"
+                    self.queue.put(submission_id)
+                else:
+                    entry.update(state="failed", error="送信内容が見つかりません")
+        # 一時ディレクトリや記録の無い送信を片付ける
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if os.path.isdir(path) and name not in self.states:
+                shutil.rmtree(path, ignore_errors=True)
+        # 最新の状態だけを残して journal を書き直す
+        tmp_path = self.journal_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for entry in self.states.values():
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        os.replace(tmp_path, self.journal_path)
+
+    def start(self):
+        if not self.threads:
+            for n in range(max(1, self.workers)):
+                thread = threading.Thread(
+                    target=self._work, name=f"upload-spool-{n}", daemon=True
+                )
+                thread.start()
+                self.threads.append(thread)
+        return self
+
+    def _work(self):
+        while True:
+            submission_id = self.queue.get()
+            try:
+                self.process(submission_id)
+            except Exception as e:
+                print(f"送信 {submission_id} を処理できませんでした: {e}")
+                self._record(submission_id, "failed", error=str(e))
+            finally:
+                self.queue.task_done()
+
+    def process(self, submission_id):
+        """写真をアップロードしてからドキュメントを登録する（それぞれ失敗したら再試行）"""
+        client = self.client or get_storage()
+        path = self.submission_dir(submission_id)
+        with open(os.path.join(path, SUBMISSION_FILE), encoding="utf-8") as f:
+            submission = json.load(f)
+        datas = []
+        for n in range(len(submission["filenames"])):
+            with open(os.path.join(path, str(n)), "rb") as f:
+                datas.append(f.read())
+
+        label = self.states[submission_id].get("label")
+        with measure("spool", "process", detail=label) as m:
+            m.items = len(datas)
+            self._record(submission_id, "uploading")
+            images, failed = self._retrying(
+                submission_id,
+                lambda: self._upload_photos(client, path, submission, datas),
+                # 失敗した写真がある間は送り直す（送れた写真は前回の結果を使う）
+                retry_result=lambda result: bool(result[1]),
+            )
+            m.retries = self.states[submission_id]["attempts"]
+            if failed:
+                # 写真が揃うまで登録せず、送信内容を残して再送信できるようにする
+                names = ", ".join(image["name"] for image in failed)
+                self._record(
+                    submission_id, "failed", error=f"送信できなかった写真: {names}"
+                )
+                return
+            for image in images:
+                image.update(submission["image_fields"])
+
+            self._record(submission_id, "writing")
+            doc = dict(submission["doc"], images=images)
+            self._retrying(submission_id, lambda: client.upsert_to_container(doc))
+            m.retries = self.states[submission_id]["attempts"]
+
+        # 全ての写真と登録が済んだものだけ送信内容を消す
+        self._record(submission_id, "done", error=None)
+        shutil.rmtree(path, ignore_errors=True)
+
+    def _upload_photos(self, client, path, submission, datas):
+        """
+        まだ送れていない写真をアップロードし、送れた写真の結果を uploaded.json に保存する。
+        前回までに送れた写真は保存した結果をそのまま使う（索引で重複扱いにしない）。
+        """
+        uploaded_path = os.path.join(path, UPLOADED_FILE)
+        try:
+            with open(uploaded_path, encoding="utf-8") as f:
+                done = {int(n): image for n, image in json.load(f).items()}
+        except FileNotFoundError:
+            done = {}
+        images, failed = process_photo_batch(
+            client,
+            datas,
+            submission["filenames"],
+            submission["now_form1"],
+            submission["photo_directory"],
+            submission["prefix"],
+            done=done,
+        )
+        uploaded = {str(n): image for n, image in enumerate(images) if image["uploaded"]}
+        tmp_path = uploaded_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(uploaded, f, ensure_ascii=False)
+        os.replace(tmp_path, uploaded_path)
+        return images, failed
+
+    def _retrying(self, submission_id, func, retry_result=None):
+        """
+        func を最大 max_attempts 回試す。例外は最後まで失敗したら送出する。
+        retry_result が真を返す結果は再試行し、最後まで変わらなければその結果を返す。
+        """
+        retry = retry_if_exception_type(Exception)
+        if retry_result is not None:
+            retry = retry | retry_if_result(retry_result)
+
+        def before_sleep(state):
+            if state.outcome.failed:
+                error = str(state.outcome.exception())
+            else:
+                error = "一部の写真を送信できませんでした"
+            entry = self.states[submission_id]
+            self._record(
+                submission_id,
+                entry["state"],
+                attempts=entry.get("attempts", 0) + 1,
+                error=error,
+            )
+
+        retrying = Retrying(
+            stop=stop_after_attempt(self.max_attempts),
+            wait=self.wait,
+            retry=retry,
+            before_sleep=before_sleep,
+            retry_error_callback=lambda state: state.outcome.result(),
+        )
+        return retrying(func)
+
+    def retry(self, submission_id):
+        """失敗した送信を待ち行列に戻す"""
+        entry = self.states.get(submission_id)
+        if entry is None or entry["state"] != "failed":
+            return False
+        if not os.path.isdir(self.submission_dir(submission_id)):
+            return False
+        self._record(submission_id, "queued", error=None)
+        self.queue.put(submission_id)
+        return True
+
+    def status(self, ids=None):
+        """送信の状態の一覧（新しい順）"""
+        with self.lock:
+            entries = [
+                dict(entry)
+                for entry in self.states.values()
+                if ids is None or entry["id"] in ids
+            ]
+        entries.sort(key=lambda e: e.get("submitted_at", ""), reverse=True)
+        return entries
+
+
+_spool = None
+_spool_lock = threading.Lock()
+
+
+def start_upload_spool():
+    """サーバープロセスごとに1つだけ送信のワーカーを開始する"""
+    global _spool
+    with _spool_lock:
+        if _spool is None:
+            _spool = Spool().start()
+        return _spool
+
+
+def submit_report(
+    doc, uploaded_files, photo_directory, prefix, label, image_fields=None
+):
+    """報告を送信の待ち行列に入れ、このセッションの送信として覚えておく"""
+    files = [(file.name, file.getvalue()) for file in uploaded_files]
+    submission_id = start_upload_spool().submit(
+        doc, files, photo_directory, prefix, label, image_fields
+    )
+    st.session_state.setdefault("spool_ids", []).append(submission_id)
+    return submission_id
+
+
+@st.fragment(run_every=SPOOL_STATUS_INTERVAL)
+def show_submission_status():
+    """送信状況の一覧（このセッションの送信。チェックで最近の全ての送信）"""
+    spool = start_upload_spool()
+    show_all = st.checkbox("他の人の送信も表示", key="spool_show_all")
+    ids = None if show_all else set(st.session_state.get("spool_ids", []))
+    entries = spool.status(ids)
+    if not entries:
+        return
+    st.markdown("#### 送信状況")
+    for entry in entries:
+        state = entry["state"]
+        col1, col2 = st.columns([4, 1])
+        with col1:
+            text = (
+                f"{entry.get('submitted_at', '')}　{entry.get('label', '')}"
+                f"（写真 {entry.get('photos', 0)} 枚）: {STATE_LABELS[state]}"
+            )
+            if entry.get("attempts"):
+                text += f"（再試行 {entry['attempts']} 回）"
+            if state == "failed":
+                st.error(f"{text}\n\n{entry.get('error') or ''}")
+            elif state == "done":
+                st.success(text)
+            else:
+                st.info(text)
+        with col2:
+            retry_key = f"spool_retry_{entry['id']}"
+            if state == "failed" and st.button("再送信", key=retry_key):
+                spool.retry(entry["id"])
+                st.rerun(scope="fragment")
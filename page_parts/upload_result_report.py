@@ -1,9 +1,7 @@
 import streamlit as st
 from datetime import datetime
-from azure_.one_drive import upload_onedrive
-from page_parts.upload_daily_report import submit_data
+from page_parts.upload_queue import show_submission_status, submit_report
 import uuid
-import hashlib
 from zoneinfo import ZoneInfo
 
 説明テキスト = """次の写真を撮影してアップロードしてください
@@ -43,52 +41,24 @@ def upsert_catch_result():
                         st.error(msg)
                     return
 
-                with st.spinner("写真を送信中...", show_time=True):
-                    print("Result: 送信処理開始")
-                    now = datetime.now(ZoneInfo("Asia/Tokyo"))
-                    now_form1 = now.strftime("%Y%m%d-%H%M%S")
-                    now_form2 = now.strftime("%Y-%m-%d %H:%M:%S")
-                    image_list = file_upload_daily(
-                        uploaded_file, now_form1, "Apps_Images/catch_result"
-                    )
-                    data = {
-                        "id": str(uuid.uuid4()),
-                        "updata_date": now_form2,
-                        "status": "Unprocessed",
-                        "category": "result_file",
-                    }
-                    data.update(image_list)
-                    submit_data(data)
-                    st.session_state.report_submitted = False
+                # 写真の送信と登録はバックグラウンドで行い、すぐに受付を返す
+                print("Result: 送信受付")
+                now = datetime.now(ZoneInfo("Asia/Tokyo"))
+                data = {
+                    "id": str(uuid.uuid4()),
+                    "updata_date": now.strftime("%Y-%m-%d %H:%M:%S"),
+                    "status": "Unprocessed",
+                    "category": "result_file",
+                }
+                submit_report(
+                    data,
+                    uploaded_file,
+                    "Apps_Images/catch_result",
+                    "Result",
+                    "捕獲実績",
+                    image_fields={"type": None},
+                )
+                st.success("受け付けました。写真はバックグラウンドで送信します")
+                st.session_state.report_submitted = False
 
-
-def get_file_hash(file, algo="sha256"):
-    """アップロードファイルのハッシュ値を返す"""
-    hash_func = hashlib.new(algo)
-    file.seek(0)
-    for chunk in iter(lambda: file.read(8192), b""):
-        hash_func.update(chunk)
-    file.seek(0)
-    return hash_func.hexdigest()
-
-
-def file_upload_daily(uploaded_files, now_form1, directory):
-    images = []
-    for idx, file in enumerate(uploaded_files):
-        ext = file.name.split(".")[-1]
-        name = f"Result-{now_form1}-{idx}.{ext}"
-        file_hash = get_file_hash(file)
-
-        upload_onedrive(f"{directory}/{name}", file)
-        images.append({"name": name, "hash": file_hash, "type": None})
-    return {"images": images}
-
-
-def submit_data(data):
-    client = st.session_state["cosmos_client"]
-    try:
-        client.upsert_to_container(data)
-    except Exception as e:
-        st.error(f"CosmosDB登録エラー: {e}")
-        return
-    st.success("送信完了")
+    show_submission_status()
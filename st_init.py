@@ -1,12 +1,23 @@
 import streamlit as st
 import pandas as pd
+import os
 from functools import wraps
 
-from page_parts.load_data import get_all_data
-from azure_.cosmosdb import CosmosDBClient
+from page_parts.load_data import (
+    CATEGORY_KEYS,
+    get_all_data,
+    peek_all_data,
+    resolve_needs,
+    same_view,
+)
+from page_parts.fiscal_year import available_fiscal_years, current_fiscal_year, is_closed
+from page_parts.change_feed import CHANGE_FEED_INTERVAL
+from metrics import measure
+from storage import get_storage
 
 
-def init():
+def init(needs=None):
+    """needs: ページが使うデータ（None は全て。形式は load_data.resolve_needs）"""
     print("INIT実行")
     if "selected_objects" not in st.session_state:
         st.session_state.selected_objects = ""
@@ -18,35 +29,68 @@ def init():
     if "user" not in st.session_state:
         st.session_state.user = None
     if "cosmos_client" not in st.session_state:
-        st.session_state["cosmos_client"] = CosmosDBClient()
-
-    if "users" not in st.session_state:
-        st.session_state.users = ""
-    if "traps" not in st.session_state:
-        st.session_state.traps = ""
-    if "daily_reports" not in st.session_state:
-        st.session_state.daily_reports = ""
-    if "catch_results" not in st.session_state:
-        st.session_state.catch_results = ""
-
-    if st.session_state["users"] == "":
-        data = get_all_data()
-        st.session_state.fy = "2025年度"
-        st.session_state.users = data["users"]
-        st.session_state.traps = data["traps"]
-        st.session_state.daily_reports = data["daily_reports"]
-        st.session_state.catch_results = data["catch_results"]
-        st.session_state.orders = data["orders"]
+        st.session_state["cosmos_client"] = get_storage()
+
+    season_selector()
+
+    # プロセス共有のデータセットから、ページが使うデータの読み取り専用ビューを受け取る
+    # （書き込みがあれば version が進み、次の init で差分同期される）
+    data = get_all_data(needs=needs)
+    if not same_view(st.session_state.get("data_view"), data):
+        st.session_state.data_view = data
+        for key in CATEGORY_KEYS.values():
+            if key in data:
+                st.session_state[key] = data[key]
 
     if "report_submitted" not in st.session_state:
         st.session_state.report_submitted = False
 
 
+def season_selector():
+    """サイドバーで表示する年度を選ぶ（初期値は今の年度）"""
+    seasons = available_fiscal_years()
+    if st.session_state.get("fy") not in seasons:
+        st.session_state.fy = current_fiscal_year()
+    st.session_state.fy = st.sidebar.selectbox(
+        "年度", seasons, index=seasons.index(st.session_state.fy)
+    )
+    if is_closed(st.session_state.fy):
+        st.sidebar.caption("締め済みの年度です（閲覧のみ）")
+
+
+@st.fragment(run_every=CHANGE_FEED_INTERVAL or None)
+def watch_data_version(needs=None):
+    # ページが使うデータが変更フィードで更新されたらページ全体を再実行する
+    view = peek_all_data(st.session_state.fy, needs)
+    if view is not None and not same_view(view, st.session_state.get("data_view")):
+        st.rerun()
+
+
 # デコレーター化
-def with_init(func):
-    @wraps(func)
-    def wrapper(*args, **kwargs):
-        init()
-        return func(*args, **kwargs)
+def with_init(func=None, *, live=False, needs=None):
+    """
+    @with_init / @with_init(live=True, needs=["traps"]) のどちらでも使える。
+    needs にはページが使うデータ（"traps" など。{"traps": [フィールド]} も可）を宣言する。
+    宣言したデータだけを読み込み、st.session_state に入れる（省略時は全て）。
+    live=True のページは、他の人の登録がデータセットに反映されると自動で再表示される。
+    """
+    # 宣言の誤りはページの読み込み時に分かるようにする
+    resolve_needs(needs)
+
+    def decorator(func):
+        # ページごとの表示時間を診断ページで見られるように記録する
+        page = os.path.basename(func.__code__.co_filename)
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with measure("page", page):
+                init(needs)
+                if live and CHANGE_FEED_INTERVAL > 0:
+                    watch_data_version(needs)
+                return func(*args, **kwargs)
+
+        return wrapper
 
-    return wrapper
+    if func is not None:
+        return decorator(func)
+    return decorator
@@ -0,0 +1,43 @@
+import os
+import threading
+
+from storage.base import StorageBackend, add_write_listener
+
+# 保存先: cosmos（既定）/ sqlite
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "cosmos").lower()
+
+_shared_sqlite = None
+_shared_sqlite_lock = threading.Lock()
+
+
+def get_storage(shared=True) -> StorageBackend:
+    """
+    環境変数 STORAGE_BACKEND で選んだ保存先を返します。
+    shared=False は変更フィードの監視スレッドなど、専用の接続が欲しい場合に使います。
+    """
+    if STORAGE_BACKEND == "sqlite":
+        from storage.sqlite_store import SQLiteStorage
+
+        if not shared:
+            return SQLiteStorage()
+        global _shared_sqlite
+        with _shared_sqlite_lock:
+            if _shared_sqlite is None:
+                _shared_sqlite = SQLiteStorage()
+            return _shared_sqlite
+    if STORAGE_BACKEND == "cosmos":
+        from azure_.cosmosdb import CosmosDBClient
+
+        return CosmosDBClient(shared=shared)
+    raise ValueError(f"STORAGE_BACKEND が不正です: {STORAGE_BACKEND}")
+
+
+def warm_up():
+    """Cosmos DB の場合だけ、接続を前もって確立しておく"""
+    if STORAGE_BACKEND == "cosmos":
+        from azure_.cosmosdb import warm_up_cosmos
+
+        warm_up_cosmos()
+
+
+__all__ = ["StorageBackend", "add_write_listener", "get_storage", "warm_up"]
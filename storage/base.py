@@ -0,0 +1,144 @@
+import os
+import re
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+
+from metrics import measure
+
+# パーティション単位の並列クエリで使うスレッド数の上限
+QUERY_MAX_WORKERS = int(os.getenv("COSMOSDB_QUERY_MAX_WORKERS", "5"))
+
+# クエリで指定できるフィールド名（SQL に埋め込むため英数字と _ のみ）
+FIELD_PATTERN = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+
+# 書き込み時に呼ばれるコールバック（データキャッシュの無効化などに使う）
+_write_listeners = []
+
+
+def add_write_listener(listener):
+    """書き込み（upsert/delete）のたびに listener(records, deleted) を呼び出す"""
+    if listener not in _write_listeners:
+        _write_listeners.append(listener)
+
+
+def notify_write(records, deleted=False):
+    for listener in _write_listeners:
+        listener(records, deleted)
+
+
+def check_field(name):
+    if not FIELD_PATTERN.match(name):
+        raise ValueError(f"フィールド名が不正です: {name}")
+    return name
+
+
+class StorageBackend(ABC):
+    """
+    データ保存先の共通インターフェース（抽象メソッドを全て実装しないと作れない）。
+    ドキュメントは category（パーティションキー）と id で識別し、
+    書き込みのたびに _ts（秒）と _etag が更新される。
+
+    query / query_page の条件:
+      fy: 年度で絞り込む
+      filters: {field: 値} は一致、{field: [値, ...]} はいずれかに一致
+      defined / undefined: フィールドの有無で絞り込む
+      since_ts: _ts がこの値以上のものだけ
+      fields: 取得するフィールド（None は全フィールド）
+      order_by / descending: 並び順
+    """
+
+    @property
+    @abstractmethod
+    def source(self):
+        """保存先を識別する文字列（スナップショットがどの保存先のものかの照合に使う）"""
+
+    @abstractmethod
+    def upsert_to_container(self, data):
+        ...
+
+    @abstractmethod
+    def bulk_upsert(
+        self,
+        records: list,
+        partition_key_field: str = "category",
+        max_workers: int = QUERY_MAX_WORKERS,
+    ):
+        """
+        複数レコードをまとめて登録します（max_workers は同時に送るバッチ数の上限）。
+        戻り値: {"items": [{id, category, ok, status_code, request_charge, error}],
+                 "succeeded": 件数, "failed": 件数, "request_charge": 合計RU}
+        """
+
+    @abstractmethod
+    def read_item(self, item_id: str, partition_key: str):
+        ...
+
+    @abstractmethod
+    def create_item(self, body: dict):
+        ...
+
+    @abstractmethod
+    def replace_item_if_match(self, body: dict, etag: str):
+        ...
+
+    @abstractmethod
+    def write_batch_if_match(self, items: list, partition_key: str):
+        ...
+
+    @abstractmethod
+    def delete_item_from_container(self, item_id: str, category: str):
+        ...
+
+    @abstractmethod
+    def query(
+        self,
+        category: str,
+        fy: str = None,
+        filters: dict = None,
+        defined: tuple = (),
+        undefined: tuple = (),
+        since_ts: int = None,
+        fields: tuple = None,
+        order_by: str = None,
+        descending: bool = False,
+    ):
+        ...
+
+    @abstractmethod
+    def query_page(
+        self,
+        category: str,
+        page_size: int = 100,
+        continuation: str = None,
+        **conditions,
+    ):
+        """戻り値: (items, 次ページの継続トークン or None)"""
+
+    @abstractmethod
+    def read_change_feed(self, continuation: str = None, start_time=None):
+        """戻り値: (変更されたドキュメント, 次回の継続トークン)"""
+
+    def query_partitions(self, plans: dict, max_workers: int = QUERY_MAX_WORKERS):
+        """
+        category（パーティションキー）ごとのクエリを並列実行します。
+        plans: {category: query の条件（dict）}
+        戻り値: ({category: [items]}, {category: 所要秒数})
+        カテゴリごとの所要時間は診断ページにも記録します。
+        """
+
+        def run(category):
+            with measure("storage", "query_partition", detail=category) as m:
+                items = self.query(category, **plans[category])
+                m.items = len(items)
+            return items, m.duration
+
+        results = {}
+        timings = {}
+        if not plans:
+            return results, timings
+        workers = max(1, min(max_workers, len(plans)))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = {category: executor.submit(run, category) for category in plans}
+            for category, future in futures.items():
+                results[category], timings[category] = future.result()
+        return results, timings
@@ -0,0 +1,362 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime
+
+from storage.base import StorageBackend, check_field, notify_write
+
+# インデックス列として持つフィールド（それ以外は JSON から取り出す）
+INDEXED_FIELDS = ("fy", "status", "result_id", "catch_date")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+    category TEXT NOT NULL,
+    id TEXT NOT NULL,
+    fy TEXT,
+    status TEXT,
+    result_id TEXT,
+    catch_date TEXT,
+    ts INTEGER NOT NULL,
+    seq INTEGER NOT NULL,
+    etag TEXT NOT NULL,
+    body TEXT NOT NULL,
+    PRIMARY KEY (category, id)
+);
+CREATE INDEX IF NOT EXISTS idx_documents_category_fy ON documents (category, fy);
+CREATE INDEX IF NOT EXISTS idx_documents_status ON documents (category, status);
+CREATE INDEX IF NOT EXISTS idx_documents_result_id ON documents (result_id);
+CREATE INDEX IF NOT EXISTS idx_documents_catch_date ON documents (catch_date);
+CREATE INDEX IF NOT EXISTS idx_documents_ts ON documents (category, ts);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_documents_seq ON documents (seq);
+CREATE TABLE IF NOT EXISTS counters (
+    name TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO counters (name, value)
+    SELECT 'seq', COALESCE(MAX(seq), 0) FROM documents;
+"""
+
+
+class SQLiteStorage(StorageBackend):
+    """
+    JSON ドキュメントを SQLite に保存する StorageBackend。
+    ローカルでのベンチマークや、小規模なオフライン運用向け。
+    """
+
+    def __init__(self, path=None):
+        self.path = path or os.getenv("SQLITE_PATH", ".cache/sat.db")
+        if self.path != ":memory:":
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        # トランザクションは _transaction で明示的に開始する
+        self.conn = sqlite3.connect(
+            self.path, check_same_thread=False, isolation_level=None
+        )
+        self.conn.row_factory = sqlite3.Row
+        self.lock = threading.RLock()
+        with self.lock:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            # executescript は実行前に COMMIT するので、スクリプトの中でトランザクションを張る
+            self.conn.executescript(f"BEGIN IMMEDIATE;{SCHEMA}COMMIT;")
+
+    @property
+    def source(self):
+        path = self.path if self.path == ":memory:" else os.path.abspath(self.path)
+        return f"sqlite:{path}"
+
+    @contextmanager
+    def _transaction(self):
+        """
+        書き込み用のトランザクション（ロックは呼び出し側で取る）。
+        BEGIN IMMEDIATE で開始するので、同じファイルを開いている他の
+        インスタンスやプロセスとも書き込みが直列になる。
+        """
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield
+        except BaseException:
+            self.conn.execute("ROLLBACK")
+            raise
+        self.conn.execute("COMMIT")
+
+    def _next_seq(self):
+        # 連番はファイル内の counters で採番する（削除されても同じ値は再利用しない）
+        self.conn.execute("UPDATE counters SET value = value + 1 WHERE name = 'seq'")
+        return self._current_seq()
+
+    def _current_seq(self):
+        row = self.conn.execute(
+            "SELECT value FROM counters WHERE name = 'seq'"
+        ).fetchone()
+        return row[0]
+
+    # --- 書き込み ---
+
+    def _write(self, body, etag=None, create=False):
+        """1件書き込む（ロックとトランザクションは呼び出し側で取る）。競合時は None"""
+        category = body["category"]
+        current = self.conn.execute(
+            "SELECT etag FROM documents WHERE category = ? AND id = ?",
+            (category, body["id"]),
+        ).fetchone()
+        if create and current is not None:
+            return None
+        if etag is not None and (current is None or current["etag"] != etag):
+            return None
+        doc = {k: v for k, v in body.items() if k not in ("_ts", "_etag")}
+        doc["_ts"] = int(time.time())
+        doc["_etag"] = str(uuid.uuid4())
+        self.conn.execute(
+            "INSERT INTO documents"
+            " (category, id, fy, status, result_id, catch_date, ts, seq, etag, body)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"
+            " ON CONFLICT (category, id) DO UPDATE SET"
+            " fy = excluded.fy, status = excluded.status,"
+            " result_id = excluded.result_id, catch_date = excluded.catch_date,"
+            " ts = excluded.ts, seq = excluded.seq, etag = excluded.etag,"
+            " body = excluded.body",
+            (
+                category,
+                doc["id"],
+                *[_scalar(doc.get(f)) for f in INDEXED_FIELDS],
+                doc["_ts"],
+                self._next_seq(),
+                doc["_etag"],
+                json.dumps(doc, ensure_ascii=False),
+            ),
+        )
+        return doc
+
+    def upsert_to_container(self, data):
+        # データがリストの場合は複数レコードを登録
+        if isinstance(data, list):
+            self.bulk_upsert(data)
+            return f"{len(data)} 件のデータを登録しました"
+
+        # 単一レコードの場合
+        if "id" not in data:
+            data["id"] = str(uuid.uuid4())
+        with self.lock, self._transaction():
+            result = self._write(data)
+        notify_write([data])
+        return result
+
+    def bulk_upsert(
+        self,
+        records: list,
+        partition_key_field: str = "category",
+        max_workers: int = 1,
+    ):
+        # 1つのトランザクションで順番に書くので max_workers は使わない
+        items = []
+        with self.lock, self._transaction():
+            for record in records:
+                if "id" not in record:
+                    record["id"] = str(uuid.uuid4())
+                self._write(record)
+                items.append(
+                    {
+                        "id": record["id"],
+                        partition_key_field: record[partition_key_field],
+                        "ok": True,
+                        "status_code": 200,
+                        "request_charge": 0.0,
+                        "error": None,
+                    }
+                )
+        if records:
+            notify_write(records)
+        return {
+            "items": items,
+            "succeeded": len(items),
+            "failed": 0,
+            "request_charge": 0.0,
+        }
+
+    def create_item(self, body: dict):
+        with self.lock, self._transaction():
+            result = self._write(body, create=True)
+        if result is not None:
+            notify_write([body])
+        return result
+
+    def replace_item_if_match(self, body: dict, etag: str):
+        with self.lock, self._transaction():
+            result = self._write(body, etag=etag)
+        if result is not None:
+            notify_write([body])
+        return result
+
+    def write_batch_if_match(self, items: list, partition_key: str):
+        with self.lock:
+            try:
+                with self._transaction():
+                    responses = []
+                    for body, etag in items:
+                        doc = self._write(body, etag=etag, create=etag is None)
+                        if doc is None:
+                            # 1件でも競合したら全体を取り消す
+                            raise _Conflict()
+                        responses.append({"statusCode": 200, "eTag": doc["_etag"]})
+            except _Conflict:
+                return None
+        notify_write([body for body, _ in items])
+        return responses
+
+    def delete_item_from_container(self, item_id: str, category: str):
+        with self.lock, self._transaction():
+            self.conn.execute(
+                "DELETE FROM documents WHERE category = ? AND id = ?",
+                (category, item_id),
+            )
+        notify_write([{"id": item_id, "category": category}], deleted=True)
+        return f"id={item_id}, category={category} のレコードを削除しました"
+
+    # --- 読み込み ---
+
+    def read_item(self, item_id: str, partition_key: str):
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT body FROM documents WHERE category = ? AND id = ?",
+                (partition_key, item_id),
+            ).fetchone()
+        return json.loads(row["body"]) if row else None
+
+    def _build_where(
+        self,
+        category,
+        fy=None,
+        filters=None,
+        defined=(),
+        undefined=(),
+        since_ts=None,
+    ):
+        conditions = ["category = ?"]
+        parameters = [category]
+        if fy is not None:
+            conditions.append("fy = ?")
+            parameters.append(fy)
+        for field, value in (filters or {}).items():
+            column = _column(field)
+            if isinstance(value, (list, tuple, set)):
+                value = list(value)
+                if not value:
+                    conditions.append("0")
+                    continue
+                conditions.append(f"{column} IN ({', '.join('?' * len(value))})")
+                parameters.extend(_scalar(v) for v in value)
+            else:
+                conditions.append(f"{column} = ?")
+                parameters.append(_scalar(value))
+        for field in defined:
+            conditions.append(f"json_type(body, '$.{check_field(field)}') IS NOT NULL")
+        for field in undefined:
+            conditions.append(f"json_type(body, '$.{check_field(field)}') IS NULL")
+        if since_ts:
+            conditions.append("ts >= ?")
+            parameters.append(since_ts)
+        return " AND ".join(conditions), parameters
+
+    def _select(self, where, parameters, order_by, descending, limit=None, offset=0):
+        sql = f"SELECT body FROM documents WHERE {where}"
+        if order_by:
+            sql += f" ORDER BY {_column(order_by)} {'DESC' if descending else 'ASC'}"
+        if limit is not None:
+            sql += f" LIMIT {int(limit)} OFFSET {int(offset)}"
+        with self.lock:
+            rows = self.conn.execute(sql, parameters).fetchall()
+        return [json.loads(row["body"]) for row in rows]
+
+    def query(
+        self,
+        category: str,
+        fy: str = None,
+        filters: dict = None,
+        defined: tuple = (),
+        undefined: tuple = (),
+        since_ts: int = None,
+        fields: tuple = None,
+        order_by: str = None,
+        descending: bool = False,
+    ):
+        where, parameters = self._build_where(
+            category, fy, filters, defined, undefined, since_ts
+        )
+        items = self._select(where, parameters, order_by, descending)
+        return [_project(item, fields) for item in items]
+
+    def query_page(
+        self,
+        category: str,
+        page_size: int = 100,
+        continuation: str = None,
+        fields: tuple = None,
+        order_by: str = None,
+        descending: bool = False,
+        **conditions,
+    ):
+        # 継続トークンは読み込み済みの件数
+        offset = int(continuation or 0)
+        where, parameters = self._build_where(category, **conditions)
+        items = self._select(
+            where, parameters, order_by, descending, limit=page_size + 1, offset=offset
+        )
+        has_more = len(items) > page_size
+        items = [_project(item, fields) for item in items[:page_size]]
+        return items, str(offset + page_size) if has_more else None
+
+    def query_partitions(self, plans: dict, max_workers: int = 1):
+        # 接続は1本なので順番に実行する
+        return super().query_partitions(plans, max_workers=1)
+
+    def read_change_feed(self, continuation: str = None, start_time=None):
+        """seq（書き込み順の連番）を継続トークンにした変更フィード"""
+        with self.lock:
+            if continuation is not None:
+                since = int(continuation)
+            elif start_time == "Beginning":
+                since = 0
+            elif isinstance(start_time, datetime):
+                # 指定時刻より前に書き込まれた最後の位置から読む
+                row = self.conn.execute(
+                    "SELECT COALESCE(MAX(seq), 0) FROM documents WHERE ts < ?",
+                    (int(start_time.timestamp()),),
+                ).fetchone()
+                since = row[0]
+            else:
+                since = self._current_seq()
+            rows = self.conn.execute(
+                "SELECT seq, body FROM documents WHERE seq > ? ORDER BY seq", (since,)
+            ).fetchall()
+        items = [json.loads(row["body"]) for row in rows]
+        last = rows[-1]["seq"] if rows else since
+        return items, str(last)
+
+
+class _Conflict(Exception):
+    pass
+
+
+def _column(field):
+    field = check_field(field)
+    if field in ("id", "category") or field in INDEXED_FIELDS:
+        return field
+    if field == "_ts":
+        return "ts"
+    return f"json_extract(body, '$.{field}')"
+
+
+def _scalar(value):
+    # インデックス列には文字列・数値だけを入れる
+    if isinstance(value, (str, int, float)) or value is None:
+        return value
+    return json.dumps(value, ensure_ascii=False)
+
+
+def _project(item, fields):
+    if fields is None:
+        return item
+    return {k: item[k] for k in fields if k in item}
@@ -1,5 +1,16 @@
 # pip install streamlit
 import streamlit as st
+from storage import warm_up
+from page_parts.change_feed import start_change_feed
+from page_parts.upload_queue import start_upload_spool
+from page_parts.diagnostics import DIAGNOSTICS_ENABLED
+
+# 共有 CosmosClient を起動直後に準備しておく（2回目以降は何もしない）
+warm_up()
+# 変更フィードの読み込みをプロセスごとに1つだけ開始する
+start_change_feed()
+# 報告の送信を処理するワーカーを開始する（前回終わらなかった送信も送り直す）
+start_upload_spool()
 
 st.set_page_config(page_title="SAT App", layout="wide", page_icon="🐗")
 
@@ -14,8 +25,11 @@ pages = {
     "進捗": [
         st.Page("page/50_result_review.py", title="捕獲集計"),
         st.Page("page/51_traps_status.py", title="わな稼働状況"),
+        st.Page("page/60_photo_review.py", title="写真確認"),
     ],
 }
+if DIAGNOSTICS_ENABLED:
+    pages["管理"] = [st.Page("page/90_diagnostics.py", title="診断")]
 
 pg = st.navigation(pages)
 pg.run()
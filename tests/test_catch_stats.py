@@ -0,0 +1,91 @@
+import pytest
+
+from page_parts import catch_stats
+from storage.sqlite_store import SQLiteStorage
+
+FY = "2025年度"
+
+
+def make_result(i, user="山田"):
+    return {
+        "id": f"r{i}",
+        "category": "result",
+        "fy": FY,
+        "status": "registered",
+        "catch_date": f"2025-05-{i % 28 + 1:02d}",
+        "sex": "オス" if i % 2 else "メス",
+        "adult": "成獣",
+        "user_name": user,
+        "trap_name": f"わな{i % 7}",
+    }
+
+
+class CountingStorage(SQLiteStorage):
+    # 集計ドキュメントのバッチ書き込みの回数を数える
+    batches = 0
+
+    def write_batch_if_match(self, items, partition_key):
+        self.batches += 1
+        return super().write_batch_if_match(items, partition_key)
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    monkeypatch.setattr(catch_stats, "_members_cache", {})
+    monkeypatch.setattr(catch_stats, "_closed_stats", {})
+    return CountingStorage(str(tmp_path / "sat.db"))
+
+
+def test_refresh_splits_large_changes(client, monkeypatch):
+    client.bulk_upsert([make_result(i) for i in range(10)])
+    catch_stats.rebuild_catch_stats(client, FY)
+    client.bulk_upsert([make_result(i) for i in range(10, 200)])
+
+    # 数件ずつしか入らない上限にすると、何回かに分けて書く
+    monkeypatch.setattr(catch_stats, "BATCH_MAX_BYTES", 2000)
+    stats = catch_stats.refresh_catch_stats(client, FY)
+    assert client.batches > 1
+    assert stats["total"] == 200
+
+    saved = client.read_item(catch_stats.stats_id(FY), catch_stats.STATS_CATEGORY)
+    rebuilt = catch_stats.rebuild_catch_stats(client, FY)
+    for key in ("total", "daily", "sex_adult", "by_user", "by_trap"):
+        assert saved[key] == rebuilt[key]
+
+
+def test_rebuild_writes_members_in_bounded_batches(client, monkeypatch):
+    client.bulk_upsert([make_result(i) for i in range(100)])
+    sizes = []
+    bulk_upsert = client.bulk_upsert
+
+    def recording(records, *args, **kwargs):
+        sizes.append(sum(catch_stats._size(record) for record in records))
+        return bulk_upsert(records, *args, **kwargs)
+
+    monkeypatch.setattr(catch_stats, "BATCH_MAX_BYTES", 1000)
+    monkeypatch.setattr(client, "bulk_upsert", recording)
+    stats = catch_stats.rebuild_catch_stats(client, FY)
+
+    assert stats["total"] == 100
+    assert len(sizes) > 2
+    # 最後の集計ドキュメント以外は上限以下のバッチで書く
+    assert all(size <= 1000 for size in sizes[:-1])
+    for shard in range(catch_stats.MEMBER_SHARDS):
+        assert client.read_item(catch_stats.members_id(FY, shard), "aggregate")
+
+
+def test_rebuild_raises_when_write_fails(client, monkeypatch):
+    client.bulk_upsert([make_result(i) for i in range(5)])
+
+    def failing(records, *args, **kwargs):
+        return {
+            "items": [{"id": r["id"], "ok": False, "error": "413"} for r in records],
+            "succeeded": 0,
+            "failed": len(records),
+            "request_charge": 0.0,
+        }
+
+    monkeypatch.setattr(client, "bulk_upsert", failing)
+    with pytest.raises(RuntimeError):
+        catch_stats.rebuild_catch_stats(client, FY)
+    assert client.read_item(catch_stats.stats_id(FY), "aggregate") is None
@@ -0,0 +1,82 @@
+from page_parts.change_feed import (
+    ChangeFeedConsumer,
+    FileCheckpoint,
+    ListChangeFeedSource,
+    MemoryCheckpoint,
+)
+from page_parts.load_data import SharedDataset
+
+FY = "2025年度"
+
+
+def trap(trap_id, ts, **fields):
+    return {"id": trap_id, "category": "trap", "fy": FY, "_ts": ts, **fields}
+
+
+def test_consumer_applies_changes_in_order():
+    source = ListChangeFeedSource()
+    received = []
+    consumer = ChangeFeedConsumer(
+        source, apply=lambda items: received.extend(items) or len(items)
+    )
+    source.push(trap("t1", 1))
+    assert consumer.poll_once() == 1
+    source.push(trap("t2", 2))
+    assert consumer.poll_once() == 1
+    assert consumer.poll_once() == 0
+
+    assert [item["id"] for item in received] == ["t1", "t2"]
+    assert consumer.applied == 2
+    assert consumer.checkpoint.load() == "2"
+
+
+def test_consumer_resumes_from_checkpoint():
+    source = ListChangeFeedSource()
+    checkpoint = MemoryCheckpoint()
+    first = ChangeFeedConsumer(source, apply=len, checkpoint=checkpoint)
+    source.push(trap("t1", 1), trap("t2", 2))
+    first.poll_once()
+
+    # 再起動後は保存した継続トークンの続きから読む
+    source.push(trap("t3", 3))
+    received = []
+    second = ChangeFeedConsumer(
+        source,
+        apply=lambda items: received.extend(items) or len(items),
+        checkpoint=checkpoint,
+    )
+    assert second.poll_once() == 1
+    assert [item["id"] for item in received] == ["t3"]
+
+
+def test_file_checkpoint(tmp_path):
+    path = str(tmp_path / "feed" / "checkpoint.json")
+    assert FileCheckpoint(path).load() is None
+    FileCheckpoint(path).save("42")
+    assert FileCheckpoint(path).load() == "42"
+
+
+def test_shared_dataset_apply_changes():
+    dataset = SharedDataset(FY)
+    dataset.sync_state.load("trap", [trap("t1", 1, status="set")], 1)
+    dataset._rebuild_view(["trap"])
+    version = dataset.view_version
+
+    # 別の年度・まだ読み込んでいないカテゴリのものは反映しない
+    assert dataset.apply_changes([dict(trap("t9", 2), fy="2024年度")]) == 0
+    assert dataset.apply_changes([dict(trap("d1", 2), category="daily")]) == 0
+    assert dataset.view_version == version
+
+    source = ListChangeFeedSource()
+    consumer = ChangeFeedConsumer(source, apply=dataset.apply_changes)
+    source.push(trap("t1", 3, status="removed", memo="x"), trap("t2", 3, status="set"))
+    consumer.poll_once()
+
+    assert consumer.applied == 2
+    traps = {item["id"]: item for item in dataset.view(["trap"])["traps"]}
+    assert sorted(traps) == ["t1", "t2"]
+    assert traps["t1"]["status"] == "removed"
+    # 一覧に無いフィールドは射影して落とす
+    assert "memo" not in traps["t1"]
+    assert dataset.sync_state.watermarks["trap"] == 3
+    assert dataset.view_version > version
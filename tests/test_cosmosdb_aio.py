@@ -0,0 +1,31 @@
+import asyncio
+
+from azure_.cosmosdb_aio import AsyncCosmosDBClient
+
+
+class FakeClient(AsyncCosmosDBClient):
+    # Cosmos DB の代わりに、同時に実行中のクエリ数を数える
+    def __init__(self):
+        super().__init__("https://localhost", "a2V5")
+        self.active = 0
+        self.peak = 0
+
+    async def query(self, category, **conditions):
+        self.active += 1
+        self.peak = max(self.peak, self.active)
+        await asyncio.sleep(0.01)
+        self.active -= 1
+        return [{"id": category, "category": category}]
+
+
+def test_query_partitions_is_bounded():
+    client = FakeClient()
+    plans = {category: {} for category in ("user", "trap", "daily", "result", "order")}
+    results, timings = asyncio.run(client.query_partitions(plans, max_concurrency=2))
+
+    assert client.peak == 2
+    assert {category: items[0]["id"] for category, items in results.items()} == {
+        category: category for category in plans
+    }
+    assert set(timings) == set(plans)
+    assert all(seconds > 0 for seconds in timings.values())
@@ -0,0 +1,37 @@
+import pytest
+
+from page_parts.get_result_ids import issue_result_ids
+from page_parts.result_id_allocator import (
+    COUNTER_CATEGORY,
+    counter_id,
+    reserve_result_numbers,
+)
+from storage.sqlite_store import SQLiteStorage
+
+FY = "2025年度"
+
+
+class FailingStorage(SQLiteStorage):
+    # bulk_upsert が例外で終わる保存先（通信エラー・タイムアウトなど）
+    def bulk_upsert(self, records, *args, **kwargs):
+        raise ConnectionError("timeout")
+
+
+def test_numbers_are_released_when_bulk_upsert_raises(tmp_path):
+    client = FailingStorage(str(tmp_path / "sat.db"))
+    with pytest.raises(ConnectionError):
+        issue_result_ids(client, FY, num=3, user_name="山田")
+
+    counter = client.read_item(counter_id(FY), COUNTER_CATEGORY)
+    assert counter is not None
+    assert counter["free"] == [1, 2, 3]
+    # 戻した番号から再び払い出す
+    assert reserve_result_numbers(client, FY, 2) == [1, 2]
+
+
+def test_issue_result_ids(tmp_path):
+    client = SQLiteStorage(str(tmp_path / "sat.db"))
+    result_ids, report = issue_result_ids(client, FY, num=2, user_name="山田")
+    assert len(result_ids) == 2
+    assert report["failed"] == 0
+    assert client.read_item(counter_id(FY), COUNTER_CATEGORY).get("free", []) == []
@@ -0,0 +1,48 @@
+import threading
+import time
+
+from page_parts import load_data, snapshot
+from page_parts.load_data import SharedDataset
+
+SOURCE = "sqlite:/tmp/test.db"
+FY = "2025年度"
+
+
+def trap(trap_id, ts):
+    return {"id": trap_id, "category": "trap", "fy": FY, "_ts": ts}
+
+
+def test_save_requested_while_saving_is_written(tmp_path, monkeypatch):
+    # 保存中に来た保存の要求は捨てずに、終わった後に最新の内容で保存する
+    monkeypatch.setattr(load_data, "SNAPSHOT_ENABLED", True)
+    monkeypatch.setattr(snapshot, "SNAPSHOT_DIR", str(tmp_path))
+    started = threading.Event()
+    release = threading.Event()
+    save_snapshot = load_data.save_snapshot
+
+    def slow_save(*args):
+        started.set()
+        release.wait(5)
+        save_snapshot(*args)
+
+    monkeypatch.setattr(load_data, "save_snapshot", slow_save)
+    dataset = SharedDataset(FY)
+    dataset.source = SOURCE
+    dataset.sync_state.load("trap", [trap("t1", 10), trap("t2", 10)], 10)
+    dataset.save_snapshot(force=True)
+    assert started.wait(5)
+
+    # 1回目の保存中に t1 を削除して t3 を追加し、もう一度保存を要求する
+    dataset.sync_state.forget([trap("t1", 10)])
+    with dataset.sync_state.lock:
+        dataset.sync_state.merge(trap("t3", 20), filtered=True)
+    dataset.save_snapshot(force=True)
+    release.set()
+
+    deadline = time.monotonic() + 5
+    while dataset.saving and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert not dataset.saving
+    items, watermark, _ = snapshot.load_snapshot(SOURCE, FY, "trap")
+    assert sorted(item["id"] for item in items) == ["t2", "t3"]
+    assert watermark == 20
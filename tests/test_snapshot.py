@@ -0,0 +1,48 @@
+import pytest
+
+from page_parts import snapshot
+
+SOURCE = "sqlite:/tmp/test.db"
+
+
+@pytest.fixture(autouse=True)
+def snapshot_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(snapshot, "SNAPSHOT_DIR", str(tmp_path))
+
+
+def test_round_trip_keeps_documents():
+    # キーの有無・数値の型・ネストした値がドキュメントごとに違っても元のまま戻る
+    items = [
+        {
+            "id": "r1",
+            "category": "result",
+            "latitude": 34,
+            "longitude": 137.25,
+            "images": [{"name": "a.jpg", "uploaded": True}],
+            "_ts": 100,
+        },
+        {
+            "id": "r2",
+            "category": "result",
+            "latitude": 34.5,
+            "reserved_by": "山田",
+            "images": [{"name": "b.jpg"}],
+            "memo": None,
+            "_ts": 120,
+        },
+        {"id": "r3", "category": "result", "tags": ["罠", 1, {"x": []}]},
+    ]
+    snapshot.save_snapshot(SOURCE, "2025年度", "result", items, 120, taken_at=5.0)
+
+    restored, watermark, taken_at = snapshot.load_snapshot(SOURCE, "2025年度", "result")
+    assert restored == items
+    assert type(restored[0]["latitude"]) is int
+    assert "reserved_by" not in restored[0]
+    assert "uploaded" not in restored[1]["images"][0]
+    assert (watermark, taken_at) == (120, 5.0)
+
+
+def test_empty_and_other_source():
+    snapshot.save_snapshot(SOURCE, None, "users", [], 0)
+    assert snapshot.load_snapshot(SOURCE, None, "users")[0] == []
+    assert snapshot.load_snapshot("sqlite:/tmp/other.db", None, "users") is None
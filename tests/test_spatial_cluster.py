@@ -0,0 +1,69 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from page_parts.result_graph import haversine
+from page_parts.spatial_cluster import cluster_labels, cluster_points, cluster_summary
+
+
+def cluster_points_reference(df, threshold=50):
+    # 従来の O(n²) 実装（グリッド版と結果を比べる）
+    clusters = []
+    used = set()
+    for idx, row in df.iterrows():
+        if idx in used:
+            continue
+        cluster = [idx]
+        lat1, lon1 = row["latitude"], row["longitude"]
+        for jdx, row2 in df.iterrows():
+            if jdx == idx or jdx in used:
+                continue
+            lat2, lon2 = row2["latitude"], row2["longitude"]
+            if haversine(lat1, lon1, lat2, lon2) <= threshold:
+                cluster.append(jdx)
+        used.update(cluster)
+        clusters.append(cluster)
+    return clusters
+
+
+def make_points(n, seed):
+    # 渥美半島付近に 20 か所の集まりを作り、インデックスは行の順と無関係にする
+    rng = np.random.default_rng(seed)
+    centers = rng.uniform([34.55, 137.0], [34.65, 137.2], size=(20, 2))
+    points = centers[rng.integers(0, 20, n)] + rng.normal(0, 0.0005, (n, 2))
+    df = pd.DataFrame(points, columns=["latitude", "longitude"])
+    df.index = rng.permutation(n) + 1000
+    return df
+
+
+@pytest.mark.parametrize(
+    "n, threshold, seed",
+    [(50, 30, 0), (300, 50, 1), (800, 200, 2), (400, 5, 3)],
+)
+def test_matches_brute_force(n, threshold, seed):
+    df = make_points(n, seed)
+    assert cluster_points(df, threshold) == cluster_points_reference(df, threshold)
+
+
+def test_missing_coordinates_are_single_clusters():
+    df = pd.DataFrame(
+        {
+            "latitude": [34.6, np.nan, 34.6, 34.6],
+            "longitude": [137.1, 137.1, np.nan, 137.1],
+        }
+    )
+    assert cluster_points(df, 50) == [[0, 3], [1], [2]]
+
+
+def test_empty_input():
+    df = pd.DataFrame({"latitude": [], "longitude": []})
+    assert list(cluster_labels(df["latitude"], df["longitude"])) == []
+    assert cluster_points(df) == []
+    assert cluster_summary(df).empty
+
+
+def test_summary_counts_each_cluster():
+    df = make_points(200, 4).assign(catch_date="2025-05-01")
+    summary = cluster_summary(df, 50)
+    assert summary["count"].sum() == len(df)
+    assert len(summary) == len(cluster_points(df, 50))
@@ -0,0 +1,60 @@
+from storage.sqlite_store import SQLiteStorage
+
+
+def test_two_instances_on_one_file(tmp_path):
+    # 同じファイルを開いた2つのインスタンスが交互に書いても消し合わない
+    path = str(tmp_path / "sat.db")
+    first = SQLiteStorage(path)
+    second = SQLiteStorage(path)
+    _, start = first.read_change_feed(start_time="Beginning")
+
+    first.upsert_to_container({"id": "t1", "category": "trap", "fy": "2025年度"})
+    second.upsert_to_container({"id": "t2", "category": "trap", "fy": "2025年度"})
+    first.upsert_to_container({"id": "t3", "category": "trap", "fy": "2025年度"})
+
+    for client in (first, second):
+        ids = sorted(item["id"] for item in client.query("trap"))
+        assert ids == ["t1", "t2", "t3"]
+    changes, _ = second.read_change_feed(continuation=start)
+    assert [item["id"] for item in changes] == ["t1", "t2", "t3"]
+
+
+def test_change_feed_after_delete(tmp_path):
+    # 最後に書いたドキュメントを消しても連番は再利用されない
+    client = SQLiteStorage(str(tmp_path / "sat.db"))
+    client.upsert_to_container({"id": "a", "category": "trap"})
+    client.upsert_to_container({"id": "b", "category": "trap"})
+    _, continuation = client.read_change_feed(start_time="Beginning")
+    client.delete_item_from_container("b", "trap")
+
+    client.upsert_to_container({"id": "c", "category": "trap"})
+    changes, _ = client.read_change_feed(continuation=continuation)
+    assert [item["id"] for item in changes] == ["c"]
+
+
+def test_upsert_keeps_row_and_moves_to_end(tmp_path):
+    client = SQLiteStorage(str(tmp_path / "sat.db"))
+    client.upsert_to_container({"id": "a", "category": "trap", "status": "set"})
+    client.upsert_to_container({"id": "b", "category": "trap"})
+    client.upsert_to_container({"id": "a", "category": "trap", "status": "removed"})
+
+    changes, _ = client.read_change_feed(start_time="Beginning")
+    assert [item["id"] for item in changes] == ["b", "a"]
+    assert client.query("trap", filters={"status": "removed"})[0]["id"] == "a"
+
+
+def test_write_batch_conflict_rolls_back(tmp_path):
+    client = SQLiteStorage(str(tmp_path / "sat.db"))
+    doc = client.create_item({"id": "a", "category": "aggregate", "total": 1})
+    assert client.create_item({"id": "a", "category": "aggregate"}) is None
+
+    result = client.write_batch_if_match(
+        [
+            ({"id": "a", "category": "aggregate", "total": 2}, doc["_etag"]),
+            ({"id": "b", "category": "aggregate"}, "stale"),
+        ],
+        "aggregate",
+    )
+    assert result is None
+    assert client.read_item("a", "aggregate")["total"] == 1
+    assert client.read_item("b", "aggregate") is None
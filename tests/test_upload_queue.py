@@ -0,0 +1,89 @@
+import functools
+
+import pytest
+from tenacity import wait_none
+
+from page_parts import photo_index, photo_upload, upload_queue
+from page_parts.upload_queue import Spool
+from storage.sqlite_store import SQLiteStorage
+
+
+@pytest.fixture
+def spool(tmp_path, monkeypatch):
+    monkeypatch.setattr(photo_index, "_known", {})
+    # 画像として読めない写真は元のまま送られる（プロセスプールを使わない）
+    monkeypatch.setattr(
+        photo_upload, "normalize_images", lambda datas: [ValueError()] * len(datas)
+    )
+    client = SQLiteStorage(str(tmp_path / "sat.db"))
+    return Spool(str(tmp_path / "spool"), client=client, wait=wait_none())
+
+
+def flaky_upload(calls, failures):
+    # failures: {パスに含まれる文字列: 失敗させる回数}
+    def upload(jobs):
+        results = []
+        for path, file in jobs:
+            calls.append(path)
+            key = next((k for k in failures if k in path), None)
+            if key is not None and failures[key] > 0:
+                failures[key] -= 1
+                results.append((None, "❌ アップロード失敗: 503"))
+            else:
+                data = file.getvalue()
+                results.append(({"sha256": "x", "size": len(data)}, None))
+        return results
+
+    return upload
+
+
+def submit(spool):
+    doc = {"id": "d1", "category": "daily", "fy": "2025年度"}
+    files = [("a.jpg", b"photo-0"), ("b.jpg", b"photo-1")]
+    return spool.submit(doc, files, "Apps_Images/daily_report", "daily", "日報")
+
+
+def test_retry_keeps_photos_uploaded_earlier(spool, monkeypatch):
+    calls = []
+    upload = flaky_upload(calls, {"-1.jpg": 2})
+    monkeypatch.setattr(
+        upload_queue,
+        "process_photo_batch",
+        functools.partial(photo_upload.process_photo_batch, upload=upload),
+    )
+    submission_id = submit(spool)
+    spool.process(submission_id)
+
+    assert spool.states[submission_id]["state"] == "done"
+    assert spool.states[submission_id]["attempts"] == 2
+    # 1枚目は最初の試行で送れたので送り直さない
+    assert sum(path.endswith("-0.jpg") for path in calls) == 1
+    images = spool.client.read_item("d1", "daily")["images"]
+    for image in images:
+        assert not image.get("duplicate")
+        assert image["uploaded"]
+        assert image["original_size"] == 7
+
+
+def test_failed_submission_resumes_on_retry(spool, monkeypatch):
+    calls = []
+    upload = flaky_upload(calls, {"-1.jpg": 10})
+    monkeypatch.setattr(
+        upload_queue,
+        "process_photo_batch",
+        functools.partial(photo_upload.process_photo_batch, upload=upload),
+    )
+    monkeypatch.setattr(spool, "max_attempts", 2)
+    submission_id = submit(spool)
+    spool.process(submission_id)
+    assert spool.states[submission_id]["state"] == "failed"
+    assert spool.client.read_item("d1", "daily") is None
+
+    # 再送信では失敗した写真だけを送る
+    monkeypatch.setattr(spool, "max_attempts", 20)
+    assert spool.retry(submission_id)
+    spool.process(spool.queue.get())
+    assert spool.states[submission_id]["state"] == "done"
+    assert sum(path.endswith("-0.jpg") for path in calls) == 1
+    images = spool.client.read_item("d1", "daily")["images"]
+    assert [image.get("duplicate") for image in images] == [None, None]